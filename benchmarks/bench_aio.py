@@ -0,0 +1,80 @@
+"""
+Measure the time to run many queries on one event loop, one after the other
+and concurrently.
+
+The sheet is served by the asyncio fake Visualization API server used in the
+tests, with some latency added to every response.
+
+    $ python benchmarks/bench_aio.py
+
+"""
+from __future__ import print_function
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb import aio  # noqa: E402
+from tests.fake_gviz_aio import AsyncFakeGvizServer  # noqa: E402
+
+
+LATENCY = 0.1
+
+cols = [
+    {'id': 'A', 'label': 'name', 'type': 'string'},
+    {'id': 'B', 'label': 'value', 'type': 'number'},
+]
+rows = [
+    {'c': [{'v': 'row {0}'.format(i)}, {'v': float(i)}]}
+    for i in range(1000)
+]
+
+
+def get_queries(n):
+    return [
+        'SELECT name FROM "https://docs.google.com/spreadsheets/d/1/edit" '
+        'WHERE value > {0}'.format(i)
+        for i in range(n)
+    ]
+
+
+async def run_sequentially(conn, queries):
+    for query in queries:
+        cursor = await conn.execute(query)
+        await cursor.fetchall()
+
+
+async def run_concurrently(conn, queries):
+    cursors = await asyncio.gather(*[conn.execute(query) for query in queries])
+    for cursor in cursors:
+        await cursor.fetchall()
+
+
+async def main(sizes=(10, 50)):
+    print('{0:>10}{1:>14}{2:>14}'.format(
+        'queries', 'sequential', 'concurrent'))
+    async with AsyncFakeGvizServer(cols, rows, LATENCY) as server:
+        session = server.client_session()
+        async with await aio.connect(session=session) as conn:
+            # fetch the schema
+            await run_sequentially(conn, get_queries(1))
+
+            for n in sizes:
+                timings = []
+                for run in (run_sequentially, run_concurrently):
+                    start = time.time()
+                    await run(conn, get_queries(n))
+                    timings.append(time.time() - start)
+                print('{0:>10}{1:>13.2f}s{2:>13.2f}s'.format(n, *timings))
+        await session.close()
+
+
+if __name__ == '__main__':
+    if sys.version_info >= (3, 7):
+        asyncio.run(main())
+    else:
+        asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,83 @@
+"""
+Measure the requests made when many users run the same query at once, each
+with their own connection, as when a dashboard is opened by many people.
+
+The sheet is served by the fake Visualization API server used in the tests,
+with some latency added to every response.
+
+    $ python benchmarks/bench_coalesce.py
+
+"""
+from __future__ import print_function
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb.db import connect  # noqa: E402
+from gsheetsdb.query import (  # noqa: E402
+    column_map_cache,
+    inflight_requests,
+    translation_cache,
+)
+from tests.fake_gviz import FakeGvizServer  # noqa: E402
+
+
+LATENCY = 0.2
+
+QUERY = (
+    'SELECT name, SUM(value) FROM '
+    '"https://docs.google.com/spreadsheets/d/1/edit" GROUP BY name'
+)
+
+cols = [
+    {'id': 'A', 'label': 'name', 'type': 'string'},
+    {'id': 'B', 'label': 'value', 'type': 'number'},
+]
+rows = [
+    {'c': [{'v': 'row {0}'.format(i)}, {'v': float(i)}]}
+    for i in range(10000)
+]
+
+
+def run_users(server, n):
+    """Run the query from `n` connections at the same time."""
+    def run():
+        conn = connect()
+        server.mount(conn.session)
+        conn.execute(QUERY).fetchall()
+        conn.close()
+
+    threads = [threading.Thread(target=run) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main(sizes=(1, 5, 20)):
+    print('{0:>8}{1:>12}{2:>12}{3:>12}{4:>10}'.format(
+        'users', 'requests', 'coalesced', 'bytes', 'time'))
+    for n in sizes:
+        column_map_cache.clear()
+        translation_cache.clear()
+        with FakeGvizServer(cols, rows, LATENCY) as server:
+            coalesced = inflight_requests.coalesced
+            start = time.time()
+            run_users(server, n)
+            elapsed = time.time() - start
+            print('{0:>8}{1:>12}{2:>12}{3:>10.1f}MB{4:>9.2f}s'.format(
+                n,
+                len(server.requests),
+                inflight_requests.coalesced - coalesced,
+                server.bytes_sent / 1024 / 1024,
+                elapsed,
+            ))
+
+
+if __name__ == '__main__':
+    main()
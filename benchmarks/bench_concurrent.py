@@ -0,0 +1,74 @@
+"""
+Measure the wall-clock time to run many independent queries, one after the
+other and with `Connection.execute_many_concurrently`.
+
+The sheet is served by the fake Visualization API server used in the tests,
+with some latency added to every response.
+
+    $ python benchmarks/bench_concurrent.py
+
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb.db import connect  # noqa: E402
+from tests.fake_gviz import FakeGvizServer  # noqa: E402
+
+
+LATENCY = 0.1
+
+cols = [
+    {'id': 'A', 'label': 'name', 'type': 'string'},
+    {'id': 'B', 'label': 'value', 'type': 'number'},
+]
+rows = [
+    {'c': [{'v': 'row {0}'.format(i)}, {'v': float(i)}]}
+    for i in range(1000)
+]
+
+
+def get_queries(n):
+    return [
+        'SELECT name FROM "https://docs.google.com/spreadsheets/d/1/edit" '
+        'WHERE value > {0}'.format(i)
+        for i in range(n)
+    ]
+
+
+def run_serially(conn, queries):
+    for query in queries:
+        conn.execute(query).fetchall()
+
+
+def run_concurrently(conn, queries):
+    for cursor in conn.execute_many_concurrently(queries):
+        cursor.fetchall()
+
+
+def main(sizes=(10, 30)):
+    print('{0:>10}{1:>12}{2:>14}{3:>10}'.format(
+        'queries', 'serial', 'concurrent', 'speedup'))
+    with FakeGvizServer(cols, rows, LATENCY) as server:
+        conn = connect()
+        server.mount(conn.session)
+        run_serially(conn, get_queries(1))  # fetch the schema
+
+        for n in sizes:
+            timings = []
+            for run in (run_serially, run_concurrently):
+                start = time.time()
+                run(conn, get_queries(n))
+                timings.append(time.time() - start)
+            print('{0:>10}{1:>11.2f}s{2:>13.2f}s{3:>9.1f}x'.format(
+                n, timings[0], timings[1], timings[0] / timings[1]))
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
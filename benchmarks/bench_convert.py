@@ -0,0 +1,95 @@
+"""
+Time converting rows of a wide, mostly numeric sheet.
+
+Compares the conversion plan in `gsheetsdb.convert` with the previous
+implementation, which built a new row class for every query and looked up
+a converter for every cell.
+
+    $ python benchmarks/bench_convert.py
+
+"""
+from __future__ import print_function
+
+from collections import namedtuple
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb.convert import (  # noqa: E402
+    convert_rows,
+    parse_date,
+    parse_datetime,
+    parse_timeofday,
+)
+
+
+old_converters = {
+    'string': lambda v: v,
+    'number': lambda v: v,
+    'boolean': lambda v: v,
+    'date': parse_date,
+    'datetime': parse_datetime,
+    'timeofday': parse_timeofday,
+}
+
+
+def old_convert_rows(cols, rows):
+    Row = namedtuple(
+        'Row',
+        [col['label'].replace(' ', '_') for col in cols],
+        rename=True)
+
+    results = []
+    for row in rows:
+        values = []
+        for i, col in enumerate(row['c']):
+            if i < len(cols):
+                converter = old_converters[cols[i]['type']]
+                values.append(converter(col['v']) if col else None)
+        results.append(Row(*values))
+
+    return results
+
+
+def make_payload(n_rows, n_cols):
+    cols = [{'id': 'A', 'label': 'name', 'type': 'string'}] + [
+        {'id': str(i), 'label': 'metric {0}'.format(i), 'type': 'number'}
+        for i in range(n_cols - 1)
+    ]
+    rows = [
+        {'c': [{'v': 'row {0}'.format(j)}] + [
+            {'v': float(i * j)} for i in range(n_cols - 1)]}
+        for j in range(n_rows)
+    ]
+    return cols, rows
+
+
+def best_of(f, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        f()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main(n_rows=10000, n_cols=50):
+    cols, rows = make_payload(n_rows, n_cols)
+    print('{0} rows x {1} columns'.format(n_rows, n_cols))
+
+    baseline = best_of(lambda: old_convert_rows(cols, rows))
+    print('{0:<24}{1:>8.3f}s'.format('previous', baseline))
+    for name, f in [
+        ('namedtuples', lambda: convert_rows(cols, rows)),
+        ('tuples', lambda: convert_rows(cols, rows, as_tuples=True)),
+    ]:
+        timing = best_of(f)
+        print('{0:<24}{1:>8.3f}s{2:>8.1f}x'.format(
+            name, timing, baseline / timing))
+
+
+if __name__ == '__main__':
+    main()
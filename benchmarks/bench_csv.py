@@ -0,0 +1,75 @@
+"""
+Compare reading a whole sheet as JSON and as CSV: bytes transferred, and the
+time to fetch and decode the rows.
+
+The sheet is served by the fake Visualization API server used in the tests,
+which answers in CSV when requested with `tqx=out:csv`.
+
+    $ python benchmarks/bench_csv.py
+
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb.query import (  # noqa: E402
+    column_map_cache,
+    FULL_SHEET_QUERY,
+    run_query,
+)
+from tests.fake_gviz import FakeGvizServer  # noqa: E402
+
+
+cols = [{'id': 'A', 'label': 'name', 'type': 'string'}] + [
+    {'id': str(i), 'label': 'metric{0}'.format(i), 'type': 'number'}
+    for i in range(9)
+]
+
+
+def make_rows(n):
+    return [
+        {'c': [{'v': 'row {0}'.format(j)}] + [
+            {'v': float(i * j)} for i in range(9)
+        ]}
+        for j in range(n)
+    ]
+
+
+def fetch(server, csv, repeat=3):
+    """Return the bytes sent and the best time to fetch the rows."""
+    column_map_cache.clear()
+    timings = []
+    for _ in range(repeat):
+        start = server.bytes_sent
+        begin = time.time()
+        payload = run_query(
+            server.url,
+            FULL_SHEET_QUERY,
+            compact=True,
+            cols=cols if csv else None,
+        )
+        timings.append(time.time() - begin)
+        size = server.bytes_sent - start
+        assert len(payload['table']['rows']) == len(server.rows)
+    return size, min(timings)
+
+
+def main(sizes=(10000, 100000)):
+    print('{0:>10}{1:>8}{2:>12}{3:>10}{4:>12}'.format(
+        'rows', 'format', 'bytes', 'time', 'rows/s'))
+    for n in sizes:
+        with FakeGvizServer(cols, make_rows(n)) as server:
+            for csv in (False, True):
+                size, elapsed = fetch(server, csv)
+                print('{0:>10}{1:>8}{2:>10.1f}MB{3:>9.2f}s{4:>12.0f}'.format(
+                    n, 'csv' if csv else 'json', size / 1024 / 1024,
+                    elapsed, n / elapsed))
+
+
+if __name__ == '__main__':
+    main()
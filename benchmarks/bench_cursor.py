@@ -0,0 +1,66 @@
+"""
+Time draining large results from a cursor with each fetch method.
+
+    $ python benchmarks/bench_cursor.py
+
+"""
+from __future__ import print_function
+
+from collections import namedtuple
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb.db import Cursor  # noqa: E402
+
+
+Row = namedtuple('Row', 'country cnt')
+
+
+def drain_fetchone(cursor):
+    while cursor.fetchone() is not None:
+        pass
+
+
+def drain_fetchmany(cursor):
+    while cursor.fetchmany(100):
+        pass
+
+
+def drain_fetchall(cursor):
+    cursor.fetchall()
+
+
+def drain_iter(cursor):
+    for row in cursor:
+        pass
+
+
+methods = [
+    ('fetchone', drain_fetchone),
+    ('fetchmany(100)', drain_fetchmany),
+    ('fetchall', drain_fetchall),
+    ('iter', drain_iter),
+]
+
+
+def main(sizes=(10000, 100000, 1000000)):
+    print('{0:<16}'.format('method') + ''.join(
+        '{0:>14}'.format('{0} rows'.format(n)) for n in sizes))
+    for name, drain in methods:
+        timings = []
+        for n in sizes:
+            cursor = Cursor()
+            cursor._set_results([Row('BR', float(i)) for i in range(n)])
+            start = time.time()
+            drain(cursor)
+            timings.append(time.time() - start)
+        print('{0:<16}'.format(name) + ''.join(
+            '{0:>13.3f}s'.format(timing) for timing in timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Measure the throughput of decoding and converting a payload.
+
+    $ python benchmarks/bench_decode.py
+
+"""
+from __future__ import print_function
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb import payload as payload_module  # noqa: E402
+from gsheetsdb.convert import convert_rows  # noqa: E402
+from gsheetsdb.payload import decode_payload, LEADING  # noqa: E402
+
+
+def make_content(n_rows, n_cols):
+    cols = [{'id': 'A', 'label': 'name', 'type': 'string'}] + [
+        {'id': str(i), 'label': 'metric{0}'.format(i), 'type': 'number'}
+        for i in range(n_cols - 1)
+    ]
+    rows = [
+        {'c': [{'v': 'row {0}'.format(j), 'f': 'row {0}'.format(j)}] + [
+            {'v': float(i * j), 'f': '{0:,}'.format(i * j)}
+            for i in range(n_cols - 1)
+        ]}
+        for j in range(n_rows)
+    ]
+    payload = {'status': 'ok', 'table': {'cols': cols, 'rows': rows}}
+    return cols, (LEADING + json.dumps(payload)).encode('utf-8')
+
+
+def previous(content):
+    text = content.decode('utf-8')
+    return json.loads(text[len(LEADING):])
+
+
+def using(backend, compact=False):
+    """Decode with only the given backend available."""
+    def decode(content):
+        orjson, ujson = payload_module.orjson, payload_module.ujson
+        payload_module.orjson = backend if backend is orjson else None
+        payload_module.ujson = backend if backend is ujson else None
+        try:
+            return decode_payload(content, compact)
+        finally:
+            payload_module.orjson, payload_module.ujson = orjson, ujson
+    return decode
+
+
+def best_of(f, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        f()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main(n_rows=100000, n_cols=10):
+    cols, content = make_content(n_rows, n_cols)
+    size = len(content) / 1024 / 1024
+    print('{0} rows x {1} columns, {2:.1f}MB'.format(n_rows, n_cols, size))
+
+    decoders = [('previous', previous), ('json', using(None))]
+    for name in ['orjson', 'ujson']:
+        backend = getattr(payload_module, name)
+        if backend is not None:
+            decoders.append((name, using(backend)))
+    decoders.append(('json, compact', using(None, compact=True)))
+
+    print('{0:<16}{1:>12}{2:>20}'.format(
+        'decoder', 'decode', 'decode + convert'))
+    for name, decode in decoders:
+        decode_time = best_of(lambda: decode(content))
+        total_time = best_of(
+            lambda: convert_rows(cols, decode(content)['table']['rows']))
+        print('{0:<16}{1:>9.1f}MB/s{2:>15.1f}MB/s'.format(
+            name, size / decode_time, size / total_time))
+
+
+if __name__ == '__main__':
+    main()
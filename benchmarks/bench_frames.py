@@ -0,0 +1,82 @@
+"""
+Time building a pandas DataFrame and an Arrow table from a payload.
+
+Compares building them from the rows returned by `fetchall` with building
+them column-wise, as `fetch_dataframe` and `fetch_arrow` do with
+`result_format='columnar'`.
+
+    $ python benchmarks/bench_frames.py
+
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+import pandas as pd
+import pyarrow as pa
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb.columnar import (  # noqa: E402
+    convert_columns,
+    to_arrow,
+    to_dataframe,
+)
+from gsheetsdb.convert import convert_rows  # noqa: E402
+from gsheetsdb.query import get_description_from_payload  # noqa: E402
+
+
+def make_payload(n_rows):
+    cols = [
+        {'id': 'A', 'label': 'country', 'type': 'string'},
+        {'id': 'B', 'label': 'day', 'type': 'date'},
+        {'id': 'C', 'label': 'active', 'type': 'boolean'},
+    ] + [
+        {'id': str(i), 'label': 'metric{0}'.format(i), 'type': 'number'}
+        for i in range(7)
+    ]
+    rows = [
+        {'c': [
+            {'v': 'BR' if j % 2 else 'IN'},
+            {'v': 'Date(2018,0,{0})'.format(j % 28 + 1)},
+            {'v': bool(j % 2)},
+        ] + [{'v': float(i * j)} for i in range(7)]}
+        for j in range(n_rows)
+    ]
+    return {'table': {'cols': cols, 'rows': rows}}
+
+
+def best_of(f, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        f()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main(n_rows=100000):
+    payload = make_payload(n_rows)
+    cols = payload['table']['cols']
+    rows = payload['table']['rows']
+    description = get_description_from_payload(payload)
+    print('{0} rows x {1} columns'.format(n_rows, len(cols)))
+
+    for name, f in [
+        ('DataFrame(fetchall())',
+         lambda: pd.DataFrame(convert_rows(cols, rows))),
+        ('fetch_dataframe()',
+         lambda: to_dataframe(convert_columns(cols, rows))),
+        ('Table.from_pandas(...)',
+         lambda: pa.Table.from_pandas(pd.DataFrame(convert_rows(cols, rows)))),
+        ('fetch_arrow()',
+         lambda: to_arrow(description, convert_columns(cols, rows))),
+    ]:
+        print('{0:<26}{1:>8.3f}s'.format(name, best_of(f)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Measure the data downloaded for grouped queries that run in SQLite, with and
+without running their grouping and aggregations in the API.
+
+The sheet is served by the fake Visualization API server used in the tests,
+which runs the column lists, filters and aggregations of the queries it
+receives. The fake server aggregates rows in Python, so the times are
+dominated by the server; the API does that work on its side.
+
+    $ python benchmarks/bench_hybrid.py
+
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb.db import connect  # noqa: E402
+from gsheetsdb.query import column_map_cache, translation_cache  # noqa: E402
+from gsheetsdb.routing import remote_failures  # noqa: E402
+from tests.fake_gviz import FakeGvizServer  # noqa: E402
+
+
+URL = 'https://docs.google.com/spreadsheets/d/1/edit'
+
+COLUMNS = 10
+ROWS = 50000
+
+# HAVING, DISTINCT and CASE are not supported by the API
+QUERIES = [
+    'SELECT c0, SUM(c1) FROM "{0}" GROUP BY c0 HAVING COUNT(*) > 1',
+    'SELECT c0 FROM "{0}" WHERE c3 > 100 GROUP BY c0 '
+    'HAVING AVG(c5) > 10 ORDER BY MAX(c1) DESC LIMIT 10',
+    'SELECT DISTINCT COUNT(*) FROM "{0}" GROUP BY c0',
+    'SELECT c0, CASE WHEN SUM(c1) > 1000 THEN 1 ELSE 0 END AS big '
+    'FROM "{0}" GROUP BY c0',
+]
+
+cols = [
+    {
+        'id': 'C{0}'.format(i),
+        'label': 'c{0}'.format(i),
+        'type': 'string' if i % 2 == 0 else 'number',
+    }
+    for i in range(COLUMNS)
+]
+rows = [
+    {
+        'c': [
+            {'v': 'group {0}'.format(j % 50)} if i % 2 == 0
+            else {'v': float((i * j) % ROWS)}
+            for i in range(COLUMNS)
+        ],
+    }
+    for j in range(ROWS)
+]
+
+
+def run_queries(server):
+    conn = connect()
+    server.mount(conn.session)
+
+    # a query running in the API fetches the schema, so that the sheet can
+    # be requested as CSV in both cases
+    conn.execute('SELECT c0 FROM "{0}" LIMIT 1'.format(URL)).fetchall()
+    server.requests = []
+    server.bytes_sent = 0
+
+    for query in QUERIES:
+        conn.execute(query.format(URL)).fetchall()
+    conn.close()
+
+
+def main():
+    print('{0:>10}{1:>10}{2:>12}{3:>10}'.format(
+        'hybrid', 'requests', 'MB', 'time'))
+    for hybrid in (False, True):
+        column_map_cache.clear()
+        translation_cache.clear()
+        remote_failures.clear()
+        with FakeGvizServer(cols, rows, run_queries=True) as server:
+            start = time.time()
+            if hybrid:
+                run_queries(server)
+            else:
+                with patch(
+                    'gsheetsdb.sqlite.execute_hybrid',
+                    return_value=None,
+                ):
+                    run_queries(server)
+            elapsed = time.time() - start
+            print('{0:>10}{1:>10}{2:>12.2f}{3:>9.2f}s'.format(
+                'on' if hybrid else 'off',
+                len(server.requests),
+                server.bytes_sent / 1e6,
+                elapsed,
+            ))
+
+
+if __name__ == '__main__':
+    main()
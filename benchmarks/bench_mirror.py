@@ -0,0 +1,77 @@
+"""
+Measure queries run in SQLite with and without keeping the loaded sheets in
+a mirror, for a dashboard running many queries the API can't run.
+
+The sheet is served by the fake Visualization API server used in the tests,
+with some latency added to every response.
+
+    $ python benchmarks/bench_mirror.py
+
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb.db import connect  # noqa: E402
+from gsheetsdb.query import column_map_cache, translation_cache  # noqa: E402
+from gsheetsdb.routing import remote_failures  # noqa: E402
+from tests.fake_gviz import FakeGvizServer  # noqa: E402
+
+
+LATENCY = 0.1
+
+QUERY = (
+    'SELECT name, SUM(value) FROM '
+    '"https://docs.google.com/spreadsheets/d/1/edit" '
+    'GROUP BY name HAVING SUM(value) > {0}'
+)
+
+cols = [
+    {'id': 'A', 'label': 'name', 'type': 'string'},
+    {'id': 'B', 'label': 'value', 'type': 'number'},
+]
+rows = [
+    {'c': [{'v': 'name {0}'.format(i % 100)}, {'v': float(i)}]}
+    for i in range(50000)
+]
+
+
+def main(n=20):
+    print('{0:>10}{1:>10}{2:>12}{3:>10}{4:>10}{5:>10}'.format(
+        'mirror', 'queries', 'requests', 'load', 'query', 'total'))
+    for mirror_size in (None, 100 * 1024 * 1024):
+        column_map_cache.clear()
+        translation_cache.clear()
+        remote_failures.clear()
+        with FakeGvizServer(cols, rows, LATENCY) as server:
+            conn = connect(mirror_size=mirror_size)
+            server.mount(conn.session)
+            start = time.time()
+            for i in range(n):
+                conn.execute(QUERY.format(i * 1000)).fetchall()
+            elapsed = time.time() - start
+
+            mirror = conn.mirror
+            if mirror is None:
+                load = query = '-'
+            else:
+                load = '{0:.2f}s'.format(mirror.load_time)
+                query = '{0:.2f}s'.format(mirror.query_time)
+            print('{0:>10}{1:>10}{2:>12}{3:>10}{4:>10}{5:>9.2f}s'.format(
+                'on' if mirror_size else 'off',
+                n,
+                len(server.requests),
+                load,
+                query,
+                elapsed,
+            ))
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Measure the bytes transferred for a query, and the time to decode them, with
+and without formatted values in the payload.
+
+The sheet is served by the fake Visualization API server used in the tests,
+which leaves out formatted values when the query has `OPTIONS no_format`.
+
+    $ python benchmarks/bench_no_format.py
+
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb.convert import convert_rows  # noqa: E402
+from gsheetsdb.db import connect  # noqa: E402
+from gsheetsdb.payload import decode_payload  # noqa: E402
+from gsheetsdb.query import column_map_cache, translation_cache  # noqa: E402
+from gsheetsdb.translator import NO_FORMAT  # noqa: E402
+from tests.fake_gviz import FakeGvizServer  # noqa: E402
+
+
+QUERY = 'SELECT * FROM "https://docs.google.com/spreadsheets/d/1/edit#gid=0"'
+
+cols = [{'id': 'A', 'label': 'name', 'type': 'string'}] + [
+    {'id': str(i), 'label': 'metric{0}'.format(i), 'type': 'number'}
+    for i in range(9)
+]
+
+
+def make_rows(n):
+    return [
+        {'c': [{'v': 'row {0}'.format(j), 'f': 'row {0}'.format(j)}] + [
+            {'v': float(i * j), 'f': '{0:,.2f}'.format(i * j)}
+            for i in range(9)
+        ]}
+        for j in range(n)
+    ]
+
+
+def get_bytes_sent(server, formatted_values):
+    """Return the bytes sent by the server to run the query."""
+    column_map_cache.clear()
+    translation_cache.clear()
+    conn = connect(formatted_values=formatted_values)
+    server.mount(conn.session)
+    start = server.bytes_sent
+    conn.execute(QUERY).fetchall()
+    conn.close()
+    return server.bytes_sent - start
+
+
+def get_decode_time(server, formatted_values, repeat=5):
+    """Return the best time to decode and convert the response."""
+    tq = 'SELECT *' if formatted_values else 'SELECT * ' + NO_FORMAT
+    content = server.respond({'tq': tq}).encode('utf-8')
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        payload = decode_payload(content, compact=True)
+        convert_rows(cols, payload['table']['rows'])
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main(sizes=(10000, 100000)):
+    print('{0:>10}{1:>12}{2:>12}{3:>10}'.format(
+        'rows', 'formatted', 'bytes', 'decode'))
+    for n in sizes:
+        with FakeGvizServer(cols, make_rows(n)) as server:
+            for formatted_values in (True, False):
+                size = get_bytes_sent(server, formatted_values)
+                elapsed = get_decode_time(server, formatted_values)
+                print('{0:>10}{1:>12}{2:>10.1f}MB{3:>9.2f}s'.format(
+                    n, str(formatted_values), size / 1024 / 1024, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Count how many times each query is parsed, and time `Cursor.execute`.
+
+    $ python benchmarks/bench_parse.py
+
+Requests to the API are mocked, so this measures only the local overhead.
+
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+from moz_sql_parser import parse
+import requests_mock
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb import connect  # noqa: E402
+from gsheetsdb import parsing  # noqa: E402
+from gsheetsdb.query import column_map_cache  # noqa: E402
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+
+URL = 'http://docs.google.com/gviz/tq?gid=0'
+
+cols = [
+    {'id': 'A', 'label': 'country', 'type': 'string'},
+    {'id': 'B', 'label': 'cnt', 'type': 'number'},
+]
+payload = {
+    'status': 'ok',
+    'table': {
+        'cols': cols,
+        'rows': [{'c': [{'v': 'BR'}, {'v': 1.0}]}] * 100,
+    },
+}
+
+queries = [
+    (
+        'gviz',
+        'SELECT country, SUM(cnt) FROM "http://docs.google.com/" '
+        'WHERE cnt > 0 GROUP BY country ORDER BY country',
+    ),
+    (
+        'sqlite',
+        'SELECT country, SUM(cnt) FROM "http://docs.google.com/" '
+        'GROUP BY country HAVING SUM(cnt) > 1',
+    ),
+]
+
+
+def main(n=200):
+    print('{0:<8} {1:>14} {2:>14}'.format(
+        'engine', 'parses/query', 'ms/query'))
+    with requests_mock.Mocker() as m:
+        m.get(requests_mock.ANY, json=payload)
+        for engine, query in queries:
+            column_map_cache.clear()
+            conn = connect()
+            with patch.object(parsing, 'parse_sql', wraps=parse) as parse_sql:
+                start = time.time()
+                for _ in range(n):
+                    conn.execute(query)
+                elapsed = time.time() - start
+            print('{0:<8} {1:>14.2f} {2:>14.3f}'.format(
+                engine, parse_sql.call_count / n, 1000 * elapsed / n))
+
+
+if __name__ == '__main__':
+    main()
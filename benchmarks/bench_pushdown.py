@@ -0,0 +1,107 @@
+"""
+Measure the data downloaded for queries that run in SQLite, with and without
+pushing their columns and filters into the fetch, on a wide sheet.
+
+The sheet is served by the fake Visualization API server used in the tests,
+which runs the column lists and filters of the queries it receives.
+
+    $ python benchmarks/bench_pushdown.py
+
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb.db import connect  # noqa: E402
+from gsheetsdb.query import column_map_cache, translation_cache  # noqa: E402
+from gsheetsdb.routing import remote_failures  # noqa: E402
+from tests.fake_gviz import FakeGvizServer  # noqa: E402
+
+
+URL = 'https://docs.google.com/spreadsheets/d/1/edit'
+
+COLUMNS = 60
+ROWS = 5000
+
+# HAVING and DISTINCT are not supported by the API
+QUERIES = [
+    'SELECT c0, SUM(c1) FROM "{0}" WHERE c2 > 4000 '
+    'GROUP BY c0 HAVING COUNT(*) > 1',
+    'SELECT DISTINCT c0 FROM "{0}" WHERE c1 < 100',
+    'SELECT c0, MAX(c1) FROM (SELECT c0, c1 FROM "{0}" WHERE c3 > 4500) '
+    'GROUP BY c0',
+]
+
+cols = [
+    {
+        'id': 'C{0}'.format(i),
+        'label': 'c{0}'.format(i),
+        'type': 'string' if i % 2 == 0 else 'number',
+    }
+    for i in range(COLUMNS)
+]
+rows = [
+    {
+        'c': [
+            {'v': 'group {0}'.format(j % 50)} if i % 2 == 0
+            else {'v': float((i * j) % ROWS)}
+            for i in range(COLUMNS)
+        ],
+    }
+    for j in range(ROWS)
+]
+
+
+def run_queries(server):
+    conn = connect()
+    server.mount(conn.session)
+
+    # a query running in the API fetches the schema, so that the sheet can
+    # be requested as CSV in both cases
+    conn.execute('SELECT c0 FROM "{0}" LIMIT 1'.format(URL)).fetchall()
+    server.requests = []
+    server.bytes_sent = 0
+
+    for query in QUERIES:
+        conn.execute(query.format(URL)).fetchall()
+    conn.close()
+
+
+def main():
+    print('{0:>10}{1:>10}{2:>12}{3:>10}'.format(
+        'pushdown', 'requests', 'MB', 'time'))
+    for pushdown in (False, True):
+        column_map_cache.clear()
+        translation_cache.clear()
+        remote_failures.clear()
+        with FakeGvizServer(cols, rows, run_queries=True) as server:
+            start = time.time()
+            if pushdown:
+                run_queries(server)
+            else:
+                with patch(
+                    'gsheetsdb.sqlite.fetch_pushed_down',
+                    return_value=None,
+                ):
+                    run_queries(server)
+            elapsed = time.time() - start
+            print('{0:>10}{1:>10}{2:>12.2f}{3:>9.2f}s'.format(
+                'on' if pushdown else 'off',
+                len(server.requests),
+                server.bytes_sent / 1e6,
+                elapsed,
+            ))
+
+
+if __name__ == '__main__':
+    main()
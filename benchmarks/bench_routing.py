@@ -0,0 +1,113 @@
+"""
+Measure the requests saved by routing queries to SQLite before trying them
+in the API, for a dashboard mixing queries the API can and can't run.
+
+The sheet is served by the fake Visualization API server used in the tests,
+which here rejects `DISTINCT`, `CASE` and `LENGTH` like the real API, with
+some latency added to every response.
+
+    $ python benchmarks/bench_routing.py
+
+"""
+from __future__ import print_function
+
+import json
+import os
+import sys
+import time
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb.db import connect  # noqa: E402
+from gsheetsdb.query import column_map_cache, translation_cache  # noqa: E402
+from gsheetsdb.routing import GVIZ, remote_failures  # noqa: E402
+from tests.fake_gviz import FakeGvizServer, LEADING  # noqa: E402
+
+
+LATENCY = 0.1
+
+URL = 'https://docs.google.com/spreadsheets/d/1/edit'
+
+QUERIES = [
+    'SELECT name, value FROM "{0}" WHERE value > {1}',
+    'SELECT DISTINCT name FROM "{0}" WHERE value > {1}',
+    'SELECT LENGTH(name) FROM "{0}" WHERE value > {1}',
+    'SELECT CASE WHEN value > {1} THEN 1 ELSE 0 END FROM "{0}"',
+]
+
+cols = [
+    {'id': 'A', 'label': 'name', 'type': 'string'},
+    {'id': 'B', 'label': 'value', 'type': 'number'},
+]
+rows = [
+    {'c': [{'v': 'row {0}'.format(i)}, {'v': float(i)}]}
+    for i in range(1000)
+]
+
+
+class StrictGvizServer(FakeGvizServer):
+
+    """A fake server that rejects what the real API doesn't support."""
+
+    def iter_response(self, args):
+        tq = args.get('tq', '')
+        if any(word in tq for word in ('DISTINCT', 'CASE', 'LENGTH')):
+            yield LEADING + json.dumps({
+                'version': '0.6',
+                'reqId': '0',
+                'status': 'error',
+                'errors': [{
+                    'reason': 'invalid_query',
+                    'message': 'INVALID_QUERY',
+                    'detailed_message': 'Invalid query: {0}'.format(tq),
+                }],
+            })
+            return
+        for chunk in super(StrictGvizServer, self).iter_response(args):
+            yield chunk
+
+
+def run_dashboard(server, n):
+    """Run `n` variations of each query, one at a time."""
+    conn = connect()
+    server.mount(conn.session)
+    for i in range(n):
+        for query in QUERIES:
+            conn.execute(query.format(URL, i)).fetchall()
+    conn.close()
+
+
+def main(n=10):
+    print('{0:>10}{1:>10}{2:>12}{3:>10}'.format(
+        'routing', 'queries', 'requests', 'time'))
+    for routing in (False, True):
+        column_map_cache.clear()
+        translation_cache.clear()
+        remote_failures.clear()
+        with StrictGvizServer(cols, rows, LATENCY) as server:
+            start = time.time()
+            if routing:
+                run_dashboard(server, n)
+            else:
+                with patch(
+                    'gsheetsdb.db.choose_engine',
+                    return_value=(GVIZ, None),
+                ):
+                    run_dashboard(server, n)
+            elapsed = time.time() - start
+            print('{0:>10}{1:>10}{2:>12}{3:>9.2f}s'.format(
+                'on' if routing else 'off',
+                n * len(QUERIES),
+                len(server.requests),
+                elapsed,
+            ))
+
+
+if __name__ == '__main__':
+    main()
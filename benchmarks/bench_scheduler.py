@@ -0,0 +1,93 @@
+"""
+Measure how a burst of queries fares against an API with a quota, with and
+without the request scheduler.
+
+The sheet is served by the fake Visualization API server used in the tests,
+which answers with a 429 when there are too many requests per second. The
+queries run with `Connection.execute_many_concurrently`.
+
+    $ python benchmarks/bench_scheduler.py
+
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb.db import connect  # noqa: E402
+from gsheetsdb.scheduler import INTERACTIVE, scheduler  # noqa: E402
+from tests.fake_gviz import FakeGvizServer  # noqa: E402
+
+
+QUOTA = 20
+QUERIES = 100
+
+cols = [
+    {'id': 'A', 'label': 'name', 'type': 'string'},
+    {'id': 'B', 'label': 'value', 'type': 'number'},
+]
+rows = [
+    {'c': [{'v': 'row {0}'.format(i)}, {'v': float(i)}]}
+    for i in range(100)
+]
+
+queries = [
+    'SELECT name FROM "https://docs.google.com/spreadsheets/d/1/edit" '
+    'WHERE value > {0}'.format(i)
+    for i in range(QUERIES)
+]
+
+scenarios = [
+    ('no retries', None, 0),
+    ('backoff', None, 5),
+    ('rate limit', QUOTA * 0.9, 5),
+]
+
+
+def run(rate, max_retries):
+    scheduler.configure(rate, burst=1)
+    scheduler.max_retries = max_retries
+    scheduler.retries = 0
+    with FakeGvizServer(cols, rows, latency=0.05, quota=QUOTA) as server:
+        conn = connect(pool_maxsize=20)
+        server.mount(conn.session)
+        conn.execute(queries[0])  # fetch the schema
+        time.sleep(1)  # let the quota reset
+
+        wait = scheduler.queue_stats[INTERACTIVE].total
+        start = time.time()
+        results = conn.execute_many_concurrently(queries)
+        elapsed = time.time() - start
+        wait = scheduler.queue_stats[INTERACTIVE].total - wait
+        conn.close()
+
+    succeeded = sum(1 for result in results if not isinstance(
+        result, Exception))
+    return succeeded, server.throttled, scheduler.retries, elapsed, wait
+
+
+def warm_up():
+    """Plan the queries, so that only the requests are measured."""
+    with FakeGvizServer(cols, rows) as server:
+        conn = connect()
+        server.mount(conn.session)
+        conn.execute_many_concurrently(queries, max_workers=1)
+        conn.close()
+
+
+def main():
+    warm_up()
+    print('{0:>12}{1:>8}{2:>8}{3:>10}{4:>10}{5:>12}'.format(
+        'scenario', 'ok', '429s', 'retries', 'time', 'queue wait'))
+    for name, rate, max_retries in scenarios:
+        succeeded, throttled, retries, elapsed, wait = run(rate, max_retries)
+        print('{0:>12}{1:>8}{2:>8}{3:>10}{4:>9.2f}s{5:>11.2f}s'.format(
+            name, succeeded, throttled, retries, elapsed, wait))
+
+
+if __name__ == '__main__':
+    main()
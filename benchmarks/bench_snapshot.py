@@ -0,0 +1,96 @@
+"""
+Measure the requests made by several worker processes running queries on
+the same sheet, as gunicorn workers do, with and without a snapshot store
+shared on disk, and after a restart with warm snapshots.
+
+The sheet is served by the fake Visualization API server used in the tests,
+running in the parent process, with some latency added to every response.
+
+    $ python benchmarks/bench_snapshot.py
+
+"""
+from __future__ import print_function
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb.db import connect  # noqa: E402
+from tests.fake_gviz import FakeGvizServer  # noqa: E402
+
+
+LATENCY = 0.2
+WORKERS = 4
+
+QUERY = (
+    'SELECT name, SUM(value) FROM '
+    '"https://docs.google.com/spreadsheets/d/1/edit" '
+    'GROUP BY name HAVING SUM(value) > 0'
+)
+
+cols = [
+    {'id': 'A', 'label': 'name', 'type': 'string'},
+    {'id': 'B', 'label': 'value', 'type': 'number'},
+]
+rows = [
+    {'c': [{'v': 'name {0}'.format(i % 100)}, {'v': float(i)}]}
+    for i in range(100000)
+]
+
+
+def run_worker(server, snapshot_dir):
+    conn = connect(snapshot_dir=snapshot_dir)
+    server.mount(conn.session)
+    conn.execute(QUERY).fetchall()
+
+
+def run_workers(server, snapshot_dir):
+    # forked workers start with empty caches, and send their requests to
+    # the server in this process
+    context = multiprocessing.get_context('fork')
+    processes = [
+        context.Process(target=run_worker, args=(server, snapshot_dir))
+        for _ in range(WORKERS)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def main():
+    path = tempfile.mkdtemp()
+    scenarios = [
+        ('no snapshots', None),
+        ('cold snapshots', path),
+        ('warm snapshots', path),
+    ]
+    print('{0:>16}{1:>10}{2:>12}{3:>12}{4:>10}'.format(
+        'scenario', 'workers', 'requests', 'bytes', 'time'))
+    try:
+        with FakeGvizServer(cols, rows, LATENCY) as server:
+            for name, snapshot_dir in scenarios:
+                count = len(server.requests)
+                sent = server.bytes_sent
+                start = time.time()
+                run_workers(server, snapshot_dir)
+                elapsed = time.time() - start
+                print('{0:>16}{1:>10}{2:>12}{3:>10.1f}MB{4:>9.2f}s'.format(
+                    name,
+                    WORKERS,
+                    len(server.requests) - count,
+                    (server.bytes_sent - sent) / 1024 / 1024,
+                    elapsed,
+                ))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Measure the peak memory of reading a large sheet, with and without streaming.
+
+The sheet is served by the fake Visualization API server used in the tests,
+which generates the rows as it writes the response.
+
+    $ python benchmarks/bench_stream.py
+
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb.db import connect  # noqa: E402
+from gsheetsdb.query import column_map_cache, translation_cache  # noqa: E402
+from tests.fake_gviz import FakeGvizServer  # noqa: E402
+
+
+QUERY = 'SELECT * FROM "https://docs.google.com/spreadsheets/d/1/edit#gid=0"'
+
+cols = [
+    {'id': 'A', 'label': 'country', 'type': 'string'},
+    {'id': 'B', 'label': 'cnt', 'type': 'number'},
+]
+
+
+def make_rows(n):
+    def rows():
+        for i in range(n):
+            yield {'c': [{'v': 'BR'}, {'v': float(i)}]}
+    return rows
+
+
+def run(server, stream):
+    column_map_cache.clear()
+    translation_cache.clear()
+
+    conn = connect()
+    server.mount(conn.session)
+    tracemalloc.start()
+    start = time.time()
+    count = 0
+    for row in conn.execute(QUERY, stream=stream):
+        count += 1
+    elapsed = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    conn.close()
+
+    return count, elapsed, peak
+
+
+def main(sizes=(10000, 100000, 1000000)):
+    print('{0:>10}{1:>10}{2:>12}{3:>12}'.format(
+        'rows', 'stream', 'time', 'peak'))
+    for n in sizes:
+        with FakeGvizServer(cols, make_rows(n)) as server:
+            for stream in (False, True):
+                count, elapsed, peak = run(server, stream)
+                assert count == n
+                print('{0:>10}{1:>10}{2:>11.2f}s{3:>10.1f}MB'.format(
+                    n, str(stream), elapsed, peak / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Measure the memory used by results from a sheet of categorical strings,
+with and without string encoding.
+
+    $ python benchmarks/bench_strings.py
+
+"""
+from __future__ import print_function
+
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..')))
+
+from gsheetsdb.columnar import convert_columns  # noqa: E402
+from gsheetsdb.convert import convert_rows  # noqa: E402
+
+
+cols = [
+    {'id': 'A', 'label': 'country', 'type': 'string'},
+    {'id': 'B', 'label': 'status', 'type': 'string'},
+    {'id': 'C', 'label': 'team', 'type': 'string'},
+    {'id': 'D', 'label': 'cnt', 'type': 'number'},
+]
+
+
+def make_text(n_rows):
+    random.seed(0)
+    countries = ['country {0}'.format(i) for i in range(20)]
+    statuses = ['status {0}'.format(i) for i in range(5)]
+    teams = ['team {0}'.format(i) for i in range(50)]
+    rows = [
+        {'c': [
+            {'v': random.choice(countries)},
+            {'v': random.choice(statuses)},
+            {'v': random.choice(teams)},
+            {'v': float(i)},
+        ]}
+        for i in range(n_rows)
+    ]
+    return json.dumps({'table': {'cols': cols, 'rows': rows}})
+
+
+def measure(text, convert):
+    """Return the memory retained by the results after the payload is gone."""
+    gc.collect()
+    tracemalloc.start()
+    payload = json.loads(text)
+    results = convert(payload['table']['rows'])
+    del payload
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del results
+    return size
+
+
+def main(n_rows=500000):
+    text = make_text(n_rows)
+    print('{0} rows, 3 categorical string columns'.format(n_rows))
+    for name, convert in [
+        ('rows', lambda rows: convert_rows(cols, rows)),
+        ('rows, interned',
+         lambda rows: convert_rows(cols, rows, intern_strings=True)),
+        ('columns', lambda rows: convert_columns(cols, rows)),
+        ('columns, interned',
+         lambda rows: convert_columns(cols, rows, 'intern')),
+        ('columns, dictionary',
+         lambda rows: convert_columns(cols, rows, 'dictionary')),
+    ]:
+        size = measure(text, convert)
+        print('{0:<24}{1:>8.1f}MB'.format(name, size / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,773 @@
+"""
+An asyncio version of the DB API, built on `aiohttp`.
+
+    >>> conn = await connect()
+    >>> cursor = await conn.execute('SELECT * FROM "https://..."')
+    >>> rows = await cursor.fetchall()
+
+Queries are parsed, translated and post-processed by the same code as the
+blocking API; only the requests are asynchronous, so many queries can run
+concurrently on one event loop, sharing the pool of connections. The SQLite
+fallback is also shared, as steps (see `gsheetsdb.steps`), and fetches the
+sheets of a query concurrently. Results are always read in full during
+`execute`.
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import asyncio
+import itertools
+import logging
+import sys
+import time
+
+from gsheetsdb.auth import credentials_manager, get_credentials_identity
+from gsheetsdb.cache import LRUCache
+from gsheetsdb.columnar import rows_to_columns, to_arrow, to_dataframe
+from gsheetsdb.db import (
+    apply_parameters,
+    check_closed,
+    check_result,
+    RESULT_FORMATS,
+    STRING_ENCODINGS,
+)
+from gsheetsdb.exceptions import (
+    Error,
+    InterfaceError,
+    NotSupportedError,
+    ProgrammingError,
+)
+from gsheetsdb.parsing import ParsedQuery
+from gsheetsdb.query import (
+    cache_result,
+    column_map_cache,
+    copy_payload,
+    decode_result,
+    get_baseurl,
+    get_cached_result,
+    get_csv_cols,
+    get_plan,
+    get_plan_key,
+    get_query_url,
+    get_result_key,
+    get_schema_key,
+    is_csv,
+    make_column_map,
+    process_payload,
+    translation_cache,
+)
+from gsheetsdb.routing import (
+    choose_engine,
+    GVIZ,
+    record_failure,
+    SQLITE,
+)
+from gsheetsdb.scheduler import (
+    BACKGROUND,
+    INTERACTIVE,
+    RETRY_STATUSES,
+    scheduler,
+)
+from gsheetsdb.sqlite import (
+    execute_steps,
+    shared_mirror as process_mirror,
+    SQLiteMirror,
+)
+from gsheetsdb.steps import make_call
+from gsheetsdb.transport import DEFAULT_POOL_MAXSIZE
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+logger = logging.getLogger(__name__)
+
+# `get_event_loop` is deprecated in coroutines from Python 3.7
+if sys.version_info >= (3, 7):
+    get_running_loop = asyncio.get_running_loop
+else:
+    get_running_loop = asyncio.get_event_loop
+
+
+class AsyncFlight(object):
+
+    """A call in progress in an `AsyncSingleFlight`."""
+
+    def __init__(self):
+        self.future = get_running_loop().create_future()
+        self.waiters = 0
+
+
+class AsyncSingleFlight(object):
+
+    """
+    Coalesce concurrent calls with the same key, like
+    `gsheetsdb.cache.SingleFlight`, for coroutine functions.
+
+    """
+
+    def __init__(self):
+        self._flights = {}
+
+        # statistics
+        self.coalesced = 0
+
+    async def do(self, key, function, *args):
+        """
+        Await `function`, or the call in progress for `key`.
+
+        Returns the result, and whether it's shared with other callers; shared
+        results should not be modified.
+
+        """
+        # futures belong to a loop
+        key = get_running_loop(), key
+        flight = self._flights.get(key)
+        if flight is not None:
+            flight.waiters += 1
+            self.coalesced += 1
+            # a cancelled waiter doesn't cancel the call
+            return await asyncio.shield(flight.future), True
+
+        flight = self._flights[key] = AsyncFlight()
+        try:
+            result = await function(*args)
+        except asyncio.CancelledError:
+            flight.future.cancel()
+            raise
+        except Exception as e:
+            flight.future.set_exception(e)
+            if not flight.waiters:
+                flight.future.exception()  # mark it as retrieved
+            raise
+        finally:
+            del self._flights[key]
+
+        flight.future.set_result(result)
+        return result, flight.waiters > 0
+
+
+# requests in progress, shared by concurrent queries for the same results
+inflight_requests = AsyncSingleFlight()
+
+
+async def connect(
+    credentials=None,
+    pool_maxsize=DEFAULT_POOL_MAXSIZE,
+    result_cache_size=None,
+    result_cache_ttl=None,
+    as_tuples=False,
+    string_encoding=None,
+    formatted_values=False,
+    session=None,
+    mirror_size=None,
+    mirror_ttl=None,
+    shared_mirror=False,
+):
+    """
+    Constructor for creating an asynchronous connection to the database.
+
+        >>> conn = await connect()
+        >>> curs = conn.cursor()
+
+    Up to `pool_maxsize` requests run at the same time; an existing
+    `aiohttp.ClientSession` can be passed in `session` instead, in which case
+    it's not closed with the connection. The other arguments are the same as
+    in `gsheetsdb.connect`.
+
+    """
+    return AsyncConnection(
+        credentials,
+        pool_maxsize,
+        result_cache_size,
+        result_cache_ttl,
+        as_tuples,
+        string_encoding,
+        formatted_values,
+        session,
+        mirror_size,
+        mirror_ttl,
+        shared_mirror,
+    )
+
+
+async def get_schema(url, credentials=None, session=None):
+    """Return the columns of a sheet, like `gsheetsdb.query.get_schema`."""
+    key = get_schema_key(url, credentials)
+    cols = column_map_cache.get(key)
+    if cols is None:
+        query = 'SELECT * LIMIT 0'
+        result = await run_query(
+            url, query, credentials, session, priority=BACKGROUND)
+        cols = result['table']['cols']
+        column_map_cache.set(key, cols)
+
+    return cols
+
+
+async def get_column_map(url, credentials=None, session=None):
+    return make_column_map(await get_schema(url, credentials, session))
+
+
+async def get_headers(credentials=None):
+    headers = {'X-DataSource-Auth': 'true'}
+    if credentials:
+        # refreshing blocks, so it's done in a thread
+        if not credentials.valid:
+            loop = get_running_loop()
+            await loop.run_in_executor(
+                None, credentials_manager.ensure_valid, credentials)
+        else:
+            credentials_manager.ensure_valid(credentials)
+        credentials.apply(headers)
+
+    return headers
+
+
+async def run_query(
+    baseurl,
+    query,
+    credentials=None,
+    session=None,
+    result_cache=None,
+    max_age=None,
+    compact=False,
+    cols=None,
+    priority=INTERACTIVE,
+    snapshots=None,
+):
+    """
+    Run a query against the API, like `gsheetsdb.query.run_query`.
+
+    Concurrent calls for the same results share a single request, and each
+    gets its own copy of the payload (see `inflight_requests`).
+
+    Requests share the rate limit of the blocking API, and are retried the
+    same way (see `schedule_request`).
+
+    """
+    if snapshots is not None:
+        raise NotSupportedError(
+            'Snapshots are not supported by asynchronous connections')
+
+    key = get_result_key(baseurl, query, credentials, compact, cols)
+    payload, stale = get_cached_result(
+        result_cache, key, csv=cols is not None)
+    if payload is not None:
+        return payload
+
+    payload, shared = await inflight_requests.do(
+        key,
+        fetch_payload,
+        key,
+        baseurl,
+        query,
+        credentials,
+        session,
+        result_cache,
+        max_age,
+        compact,
+        cols,
+        stale,
+        priority,
+    )
+    return copy_payload(payload) if shared else payload
+
+
+async def fetch_payload(
+    key,
+    baseurl,
+    query,
+    credentials,
+    session,
+    result_cache,
+    max_age,
+    compact,
+    cols,
+    stale,
+    priority,
+):
+    """Make the request for `run_query`, and decode the response."""
+    url = get_query_url(baseurl, query, cols, stale)
+    headers = await get_headers(credentials)
+
+    async def send():
+        async with session.get(url, headers=headers) as response:
+            content = await response.read()
+            return response, content
+
+    response, content = await schedule_request(
+        get_credentials_identity(credentials), send, priority)
+
+    # raise any error messages
+    if response.status != 200:
+        raise ProgrammingError(content.decode('utf-8', 'replace'))
+
+    # errors are still sent as JSON
+    csv = cols is not None and is_csv(response)
+    result = decode_result(content, csv, compact, cols, baseurl, credentials)
+    return cache_result(
+        result_cache, key, result, stale, len(content), max_age)
+
+
+async def schedule_request(identity, send, priority=INTERACTIVE):
+    """
+    Make a request through the `scheduler`, like its `request` method, but
+    waiting for the rate limit and between retries without blocking.
+
+    `send` is a coroutine function returning the response, already closed,
+    and its content.
+
+    """
+    bucket = scheduler.get_bucket(identity)
+    for attempt in itertools.count():
+        wait = await acquire(bucket, priority) if bucket else 0.0
+        scheduler.record_request(priority, wait)
+
+        response, content = await send()
+        delay = scheduler.check_response(
+            attempt, response.status, response.headers)
+        if delay is None:
+            break
+        await asyncio.sleep(delay)
+
+    if response.status in RETRY_STATUSES:
+        raise scheduler.get_failure(
+            response.status, content.decode('utf-8', 'replace'))
+    return response, content
+
+
+async def acquire(bucket, priority=INTERACTIVE):
+    """Wait for a token from a `TokenBucket`, like its `acquire` method."""
+    start = time.time()
+    ticket = bucket.enqueue(priority)
+    try:
+        delay = bucket.poll(ticket)
+        while delay is not None:
+            await asyncio.sleep(delay)
+            delay = bucket.poll(ticket)
+    except BaseException:
+        # cancelled while waiting
+        bucket.cancel(ticket)
+        raise
+
+    return time.time() - start
+
+
+async def execute(
+    query,
+    headers=0,
+    credentials=None,
+    session=None,
+    result_cache=None,
+    as_tuples=False,
+    result_format='rows',
+    string_encoding=None,
+    formatted_values=False,
+):
+    """Run a query, like `gsheetsdb.query.execute`, without streaming."""
+    query = ParsedQuery.wrap(query)
+
+    # fetch the columns first, so that planning doesn't block; the URL of
+    # a cached plan is used, so that the query is not parsed again
+    plan = translation_cache.get(
+        get_plan_key(query, headers, formatted_values))
+    if plan is not None:
+        baseurl = plan.baseurl
+    else:
+        query.check()
+        baseurl, _ = get_baseurl(query, headers)
+    column_map = await get_column_map(baseurl, credentials, session)
+    plan = get_plan(
+        query,
+        headers,
+        credentials,
+        formatted_values=formatted_values,
+        column_map=column_map,
+    )
+    logger.info('Original query: {}'.format(query.sql))
+    logger.info('Translated query: {}'.format(plan.translated_query))
+
+    payload = await run_query(
+        plan.baseurl,
+        plan.translated_query,
+        credentials,
+        session,
+        result_cache,
+        plan.max_age,
+        # post-processors need the full payload
+        not plan.processors,
+        get_csv_cols(plan.baseurl, plan.translated_query, credentials),
+    )
+
+    return process_payload(
+        query,
+        plan,
+        payload,
+        credentials,
+        as_tuples=as_tuples,
+        result_format=result_format,
+        string_encoding=string_encoding,
+    )
+
+
+async def sqlite_execute(
+    query,
+    headers=0,
+    credentials=None,
+    session=None,
+    result_cache=None,
+    formatted_values=False,
+    mirror=None,
+):
+    """Run a query in SQLite, like `gsheetsdb.sqlite.execute`."""
+    return await run_steps(
+        execute_steps(
+            query,
+            headers,
+            credentials,
+            session,
+            result_cache,
+            formatted_values,
+            mirror,
+        ),
+        {
+            'execute': execute,
+            'get_schema': get_schema,
+            'run_query': run_query,
+        },
+    )
+
+
+async def run_steps(steps, functions):
+    """
+    Run a generator of steps, like `gsheetsdb.steps.run`, awaiting the
+    asynchronous `functions`. Lists of calls are made concurrently.
+
+    """
+    result = error = None
+    while True:
+        try:
+            if error is not None:
+                calls = steps.throw(error)
+            else:
+                calls = steps.send(result)
+        except StopIteration as e:
+            return e.value
+
+        result = error = None
+        try:
+            if isinstance(calls, list):
+                result = await asyncio.gather(
+                    *[make_call(functions, c) for c in calls])
+            else:
+                result = await make_call(functions, calls)
+        except Exception as e:
+            error = e
+
+
+class AsyncConnection(object):
+
+    """Asynchronous connection to a Google Spreadsheet."""
+
+    def __init__(
+        self,
+        credentials=None,
+        pool_maxsize=DEFAULT_POOL_MAXSIZE,
+        result_cache_size=None,
+        result_cache_ttl=None,
+        as_tuples=False,
+        string_encoding=None,
+        formatted_values=False,
+        session=None,
+        mirror_size=None,
+        mirror_ttl=None,
+        shared_mirror=False,
+    ):
+        if aiohttp is None and session is None:
+            raise NotSupportedError(
+                'aiohttp is required for asynchronous connections')
+        if string_encoding not in STRING_ENCODINGS:
+            raise InterfaceError(
+                'Invalid string encoding: {0}'.format(string_encoding))
+
+        self.credentials = credentials
+        self.as_tuples = as_tuples
+        self.string_encoding = string_encoding
+        self.formatted_values = formatted_values
+
+        # pooled session shared by all cursors
+        self._owns_session = session is None
+        if session is None:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=pool_maxsize))
+        self.session = session
+
+        # optional cache of query results, also shared by all cursors
+        if result_cache_size:
+            self.result_cache = LRUCache(
+                max_entries=float('inf'),
+                ttl=result_cache_ttl,
+                max_size=result_cache_size,
+            )
+        else:
+            self.result_cache = None
+
+        # optional SQLite database keeping the sheets queried in SQLite
+        if shared_mirror:
+            self.mirror = process_mirror
+        elif mirror_size:
+            self.mirror = SQLiteMirror(max_size=mirror_size, ttl=mirror_ttl)
+        else:
+            self.mirror = None
+        self._owns_mirror = not shared_mirror
+
+        self.closed = False
+        self.cursors = []
+
+    @check_closed
+    async def close(self):
+        """Close the connection now."""
+        self.closed = True
+        for cursor in self.cursors:
+            try:
+                cursor.close()
+            except Error:
+                pass  # already closed
+        if self._owns_session:
+            await self.session.close()
+        if self.mirror is not None and self._owns_mirror:
+            self.mirror.close()
+
+    @check_closed
+    async def commit(self):
+        """
+        Commit any pending transaction to the database.
+
+        Not supported.
+        """
+        pass
+
+    @check_closed
+    def cursor(self):
+        """Return a new AsyncCursor Object using the connection."""
+        cursor = AsyncCursor(
+            self.credentials,
+            self.session,
+            self.result_cache,
+            self.as_tuples,
+            self.string_encoding,
+            self.formatted_values,
+            self.mirror,
+        )
+        self.cursors.append(cursor)
+
+        return cursor
+
+    @check_closed
+    async def execute(
+        self,
+        operation,
+        parameters=None,
+        headers=0,
+        result_format=None,
+    ):
+        cursor = self.cursor()
+        return await cursor.execute(
+            operation, parameters, headers, result_format)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.commit()  # no-op
+        await self.close()
+
+
+class AsyncCursor(object):
+
+    """Asynchronous connection cursor."""
+
+    def __init__(
+        self,
+        credentials=None,
+        session=None,
+        result_cache=None,
+        as_tuples=False,
+        string_encoding=None,
+        formatted_values=False,
+        mirror=None,
+    ):
+        self.credentials = credentials
+        self.session = session
+        self.result_cache = result_cache
+        self.mirror = mirror
+
+        # number of rows to fetch at a time with .fetchmany()
+        self.arraysize = 1
+
+        # see `gsheetsdb.db.Cursor`
+        self.as_tuples = as_tuples
+        self.string_encoding = string_encoding
+        self.formatted_values = formatted_values
+        self.result_format = 'rows'
+
+        self.closed = False
+
+        # this is updated only after a query
+        self.description = None
+
+        # where the last query ran, either `gviz` or `sqlite`
+        self.engine = None
+
+        self._results = None
+        self._columns = None
+        self._rowcount = -1
+
+    @property
+    @check_result
+    @check_closed
+    def rowcount(self):
+        return self._rowcount
+
+    @check_closed
+    def close(self):
+        """Close the cursor."""
+        self.closed = True
+
+    @check_closed
+    async def execute(
+        self,
+        operation,
+        parameters=None,
+        headers=0,
+        result_format=None,
+    ):
+        if result_format is None:
+            result_format = self.result_format
+        if result_format not in RESULT_FORMATS:
+            raise ProgrammingError(
+                'Invalid result format: {0}'.format(result_format))
+
+        self.description = None
+        query = ParsedQuery(apply_parameters(operation, parameters or {}))
+        self.engine, reason = choose_engine(query, headers)
+        if self.engine == GVIZ:
+            try:
+                results, self.description = await execute(
+                    query,
+                    headers,
+                    self.credentials,
+                    self.session,
+                    self.result_cache,
+                    self.as_tuples,
+                    result_format,
+                    self.string_encoding,
+                    self.formatted_values,
+                )
+            except (ProgrammingError, NotSupportedError):
+                logger.info('Query failed, running in SQLite')
+                record_failure(query, headers)
+                self.engine = SQLITE
+        else:
+            logger.info('Running in SQLite: {0}'.format(reason))
+
+        if self.engine == SQLITE:
+            results, self.description = await sqlite_execute(
+                query,
+                headers,
+                self.credentials,
+                self.session,
+                self.result_cache,
+                self.formatted_values,
+                self.mirror,
+            )
+            if result_format == 'columnar':
+                results = rows_to_columns(
+                    self.description, results, self.string_encoding)
+
+        if result_format == 'columnar':
+            self._columns = results
+            self._rowcount = len(next(iter(results.values()), ()))
+            self._results = iter(zip(*results.values()))
+        else:
+            self._columns = None
+            self._rowcount = len(results)
+            self._results = iter(results)
+        return self
+
+    @check_closed
+    async def executemany(self, operation, seq_of_parameters=None):
+        raise NotSupportedError(
+            '`executemany` is not supported, use `execute` instead')
+
+    @check_result
+    @check_closed
+    async def fetchone(self):
+        self._columns = None
+        return next(self._results, None)
+
+    @check_result
+    @check_closed
+    async def fetchmany(self, size=None):
+        self._columns = None
+        size = size or self.arraysize
+        return list(itertools.islice(self._results, size))
+
+    @check_result
+    @check_closed
+    async def fetchall(self):
+        self._columns = None
+        return list(self._results)
+
+    @check_result
+    @check_closed
+    async def fetch_columns(self):
+        """Fetch all (remaining) rows as columns, like `Cursor`."""
+        if self._columns is not None:
+            columns = self._columns
+            self._columns = None
+            self._results = iter([])
+            return columns
+
+        return rows_to_columns(
+            self.description, await self.fetchall(), self.string_encoding)
+
+    @check_result
+    @check_closed
+    async def fetch_dataframe(self):
+        """Fetch all (remaining) rows as a pandas DataFrame."""
+        return to_dataframe(await self.fetch_columns())
+
+    @check_result
+    @check_closed
+    async def fetch_arrow(self):
+        """Fetch all (remaining) rows as an Arrow table."""
+        return to_arrow(self.description, await self.fetch_columns())
+
+    @check_closed
+    def setinputsizes(self, sizes):
+        # not supported
+        pass
+
+    @check_closed
+    def setoutputsizes(self, sizes):
+        # not supported
+        pass
+
+    @check_closed
+    def __aiter__(self):
+        return self
+
+    @check_result
+    @check_closed
+    async def __anext__(self):
+        row = await self.fetchone()
+        if row is None:
+            raise StopAsyncIteration
+        return row
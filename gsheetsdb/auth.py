@@ -3,29 +3,214 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import datetime
+import hashlib
+import itertools
 import json
+import logging
+import os
+import threading
+import weakref
 
+from google.auth import credentials as google_credentials
+from google.auth.transport.requests import Request
 from google.oauth2 import service_account
+from six import string_types
 
 
+logger = logging.getLogger(__name__)
+
 # Google API scopes for authentication
 # https://developers.google.com/chart/interactive/docs/spreadsheets
 SCOPES = ['https://spreadsheets.google.com/feeds']
 
+# refresh tokens in the background when they are this close to expiring
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+
+class CredentialsManager(object):
+
+    """
+    Share service account credentials across connections.
+
+    Parsed key files are cached by path (and reloaded if the file changes),
+    and credentials are cached per service account and subject, so that all
+    connections in the process share the same access token. Tokens close to
+    expiring are refreshed in a background thread, so queries only block on
+    a refresh when there's no valid token at all.
+
+    """
+
+    def __init__(self, refresh_margin=REFRESH_MARGIN):
+        self.refresh_margin = refresh_margin
+
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._credentials = {}
+        self._refresh_locks = weakref.WeakKeyDictionary()
+        self._refreshing = set()
+
+        # statistics
+        self.refreshes = 0
+        self.blocked_queries = 0
+
+    def load_key(self, path):
+        """Load a service account key file, parsing it only once."""
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            if path in self._keys and self._keys[path][0] == mtime:
+                return self._keys[path][1]
+
+        with open(path) as fp:
+            info = json.load(fp)
+
+        with self._lock:
+            self._keys[path] = (mtime, info)
+        return info
+
+    def get_credentials(
+        self,
+        service_account_file=None,
+        service_account_info=None,
+        subject=None,
+    ):
+        if service_account_file:
+            service_account_info = self.load_key(service_account_file)
+
+        if not service_account_info:
+            return None
+
+        key = (
+            service_account_info.get('client_email'),
+            service_account_info.get('private_key_id'),
+            subject,
+        )
+        with self._lock:
+            if key not in self._credentials:
+                self._credentials[key] = (
+                    service_account.Credentials.from_service_account_info(
+                        service_account_info, scopes=SCOPES, subject=subject))
+            return self._credentials[key]
+
+    def ensure_valid(self, credentials):
+        """
+        Make sure the credentials have a valid token before a query.
+
+        Blocks only if the credentials have no token or it already expired;
+        tokens within `refresh_margin` of their expiry are refreshed in the
+        background while the current token is still used.
+
+        """
+        if not isinstance(credentials, google_credentials.Credentials):
+            return
+
+        if not credentials.valid:
+            with self._lock:
+                self.blocked_queries += 1
+            with self._get_refresh_lock(credentials):
+                # another thread might have refreshed while we waited
+                if not credentials.valid:
+                    self._refresh(credentials)
+            return
+
+        if credentials.expiry is None:
+            return
+
+        remaining = credentials.expiry - datetime.datetime.utcnow()
+        if remaining < self.refresh_margin:
+            with self._lock:
+                if id(credentials) in self._refreshing:
+                    return
+                self._refreshing.add(id(credentials))
+            thread = threading.Thread(
+                target=self._refresh_in_background, args=(credentials,))
+            thread.daemon = True
+            thread.start()
+
+    def _get_refresh_lock(self, credentials):
+        with self._lock:
+            return self._refresh_locks.setdefault(
+                credentials, threading.Lock())
+
+    def _refresh(self, credentials):
+        logger.info('Refreshing access token')
+        credentials.refresh(Request())
+        with self._lock:
+            self.refreshes += 1
+
+    def _refresh_in_background(self, credentials):
+        try:
+            with self._get_refresh_lock(credentials):
+                self._refresh(credentials)
+        except Exception:
+            # the next query will retry while blocking
+            logger.exception('Unable to refresh access token')
+        finally:
+            with self._lock:
+                self._refreshing.discard(id(credentials))
+
+
+credentials_manager = CredentialsManager()
+
+# identities of credentials that can't be identified by their contents; ids
+# are reused after objects are collected, so a counter is used instead
+LOCAL_IDENTITY = 'credentials'
+_identities = weakref.WeakKeyDictionary()
+_pinned = {}
+_identity_counter = itertools.count()
+_identity_lock = threading.Lock()
+
+
+def get_credentials_identity(credentials):
+    """
+    Return a hashable identity for credentials, used in cache keys.
+
+    Service account credentials are identified by account and subject, and
+    user credentials by a hash of their refresh token, so that equivalent
+    credentials share cache entries. Other credentials get an identity that
+    is never given to other credentials, even after they're collected.
+
+    """
+    if not credentials:
+        return None
+
+    email = getattr(credentials, 'service_account_email', None)
+    if email is not None:
+        return email, getattr(credentials, '_subject', None)
+
+    refresh_token = getattr(credentials, 'refresh_token', None)
+    if isinstance(refresh_token, string_types):
+        client_id = getattr(credentials, 'client_id', None) or ''
+        digest = hashlib.sha256(
+            '{0}:{1}'.format(client_id, refresh_token).encode('utf-8'))
+        return 'refresh_token', digest.hexdigest()
+
+    with _identity_lock:
+        try:
+            identity = _identities.get(credentials)
+            if identity is None:
+                identity = LOCAL_IDENTITY, next(_identity_counter)
+                _identities[credentials] = identity
+        except TypeError:
+            # can't be weakly referenced, so keep the credentials alive for
+            # their id not to be reused
+            key = id(credentials)
+            if key not in _pinned:
+                _pinned[key] = (
+                    credentials, (LOCAL_IDENTITY, next(_identity_counter)))
+            identity = _pinned[key][1]
+    return identity
+
+
+def is_shared_identity(identity):
+    """Return whether an identity is the same in every process."""
+    return identity is None or identity[0] != LOCAL_IDENTITY
+
 
 def get_credentials_from_auth(
     service_account_file=None,
     service_account_info=None,
     subject=None,
 ):
-    if service_account_file:
-        with open(service_account_file) as fp:
-            service_account_info = json.load(fp)
-
-    if not service_account_info:
-        return None
-
-    credentials = service_account.Credentials.from_service_account_info(
-        service_account_info, scopes=SCOPES, subject=subject)
-
-    return credentials
+    return credentials_manager.get_credentials(
+        service_account_file, service_account_info, subject)
@@ -0,0 +1,184 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import namedtuple, OrderedDict
+import threading
+import time
+
+
+Entry = namedtuple('Entry', ['timestamp', 'value', 'size', 'ttl'])
+
+
+class LRUCache(object):
+
+    """
+    A thread-safe LRU cache with an optional TTL and memory budget.
+
+    Entries older than their TTL are treated as missing, but are kept until
+    evicted so they can be revalidated with `get_stale` and `refresh`. When
+    the cache has more than `max_entries`, or the sum of the entry sizes is
+    larger than `max_size`, the least recently used entries are evicted.
+
+    """
+
+    def __init__(self, max_entries=1000, ttl=None, max_size=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.size = 0
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._get_fresh(key) is not None
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._get_fresh(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry.value
+
+    def get_stale(self, key):
+        """Return an entry even if it has expired, or `None`."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def refresh(self, key):
+        """Mark an expired entry as fresh again, after revalidating it."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = entry._replace(timestamp=time.time())
+                self._entries.move_to_end(key)
+                self.revalidations += 1
+
+    def set(self, key, value, size=0, ttl=None):
+        """
+        Store a value.
+
+        `size` is the approximate size of the value in bytes, counted towards
+        `max_size`, and `ttl` overrides the default TTL of the cache.
+
+        """
+        with self._lock:
+            self._remove(key)
+            if self.max_size is not None and size > self.max_size:
+                return
+
+            self._entries[key] = Entry(time.time(), value, size, ttl)
+            self.size += size
+            while len(self._entries) > self.max_entries or (
+                self.max_size is not None and self.size > self.max_size
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, predicate=None):
+        """Remove all entries, or only those whose key match `predicate`."""
+        with self._lock:
+            for key in list(self._entries):
+                if predicate is None or predicate(key):
+                    self._remove(key)
+
+    def clear(self):
+        self.invalidate()
+        self.hits = self.misses = self.evictions = self.revalidations = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def _get_fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        ttl = self.ttl if entry.ttl is None else entry.ttl
+        if ttl is not None and time.time() - entry.timestamp > ttl:
+            return None
+
+        return entry
+
+
+class Flight(object):
+
+    """A call in progress in a `SingleFlight`."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+
+    """
+    Coalesce concurrent calls with the same key.
+
+    While a call for a key is in progress, other callers with the same key
+    wait for it and share its result, or its exception, instead of making
+    their own call. `coalesced` counts the calls that were saved.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+        # statistics
+        self.coalesced = 0
+
+    def do(self, key, function, *args):
+        """
+        Call `function`, or wait for the call in progress for `key`.
+
+        Returns the result, and whether it's shared with other callers; shared
+        results should not be modified.
+
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+            else:
+                flight.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = function(*args)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return flight.result, flight.waiters > 0
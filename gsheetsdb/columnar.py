@@ -0,0 +1,340 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from array import array
+from collections import OrderedDict
+import datetime
+
+from six import string_types
+
+from gsheetsdb.convert import converters, get_interner
+from gsheetsdb.exceptions import NotSupportedError
+from gsheetsdb.types import Type
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+NAN = float('nan')
+
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+
+class Columns(object):
+
+    """
+    The columns of a result, in order.
+
+    Behaves like an ordered dictionary from column name to column storage,
+    but columns are kept by position, so that repeated names, as in
+    `SELECT a, a`, don't collapse; looking up a repeated name returns its
+    first column.
+
+    """
+
+    def __init__(self, items=()):
+        self._items = list(items)
+
+    def append(self, name, column):
+        self._items.append((name, column))
+
+    def keys(self):
+        return [name for name, column in self._items]
+
+    def values(self):
+        return [column for name, column in self._items]
+
+    def items(self):
+        return list(self._items)
+
+    def __getitem__(self, key):
+        for name, column in self._items:
+            if name == key:
+                return column
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return 'Columns({0!r})'.format(self._items)
+
+
+def make_array(type_, values):
+    """
+    Build the storage for a column of converted values.
+
+    With NumPy, numbers are float64 (NULLs become NaN), dates and datetimes
+    are datetime64 (NULLs become NaT), booleans are bool, and everything else
+    is an object array. Without NumPy numbers are stored in an `array` of
+    doubles, booleans in an `array` of bytes, and everything else in a list.
+    Boolean columns with NULLs are always stored as objects.
+
+    """
+    if type_ == Type.BOOLEAN and None in values:
+        type_ = None
+
+    if np is None:
+        if type_ == Type.NUMBER:
+            return array(str('d'), [
+                NAN if value is None else value for value in values])
+        if type_ == Type.BOOLEAN:
+            return array(str('b'), values)
+        return list(values)
+
+    if type_ == Type.NUMBER:
+        return np.array(values, dtype=np.float64)
+    if type_ == Type.BOOLEAN:
+        return np.array(values, dtype=np.bool_)
+    # NumPy is slow at converting date objects, so build the integer values
+    if type_ == Type.DATE:
+        nat = np.datetime64('NaT', 'D').astype(np.int64)
+        return np.array([
+            nat if value is None else value.toordinal() - EPOCH_ORDINAL
+            for value in values
+        ], dtype=np.int64).view('datetime64[D]')
+    if type_ == Type.DATETIME:
+        nat = np.datetime64('NaT', 'us').astype(np.int64)
+        return np.array([
+            nat if value is None else get_microseconds(value - EPOCH)
+            for value in values
+        ], dtype=np.int64).view('datetime64[us]')
+
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+class DictionaryColumn(object):
+
+    """
+    A dictionary-encoded string column.
+
+    `categories` has the distinct values in the column, and `codes` has the
+    position of each value in `categories`, or -1 for NULLs.
+
+    """
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        code = self.codes[index]
+        return None if code < 0 else self.categories[code]
+
+    def __iter__(self):
+        categories = self.categories
+        for code in self.codes:
+            yield None if code < 0 else categories[code]
+
+    def __repr__(self):
+        return 'DictionaryColumn({0} values, {1} categories)'.format(
+            len(self.codes), len(self.categories))
+
+
+def dictionary_encode(values):
+    """Dictionary-encode a column of strings."""
+    index = {}
+    categories = []
+    codes = []
+    for value in values:
+        if value is None:
+            codes.append(-1)
+            continue
+
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(categories)
+            categories.append(value)
+        codes.append(code)
+
+    if np is None:
+        return DictionaryColumn(array(str('i'), codes), categories)
+    return DictionaryColumn(np.array(codes, dtype=np.int32), categories)
+
+
+def make_column(type_, values, string_encoding=None):
+    """
+    Build the storage for a column, encoding strings if needed.
+
+    With a `string_encoding` of `intern` repeated strings share a single
+    instance, and with `dictionary` string columns are stored as a
+    `DictionaryColumn`.
+
+    """
+    if type_ == Type.STRING:
+        if string_encoding == 'dictionary':
+            return dictionary_encode(values)
+        if string_encoding == 'intern':
+            intern_string = get_interner()
+            values = [
+                None if value is None else intern_string(value)
+                for value in values
+            ]
+
+    return make_array(type_, values)
+
+
+def get_microseconds(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def infer_type(values):
+    """Infer the type of a column from its values, for SQLite results."""
+    types = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            types.add(Type.BOOLEAN)
+        elif isinstance(value, (int, float)):
+            types.add(Type.NUMBER)
+        elif isinstance(value, datetime.datetime):
+            types.add(Type.DATETIME)
+        elif isinstance(value, datetime.date):
+            types.add(Type.DATE)
+        elif isinstance(value, datetime.time):
+            types.add(Type.TIMEOFDAY)
+        elif isinstance(value, string_types):
+            types.add(Type.STRING)
+        else:
+            return None
+
+    return types.pop() if len(types) == 1 else None
+
+
+def convert_columns(cols, rows, string_encoding=None):
+    """
+    Convert the rows of a payload directly into columns.
+
+    Returns the `Columns` with the storage of each column (see
+    `make_column`), without building a tuple for each row. Rows can be
+    dictionaries of cells or compact rows, like in `iter_convert_rows`.
+
+    """
+    values = [[] for col in cols]
+    appends = [column.append for column in values]
+    for row in rows:
+        if isinstance(row, tuple):
+            for append, value in zip(appends, row):
+                append(value)
+        else:
+            for append, cell in zip(appends, row['c']):
+                append(cell['v'] if cell else None)
+
+    columns = Columns()
+    for col, column in zip(cols, values):
+        converter = converters.get(col['type'])
+        if converter is not None:
+            column = [
+                None if value is None else converter(value)
+                for value in column
+            ]
+        columns.append(
+            col['label'],
+            make_column(Type(col['type']), column, string_encoding),
+        )
+
+    return columns
+
+
+def rows_to_columns(description, rows, string_encoding=None):
+    """
+    Transpose converted rows into columns, using the types in `description`.
+
+    Columns without a type, like the ones in results from SQLite, have their
+    type inferred from the values.
+
+    """
+    values = list(zip(*rows)) if rows else [() for _ in description]
+
+    columns = Columns()
+    for column, column_values in zip(description, values):
+        type_ = column[1]
+        if not isinstance(type_, Type):
+            type_ = infer_type(column_values)
+        columns.append(
+            column[0], make_column(type_, column_values, string_encoding))
+
+    return columns
+
+
+def to_dataframe(columns):
+    """Build a pandas DataFrame from columns, without copying them to rows."""
+    try:
+        import pandas as pd
+    except ImportError:
+        raise NotSupportedError('pandas is required to fetch DataFrames')
+
+    # columns are keyed by position, since names can repeat
+    data = OrderedDict(
+        (
+            i,
+            pd.Categorical.from_codes(column.codes, column.categories)
+            if isinstance(column, DictionaryColumn) else column,
+        )
+        for i, column in enumerate(columns.values())
+    )
+
+    df = pd.DataFrame(data, columns=list(data))
+    df.columns = list(columns)
+    return df
+
+
+def get_arrow_types(pa):
+    return {
+        Type.STRING: pa.string(),
+        Type.NUMBER: pa.float64(),
+        Type.BOOLEAN: pa.bool_(),
+        Type.DATE: pa.date32(),
+        Type.DATETIME: pa.timestamp('us'),
+        Type.TIMEOFDAY: pa.time64('us'),
+    }
+
+
+def to_arrow(description, columns):
+    """
+    Build an Arrow table from columns, using the types in `description`.
+
+    NULLs are preserved, even in number and date columns. Columns without a
+    type, like the ones in results from SQLite, have their type inferred by
+    Arrow.
+
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise NotSupportedError('pyarrow is required to fetch Arrow tables')
+
+    arrow_types = get_arrow_types(pa)
+    arrays = []
+    for description_column, column in zip(description, columns.values()):
+        if isinstance(column, DictionaryColumn):
+            codes = np.asarray(column.codes)
+            arrays.append(pa.DictionaryArray.from_arrays(
+                pa.array(codes, mask=codes < 0),
+                pa.array(column.categories, type=pa.string()),
+            ))
+        else:
+            arrays.append(pa.array(
+                column,
+                type=arrow_types.get(description_column[1]),
+                from_pandas=True,
+            ))
+
+    return pa.Table.from_arrays(arrays, names=list(columns))
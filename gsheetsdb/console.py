@@ -1,16 +1,26 @@
 """Google Spreadsheets CLI
 
 Usage:
-  gsheetsdb [--headers=<headers>] [--raise] [--service-account-file=<file> [--subject=<subject>]]
+  gsheetsdb [--headers=<headers>] [--raise] [--snapshot-dir=<dir>] [--snapshot-ttl=<ttl>] [--service-account-file=<file> [--subject=<subject>]]
+  gsheetsdb warm <url>... [--headers=<headers>] [--raise] [--snapshot-dir=<dir>] [--snapshot-ttl=<ttl>] [--service-account-file=<file> [--subject=<subject>]]
+  gsheetsdb purge [--expired] [--snapshot-dir=<dir>] [--snapshot-ttl=<ttl>]
   gsheetsdb (-h | --help)
   gsheetsdb --version
 
+Commands:
+  warm                              Store fresh snapshots of sheets on disk,
+                                    revalidating the current ones
+  purge                             Remove snapshots
+
 Options:
   -h --help                         Show this screen.
   --version                         Show version.
   --headers=<headers>               How many rows are headers [default: 0]
   --service-account-file=<file>     Service account file for authentication
   --subject=<subject>               Subject to impersonate
+  --snapshot-dir=<dir>              Directory of sheet snapshots
+  --snapshot-ttl=<ttl>              Seconds before snapshots expire
+  --expired                         Only remove expired snapshots
 
 """  # noqa: E501
 
@@ -30,6 +40,8 @@ from tabulate import tabulate
 
 from gsheetsdb import connect, __version__
 from gsheetsdb.auth import get_credentials_from_auth
+from gsheetsdb.query import warm_snapshot
+from gsheetsdb.snapshot import DEFAULT_SNAPSHOT_DIR, SnapshotStore
 
 
 keywords = [
@@ -88,12 +100,24 @@ def main():
 
     arguments = docopt(__doc__, version=__version__.__version__)
 
+    if arguments.get('purge'):
+        return purge(arguments)
+
     auth = {
         'service_account_file': arguments['--service-account-file'],
         'subject': arguments['--subject'],
     }
     credentials = get_credentials_from_auth(**auth)
-    connection = connect(credentials)
+
+    if arguments.get('warm'):
+        return warm(arguments, credentials)
+
+    ttl = arguments.get('--snapshot-ttl')
+    connection = connect(
+        credentials,
+        snapshot_dir=arguments.get('--snapshot-dir'),
+        snapshot_ttl=float(ttl) if ttl else None,
+    )
     headers = int(arguments['--headers'])
     cursor = connection.cursor()
 
@@ -125,3 +149,31 @@ def main():
             print(tabulate(result, headers=columns))
 
     print('See ya!')
+
+
+def get_snapshots(arguments):
+    ttl = arguments.get('--snapshot-ttl')
+    return SnapshotStore(
+        arguments.get('--snapshot-dir') or DEFAULT_SNAPSHOT_DIR,
+        float(ttl) if ttl else None,
+    )
+
+
+def warm(arguments, credentials=None):
+    snapshots = get_snapshots(arguments)
+    headers = int(arguments['--headers'])
+    for url in arguments['<url>']:
+        try:
+            rows = warm_snapshot(snapshots, url, headers, credentials)
+        except Exception as e:
+            if arguments['--raise']:
+                raise
+            print('{0}: {1}'.format(url, e))
+            continue
+        print('{0}: {1} rows'.format(url, rows))
+
+
+def purge(arguments):
+    snapshots = get_snapshots(arguments)
+    count = snapshots.purge(expired_only=arguments['--expired'])
+    print('Removed {0} snapshots from {1}'.format(count, snapshots.path))
@@ -6,6 +6,8 @@ from __future__ import unicode_literals
 from collections import namedtuple
 import datetime
 
+from gsheetsdb.cache import LRUCache
+
 
 def parse_datetime(v):
     """Parse a string like 'Date(2018,0,1,0,0,0)'"""
@@ -25,29 +27,95 @@ def parse_timeofday(v):
     return datetime.time(*v)
 
 
+# types that need no conversion are left out
 converters = {
-    'string': lambda v: v,
-    'number': lambda v: v,
-    'boolean': lambda v: v,
     'date': parse_date,
     'datetime': parse_datetime,
     'timeofday': parse_timeofday,
 }
 
+# row classes, keyed by column labels
+row_class_cache = LRUCache(max_entries=1000)
+
+
+def get_row_class(cols):
+    """Return a namedtuple class for the columns, reusing it across queries."""
+    labels = tuple(col['label'].replace(' ', '_') for col in cols)
+    Row = row_class_cache.get(labels)
+    if Row is None:
+        Row = namedtuple('Row', labels, rename=True)
+        row_class_cache.set(labels, Row)
+    return Row
+
+
+def get_interner():
+    """Return a function that maps equal strings to a single instance."""
+    strings = {}
+
+    def intern_string(value):
+        return strings.setdefault(value, value)
+
+    return intern_string
+
+
+def get_converters(cols, intern_strings=False):
+    """
+    Return `(index, converter)` for the columns that need converting.
+
+    With `intern_strings` values in string columns are interned, so that
+    repeated values share storage.
 
-def convert_rows(cols, rows):
-    Row = namedtuple(
-        'Row',
-        [col['label'].replace(' ', '_') for col in cols],
-        rename=True)
+    """
+    plan = [
+        (i, converters[col['type']])
+        for i, col in enumerate(cols)
+        if col['type'] in converters
+    ]
+    if intern_strings:
+        intern_string = get_interner()
+        plan.extend(
+            (i, intern_string)
+            for i, col in enumerate(cols)
+            if col['type'] == 'string'
+        )
+
+    return plan
+
+
+def iter_convert_rows(cols, rows, as_tuples=False, intern_strings=False):
+    """
+    Convert rows lazily, as they are read from `rows`.
+
+    Rows can be dictionaries of cells, or compact rows from `decode_payload`
+    with only the values of the cells.
+
+    Rows are namedtuples, or plain tuples with `as_tuples`. With
+    `intern_strings` repeated strings share a single instance.
+
+    """
+    make_row = tuple if as_tuples else get_row_class(cols)._make
+    plan = get_converters(cols, intern_strings)
+    n = len(cols)
 
-    results = []
     for row in rows:
-        values = []
-        for i, col in enumerate(row['c']):
-            if i < len(cols):
-                converter = converters[cols[i]['type']]
-                values.append(converter(col['v']) if col else None)
-        results.append(Row(*values))
-
-    return results
+        if isinstance(row, tuple):
+            if len(row) > n:
+                row = row[:n]
+            if not plan:
+                yield make_row(row)
+                continue
+            values = list(row)
+        else:
+            cells = row['c']
+            if len(cells) > n:
+                cells = cells[:n]
+            values = [cell['v'] if cell else None for cell in cells]
+
+        for i, converter in plan:
+            if values[i] is not None:
+                values[i] = converter(values[i])
+        yield make_row(values)
+
+
+def convert_rows(cols, rows, as_tuples=False, intern_strings=False):
+    return list(iter_convert_rows(cols, rows, as_tuples, intern_strings))
@@ -3,27 +3,112 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import logging
 
 from six import string_types
 
-from gsheetsdb.exceptions import Error, NotSupportedError, ProgrammingError
+from gsheetsdb.cache import LRUCache
+from gsheetsdb.columnar import rows_to_columns, to_arrow, to_dataframe
+from gsheetsdb.exceptions import (
+    Error,
+    InterfaceError,
+    NotSupportedError,
+    ProgrammingError,
+)
+from gsheetsdb.parsing import ParsedQuery
 from gsheetsdb.query import execute
+from gsheetsdb.routing import choose_engine, GVIZ, record_failure, SQLITE
 from gsheetsdb.sqlite import execute as sqlite_execute
+from gsheetsdb.sqlite import shared_mirror as process_mirror, SQLiteMirror
+from gsheetsdb.snapshot import SnapshotStore
+from gsheetsdb.transport import (
+    DEFAULT_POOL_CONNECTIONS,
+    DEFAULT_POOL_MAXSIZE,
+    get_session,
+)
 
 
 logger = logging.getLogger(__name__)
 
-
-def connect(credentials=None):
+RESULT_FORMATS = {'rows', 'columnar'}
+
+STRING_ENCODINGS = {None, 'intern', 'dictionary'}
+
+
+def connect(
+    credentials=None,
+    pool_connections=DEFAULT_POOL_CONNECTIONS,
+    pool_maxsize=DEFAULT_POOL_MAXSIZE,
+    pool_block=False,
+    result_cache_size=None,
+    result_cache_ttl=None,
+    as_tuples=False,
+    string_encoding=None,
+    formatted_values=False,
+    mirror_size=None,
+    mirror_ttl=None,
+    shared_mirror=False,
+    snapshot_dir=None,
+    snapshot_ttl=None,
+):
     """
     Constructor for creating a connection to the database.
 
         >>> conn = connect()
         >>> curs = conn.cursor()
 
+    The connection keeps a pool of keep-alive HTTP connections that is shared
+    by all its cursors; `pool_maxsize` controls how many connections are kept
+    open per host, and `pool_block` makes it a hard limit.
+
+    Results can be cached by passing `result_cache_size`, the memory budget
+    of the cache in bytes. Cached results expire after `result_cache_ttl`
+    seconds, unless the sheet URL has a `max_age` argument.
+
+    Rows are returned as namedtuples; `as_tuples` returns plain tuples
+    instead, which are cheaper to build.
+
+    Sheets with many repeated strings can use less memory with a
+    `string_encoding`: `intern` makes equal strings share a single object,
+    and `dictionary` also stores string columns as a `DictionaryColumn` in
+    columnar results.
+
+    Formatted values are never used, so by default the API is asked to leave
+    them out, which roughly halves the size of responses; pass
+    `formatted_values=True` to request them anyway.
+
+    Queries the API can't run are run in SQLite, loading the whole sheet.
+    Passing `mirror_size`, a memory budget in bytes, keeps the loaded sheets
+    in a SQLite database owned by the connection, where they're reused by
+    later queries for `mirror_ttl` seconds, unless the sheet URL has a
+    `max_age` argument. With `shared_mirror=True` they're kept instead in
+    `gsheetsdb.sqlite.shared_mirror`, which is shared by the whole process.
+
+    Whole sheets can also be kept on disk in `snapshot_dir`, where they're
+    shared by all processes using the same directory and survive restarts;
+    snapshots are used for `snapshot_ttl` seconds, unless the sheet URL has a
+    `max_age` argument. Only sheets read without credentials or with service
+    accounts are kept.
+
     """
-    return Connection(credentials)
+    return Connection(
+        credentials,
+        pool_connections,
+        pool_maxsize,
+        pool_block,
+        result_cache_size,
+        result_cache_ttl,
+        as_tuples,
+        string_encoding,
+        formatted_values,
+        mirror_size,
+        mirror_ttl,
+        shared_mirror,
+        snapshot_dir,
+        snapshot_ttl,
+    )
 
 
 def check_closed(f):
@@ -51,8 +136,61 @@ class Connection(object):
 
     """Connection to a Google Spreadsheet."""
 
-    def __init__(self, credentials=None):
+    def __init__(
+        self,
+        credentials=None,
+        pool_connections=DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize=DEFAULT_POOL_MAXSIZE,
+        pool_block=False,
+        result_cache_size=None,
+        result_cache_ttl=None,
+        as_tuples=False,
+        string_encoding=None,
+        formatted_values=False,
+        mirror_size=None,
+        mirror_ttl=None,
+        shared_mirror=False,
+        snapshot_dir=None,
+        snapshot_ttl=None,
+    ):
+        if string_encoding not in STRING_ENCODINGS:
+            raise InterfaceError(
+                'Invalid string encoding: {0}'.format(string_encoding))
+
         self.credentials = credentials
+        self.pool_maxsize = pool_maxsize
+        self.as_tuples = as_tuples
+        self.string_encoding = string_encoding
+        self.formatted_values = formatted_values
+
+        # pooled session shared by all cursors
+        self.session = get_session(
+            credentials, pool_connections, pool_maxsize, pool_block)
+
+        # optional cache of query results, also shared by all cursors
+        if result_cache_size:
+            self.result_cache = LRUCache(
+                max_entries=float('inf'),
+                ttl=result_cache_ttl,
+                max_size=result_cache_size,
+            )
+        else:
+            self.result_cache = None
+
+        # optional SQLite database keeping the sheets queried in SQLite
+        if shared_mirror:
+            self.mirror = process_mirror
+        elif mirror_size:
+            self.mirror = SQLiteMirror(max_size=mirror_size, ttl=mirror_ttl)
+        else:
+            self.mirror = None
+        self._owns_mirror = not shared_mirror
+
+        # optional store of whole sheets on disk, shared by processes
+        if snapshot_dir:
+            self.snapshots = SnapshotStore(snapshot_dir, snapshot_ttl)
+        else:
+            self.snapshots = None
 
         self.closed = False
         self.cursors = []
@@ -66,6 +204,9 @@ class Connection(object):
                 cursor.close()
             except Error:
                 pass  # already closed
+        self.session.close()
+        if self.mirror is not None and self._owns_mirror:
+            self.mirror.close()
 
     @check_closed
     def commit(self):
@@ -79,15 +220,71 @@ class Connection(object):
     @check_closed
     def cursor(self):
         """Return a new Cursor Object using the connection."""
-        cursor = Cursor(self.credentials)
+        cursor = Cursor(
+            self.credentials,
+            self.session,
+            self.result_cache,
+            self.as_tuples,
+            self.string_encoding,
+            self.formatted_values,
+            self.mirror,
+            self.snapshots,
+        )
         self.cursors.append(cursor)
 
         return cursor
 
     @check_closed
-    def execute(self, operation, parameters=None, headers=0):
+    def execute(
+        self,
+        operation,
+        parameters=None,
+        headers=0,
+        stream=None,
+        result_format=None,
+    ):
         cursor = self.cursor()
-        return cursor.execute(operation, parameters, headers)
+        return cursor.execute(
+            operation, parameters, headers, stream, result_format)
+
+    @check_closed
+    def execute_many_concurrently(
+        self,
+        queries,
+        max_workers=None,
+        headers=0,
+        result_format=None,
+    ):
+        """
+        Run many independent queries at the same time.
+
+        `queries` is a list of operations, or of `(operation, parameters)`
+        tuples. The queries run in a pool of `max_workers` threads, by default
+        as many as the connections kept open by the session, and share the
+        session and caches of the connection.
+
+        Returns a list with an executed cursor for each query, in the same
+        order; if a query fails, its exception is returned in place of the
+        cursor instead of being raised.
+
+        """
+        if max_workers is None:
+            max_workers = self.pool_maxsize
+
+        def run(query):
+            if isinstance(query, tuple):
+                operation, parameters = query
+            else:
+                operation, parameters = query, None
+            try:
+                # results are read in the worker threads
+                return self.execute(
+                    operation, parameters, headers, False, result_format)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            return list(executor.map(run, queries))
 
     def __enter__(self):
         return self
@@ -101,27 +298,64 @@ class Cursor(object):
 
     """Connection cursor."""
 
-    def __init__(self, credentials=None):
+    def __init__(
+        self,
+        credentials=None,
+        session=None,
+        result_cache=None,
+        as_tuples=False,
+        string_encoding=None,
+        formatted_values=False,
+        mirror=None,
+        snapshots=None,
+    ):
         self.credentials = credentials
+        self.session = session
+        self.result_cache = result_cache
+        self.mirror = mirror
+        self.snapshots = snapshots
 
         # This read/write attribute specifies the number of rows to fetch at a
         # time with .fetchmany(). It defaults to 1 meaning to fetch a single
         # row at a time.
         self.arraysize = 1
 
+        # when true, rows are downloaded and converted as they are fetched,
+        # instead of all at once during `execute`
+        self.stream = False
+
+        # when true, rows are plain tuples instead of namedtuples
+        self.as_tuples = as_tuples
+
+        # share storage between repeated strings, see `connect`
+        self.string_encoding = string_encoding
+
+        # request formatted values from the API, see `connect`
+        self.formatted_values = formatted_values
+
+        # either `rows` or `columnar`; columnar results are converted straight
+        # into columns, which are returned by `fetch_columns`
+        self.result_format = 'rows'
+
         self.closed = False
 
         # this is updated only after a query
         self.description = None
 
-        # this is set to a list of rows after a successful query
+        # where the last query ran, either `gviz` or `sqlite`
+        self.engine = None
+
+        # this is set to an iterator over the rows after a successful query;
+        # rows are consumed by the fetch methods and by iterating the cursor
         self._results = None
+        self._columns = None
+        self._rowcount = -1
 
     @property
     @check_result
     @check_closed
     def rowcount(self):
-        return len(self._results)
+        return self._rowcount
 
     @check_closed
     def close(self):
@@ -129,18 +363,87 @@ class Cursor(object):
         self.closed = True
 
     @check_closed
-    def execute(self, operation, parameters=None, headers=0):
+    def execute(
+        self,
+        operation,
+        parameters=None,
+        headers=0,
+        stream=None,
+        result_format=None,
+    ):
+        if stream is None:
+            stream = self.stream
+        if result_format is None:
+            result_format = self.result_format
+        if result_format not in RESULT_FORMATS:
+            raise ProgrammingError(
+                'Invalid result format: {0}'.format(result_format))
+
         self.description = None
-        query = apply_parameters(operation, parameters or {})
-        try:
-            self._results, self.description = execute(
-                query, headers, self.credentials)
-        except (ProgrammingError, NotSupportedError):
-            logger.info('Query failed, running in SQLite')
-            self._results, self.description = sqlite_execute(
-                query, headers, self.credentials)
+        # the query is parsed only once, even if it runs in SQLite
+        query = ParsedQuery(apply_parameters(operation, parameters or {}))
+        self.engine, reason = choose_engine(query, headers)
+        if self.engine == GVIZ:
+            try:
+                results, self.description = execute(
+                    query,
+                    headers,
+                    self.credentials,
+                    self.session,
+                    self.result_cache,
+                    stream,
+                    self.as_tuples,
+                    result_format,
+                    self.string_encoding,
+                    self.formatted_values,
+                    self.snapshots,
+                )
+            except (ProgrammingError, NotSupportedError):
+                logger.info('Query failed, running in SQLite')
+                record_failure(query, headers)
+                self.engine = SQLITE
+        else:
+            logger.info('Running in SQLite: {0}'.format(reason))
+
+        if self.engine == SQLITE:
+            results, self.description = sqlite_execute(
+                query,
+                headers,
+                self.credentials,
+                self.session,
+                self.result_cache,
+                self.formatted_values,
+                self.mirror,
+                self.snapshots,
+            )
+            if result_format == 'columnar':
+                results = rows_to_columns(
+                    self.description, results, self.string_encoding)
+
+        if result_format == 'columnar':
+            self._set_columns(results)
+        else:
+            self._set_results(results)
         return self
 
+    def _set_results(self, results):
+        # the number of rows is unknown when streaming
+        self._rowcount = len(results) if hasattr(results, '__len__') else -1
+        self._results = iter(results)
+        self._columns = None
+
+    def _set_columns(self, columns):
+        # rows are built from the columns only if they're fetched
+        self._set_results(self._iter_columns(columns))
+        self._rowcount = len(next(iter(columns.values()), ()))
+        self._columns = columns
+
+    def _iter_columns(self, columns):
+        # once rows are fetched the columns are no longer complete
+        self._columns = None
+        for row in zip(*columns.values()):
+            yield row
+
     @check_closed
     def executemany(self, operation, seq_of_parameters=None):
         raise NotSupportedError(
@@ -153,10 +456,7 @@ class Cursor(object):
         Fetch the next row of a query result set, returning a single sequence,
         or `None` when no more data is available.
         """
-        try:
-            return self._results.pop(0)
-        except IndexError:
-            return None
+        return next(self._results, None)
 
     @check_result
     @check_closed
@@ -167,9 +467,7 @@ class Cursor(object):
         no more rows are available.
         """
         size = size or self.arraysize
-        out = self._results[:size]
-        self._results = self._results[size:]
-        return out
+        return list(itertools.islice(self._results, size))
 
     @check_result
     @check_closed
@@ -179,9 +477,50 @@ class Cursor(object):
         sequence of sequences (e.g. a list of tuples). Note that the cursor's
         arraysize attribute can affect the performance of this operation.
         """
-        out = self._results[:]
-        self._results = []
-        return out
+        return list(self._results)
+
+    @check_result
+    @check_closed
+    def fetch_columns(self):
+        """
+        Fetch all (remaining) rows of a query result as columns, returning
+        `Columns`, which map column names to NumPy arrays, or to `array`s or
+        lists when NumPy is not installed.
+
+        Executing the query with `result_format='columnar'` skips building
+        the rows altogether.
+        """
+        if self._columns is not None:
+            columns = self._columns
+            # the rows were fetched, but they still count
+            self._results = iter([])
+            self._columns = None
+            return columns
+
+        return rows_to_columns(
+            self.description, self.fetchall(), self.string_encoding)
+
+    @check_result
+    @check_closed
+    def fetch_dataframe(self):
+        """
+        Fetch all (remaining) rows of a query result as a pandas DataFrame.
+
+        The DataFrame is built from `fetch_columns`, so with
+        `result_format='columnar'` no rows are built at all.
+        """
+        return to_dataframe(self.fetch_columns())
+
+    @check_result
+    @check_closed
+    def fetch_arrow(self):
+        """
+        Fetch all (remaining) rows of a query result as an Arrow table.
+
+        The table is built from `fetch_columns`, so with
+        `result_format='columnar'` no rows are built at all.
+        """
+        return to_arrow(self.description, self.fetch_columns())
 
     @check_closed
     def setinputsizes(self, sizes):
@@ -195,7 +534,14 @@ class Cursor(object):
 
     @check_closed
     def __iter__(self):
-        return iter(self._results)
+        return self
+
+    @check_result
+    @check_closed
+    def __next__(self):
+        return next(self._results)
+
+    next = __next__
 
 
 def apply_parameters(operation, parameters):
@@ -12,8 +12,26 @@ from sqlalchemy import types
 
 import gsheetsdb
 from gsheetsdb.auth import get_credentials_from_auth
+from gsheetsdb.query import get_cached_schema
+from gsheetsdb.url import get_url
 
 
+# arguments that can be passed to `connect` in the SQLAlchemy URL, eg,
+# `gsheets:///?result_cache_size=100000000&result_cache_ttl=60`
+def asbool(value):
+    return value.lower() in ("1", "true", "yes")
+
+
+connect_args = {
+    "pool_connections": int,
+    "pool_maxsize": int,
+    "result_cache_size": int,
+    "result_cache_ttl": float,
+    "as_tuples": asbool,
+    "string_encoding": str,
+    "formatted_values": asbool,
+}
+
 type_map = {
     "string": types.String,
     "number": types.Numeric,
@@ -89,6 +107,14 @@ class GSheetsTypeCompiler(compiler.GenericTypeCompiler):
     pass
 
 
+class GSheetsExecutionContext(default.DefaultExecutionContext):
+    def create_server_side_cursor(self):
+        # used with the `stream_results` execution option
+        cursor = self._dbapi_connection.cursor()
+        cursor.stream = True
+        return cursor
+
+
 class GSheetsDialect(default.DefaultDialect):
 
     # TODO: review these
@@ -99,6 +125,7 @@ class GSheetsDialect(default.DefaultDialect):
     preparer = GSheetsIdentifierPreparer
     statement_compiler = GSheetsCompiler
     type_compiler = GSheetsTypeCompiler
+    execution_ctx_cls = GSheetsExecutionContext
     supports_alter = False
     supports_pk_autoincrement = False
     supports_default_values = False
@@ -108,6 +135,8 @@ class GSheetsDialect(default.DefaultDialect):
     returns_unicode_strings = True
     description_encoding = None
     supports_native_boolean = True
+    supports_server_side_cursors = True
+    server_side_cursors = False
 
     def __init__(
         self,
@@ -140,7 +169,12 @@ class GSheetsDialect(default.DefaultDialect):
                 port=port,
                 database=url.database or "",
             )
-        return ([self.credentials], {})
+        kwargs = {
+            key: connect_args[key](value)
+            for key, value in url.query.items()
+            if key in connect_args
+        }
+        return ([self.credentials], kwargs)
 
     def get_schema_names(self, connection, **kwargs):
         if self.url is None:
@@ -175,6 +209,20 @@ class GSheetsDialect(default.DefaultDialect):
         return {}
 
     def get_columns(self, connection, table_name, schema=None, **kwargs):
+        # use the columns cached by previous queries, if possible
+        cols = get_cached_schema(get_url(table_name), self.credentials)
+        if cols is not None:
+            return [
+                {
+                    "name": col["label"],
+                    "type": type_map[col["type"]],
+                    "nullable": True,
+                    "default": None,
+                }
+                for col in cols
+                if col["label"]
+            ]
+
         query = 'SELECT * FROM "{table}" LIMIT 0'.format(table=table_name)
         result = connection.execute(query)
         return [
@@ -18,7 +18,38 @@ from six import string_types, text_type
 from moz_sql_parser.sql_parser import RESERVED
 
 
-VALID = re.compile(r'[a-zA-Z_]\w*')
+VALID = re.compile(r'[a-zA-Z_]\w*$')
+QUALIFIED = re.compile(r'[a-zA-Z_]\w*(\.[a-zA-Z_]\w*)+$')
+
+# how tightly operators bind, so that operands are parenthesized as needed
+PRECEDENCE = {
+    'or': 1,
+    'and': 2,
+    'not': 3,
+    'eq': 4,
+    'neq': 4,
+    'gt': 4,
+    'lt': 4,
+    'gte': 4,
+    'lte': 4,
+    'like': 4,
+    'nlike': 4,
+    'is': 4,
+    'in': 4,
+    'nin': 4,
+    'between': 4,
+    'not_between': 4,
+    'missing': 4,
+    'exists': 4,
+    'concat': 5,
+    'add': 6,
+    'mul': 7,
+    'mult': 7,
+    'neg': 8,
+}
+
+# operators where `a op (b op c)` is the same as `a op b op c`
+ASSOCIATIVE = {'or', 'and', 'concat', 'add', 'mul', 'mult'}
 
 
 def should_quote(identifier):
@@ -52,11 +83,11 @@ def escape(identifier, ansi_quotes, should_quote):
     return '{0}{1}{2}'.format(quote, identifier, quote)
 
 
-def Operator(op, parentheses=False):
+def Operator(op, parentheses=False, key=None):
     op = ' {0} '.format(op)
 
     def func(self, json):
-        out = op.join(self.dispatch(v) for v in json)
+        out = op.join(self.operand(v, key) for v in json)
         if parentheses:
             out = '({0})'.format(out)
         return out
@@ -78,19 +109,20 @@ class Formatter:
     ]
 
     # simple operators
-    _concat = Operator('||')
-    _mult = Operator('*')
+    _concat = Operator('||', key='concat')
+    _mult = Operator('*', key='mult')
+    _mul = Operator('*', key='mul')
     _div = Operator('/', parentheses=True)
-    _add = Operator('+')
+    _add = Operator('+', key='add')
     _sub = Operator('-', parentheses=True)
-    _neq = Operator('<>')
-    _gt = Operator('>')
-    _lt = Operator('<')
-    _gte = Operator('>=')
-    _lte = Operator('<=')
-    _eq = Operator('=')
-    _or = Operator('OR')
-    _and = Operator('AND')
+    _neq = Operator('<>', key='neq')
+    _gt = Operator('>', key='gt')
+    _lt = Operator('<', key='lt')
+    _gte = Operator('>=', key='gte')
+    _lte = Operator('<=', key='lte')
+    _eq = Operator('=', key='eq')
+    _or = Operator('OR', key='or')
+    _and = Operator('AND', key='and')
 
     def __init__(self, ansi_quotes=True, should_quote=should_quote):
         self.ansi_quotes = ansi_quotes
@@ -106,22 +138,48 @@ class Formatter:
         if isinstance(json, list):
             return self.delimited_list(json)
         if isinstance(json, dict):
+            if 'select' in json or 'union' in json:
+                return '({0})'.format(self.format(json))
             if 'value' in json:
                 return self.value(json)
             else:
                 return self.op(json)
         if isinstance(json, string_types):
-            return escape(json, self.ansi_quotes, self.should_quote)
+            return self.identifier(json)
 
         return text_type(json)
 
+    def identifier(self, json):
+        """Escape a column or table, escaping each part of qualified names."""
+        if QUALIFIED.match(json):
+            return '.'.join(
+                escape(part, self.ansi_quotes, self.should_quote)
+                for part in json.split('.')
+            )
+        return escape(json, self.ansi_quotes, self.should_quote)
+
+    def operand(self, json, key=None):
+        """Format the operand of an operator, in parentheses if needed."""
+        out = self.dispatch(json)
+        if key is None or not isinstance(json, dict) or len(json) != 1:
+            return out
+
+        child = PRECEDENCE.get(next(iter(json)))
+        parent = PRECEDENCE[key]
+        if child is not None and (
+            child < parent or (child == parent and key not in ASSOCIATIVE)
+        ):
+            out = '({0})'.format(out)
+        return out
+
     def delimited_list(self, json):
         return ', '.join(self.dispatch(element) for element in json)
 
     def value(self, json):
         parts = [self.dispatch(json['value'])]
         if 'name' in json:
-            parts.extend(['AS', self.dispatch(json['name'])])
+            name = escape(json['name'], self.ansi_quotes, self.should_quote)
+            parts.extend(['AS', name])
         return ' '.join(parts)
 
     def op(self, json):
@@ -143,32 +201,53 @@ class Formatter:
         return '{0}({1})'.format(key.upper(), self.dispatch(value))
 
     def _exists(self, value):
-        return '{0} IS NOT NULL'.format(self.dispatch(value))
+        return '{0} IS NOT NULL'.format(self.operand(value, 'exists'))
 
     def _missing(self, value):
-        return '{0} IS NULL'.format(self.dispatch(value))
+        return '{0} IS NULL'.format(self.operand(value, 'missing'))
 
     def _like(self, pair):
         return '{0} LIKE {1}'.format(
-            self.dispatch(pair[0]), self.dispatch(pair[1]))
+            self.operand(pair[0], 'like'), self.operand(pair[1], 'like'))
+
+    def _nlike(self, pair):
+        return '{0} NOT LIKE {1}'.format(
+            self.operand(pair[0], 'nlike'), self.operand(pair[1], 'nlike'))
 
     def _is(self, pair):
         return '{0} IS {1}'.format(
-            self.dispatch(pair[0]), self.dispatch(pair[1]))
+            self.operand(pair[0], 'is'), self.operand(pair[1], 'is'))
+
+    def _not(self, value):
+        return 'NOT {0}'.format(self.operand(value, 'not'))
 
-    def _in(self, json):
+    def _neg(self, value):
+        return '-{0}'.format(self.operand(value, 'neg'))
+
+    def _between(self, json):
+        return '{0} BETWEEN {1} AND {2}'.format(
+            *[self.operand(value, 'between') for value in json])
+
+    def _not_between(self, json):
+        return '{0} NOT BETWEEN {1} AND {2}'.format(
+            *[self.operand(value, 'not_between') for value in json])
+
+    def _in(self, json, op='IN'):
         valid = self.dispatch(json[1])
         # `(10, 11, 12)` does not get parsed as literal, so it's formatted as
         # `10, 11, 12`. This fixes it.
         if not valid.startswith('('):
             valid = '({0})'.format(valid)
 
-        return '{0} IN {1}'.format(json[0], valid)
+        return '{0} {1} {2}'.format(self.operand(json[0], 'in'), op, valid)
+
+    def _nin(self, json):
+        return self._in(json, 'NOT IN')
 
     def _case(self, checks):
         parts = ['CASE']
         for check in checks:
-            if isinstance(check, dict):
+            if isinstance(check, dict) and 'when' in check:
                 parts.extend(['WHEN', self.dispatch(check['when'])])
                 parts.extend(['THEN', self.dispatch(check['then'])])
             else:
@@ -233,9 +312,16 @@ class Formatter:
 
     def orderby(self, json):
         if 'orderby' in json:
-            sort = json['orderby'].get('sort', '').upper()
-            return 'ORDER BY {0} {1}'.format(
-                self.dispatch(json['orderby']), sort).strip()
+            orderby = json['orderby']
+            if not isinstance(orderby, list):
+                orderby = [orderby]
+            return 'ORDER BY {0}'.format(', '.join(
+                '{0} {1}'.format(
+                    self.dispatch(clause),
+                    clause.get('sort', '').upper(),
+                ).strip()
+                for clause in orderby
+            ))
 
     def limit(self, json):
         if 'limit' in json:
@@ -0,0 +1,309 @@
+"""
+Split queries into a part that runs in the API and a part that runs in SQLite.
+
+Queries the API can't run used to fall back to SQLite over the whole sheet.
+Often only the outer layers of a query are the problem, so the query is split
+instead: the `SELECT` reading the sheet runs in the API, with its filters,
+grouping and aggregations, and the rest of the query runs in SQLite over its
+results, which are much smaller than the sheet:
+
+- a subquery reading the sheet that the API supports runs there, and the
+  outer queries run in SQLite;
+- a grouped query runs its `WHERE`, `GROUP BY` and aggregations in the API,
+  and its `HAVING`, which becomes a `WHERE`, `DISTINCT`, `CASE`, `ORDER BY`
+  and `LIMIT` in SQLite.
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import namedtuple
+import copy
+import re
+
+from six import string_types
+
+from gsheetsdb.formatting import Formatter
+from gsheetsdb.parsing import ParsedQuery
+from gsheetsdb.pushdown import iter_sheet_readers
+from gsheetsdb.routing import find_unsupported, find_unsupported_expression
+from gsheetsdb.url import iter_tables
+
+
+AGGREGATIONS = {'avg', 'count', 'max', 'min', 'sum'}
+
+# the parser drops `OFFSET` after `ORDER BY` and `LIMIT`, so these queries
+# only run from their original SQL
+OFFSET_REGEX = re.compile(r'\boffset\b', re.IGNORECASE)
+
+# names of the results of the API that are not columns of the sheet
+RESULT_NAME = '__hybrid_{0}'
+
+# the query running in the API, the query running in SQLite, the name of the
+# table with the results of the first one in SQLite, and the original query
+HybridPlan = namedtuple('HybridPlan', ['remote', 'local', 'table', 'query'])
+
+
+def split_query(query):
+    """
+    Split a query into a part for the API and a part for SQLite.
+
+    Returns a `HybridPlan`, or `None` if the query can't be split, because it
+    reads the sheet more than once, or because the API can't run even the
+    innermost query.
+
+    """
+    query = ParsedQuery.wrap(query)
+    tree = query.tree
+    if tree is None or OFFSET_REGEX.search(query.sql):
+        return None
+
+    # the API already failed to run the whole query
+    if find_unsupported(tree) is None:
+        return None
+
+    # every reference to the sheet counts, since a direct JOIN needs the
+    # whole sheet and not the results of the API
+    readers = list(iter_sheet_readers(tree))
+    if len(readers) != 1 or len(list(iter_tables(tree))) != 1:
+        return None
+    reader = readers[0]
+
+    split = split_reader(reader)
+    if split is None:
+        return None
+    remote, replacement = split
+
+    formatter = Formatter()
+    local = replace_node(tree, reader, replacement)
+    return HybridPlan(
+        ParsedQuery.from_tree(remote, formatter.format(remote)),
+        ParsedQuery.from_tree(local, formatter.format(local)),
+        remote['from'],
+        query,
+    )
+
+
+def split_reader(reader):
+    """
+    Split the query reading the sheet.
+
+    Returns the query for the API, and the query replacing the original one
+    in SQLite, reading the results from a table with the name of the sheet.
+
+    """
+    from_ = reader['from']
+    if isinstance(from_, dict):
+        reader = strip_qualifier(copy.deepcopy(reader), from_.get('name'))
+        reader['from'] = from_ = from_['value']
+    else:
+        reader = copy.deepcopy(reader)
+
+    if find_unsupported(reader) is None:
+        remote = name_results(reader)
+        if remote is None:
+            return None
+        return remote, {'select': '*', 'from': from_}
+
+    return split_aggregation(reader)
+
+
+def split_aggregation(reader):
+    """
+    Split a grouped query, running the aggregations in the API.
+
+    The API computes the `GROUP BY` expressions and all the aggregations in
+    the query, and SQLite the expressions using them.
+
+    """
+    for clause in ('where', 'groupby'):
+        if find_unsupported_expression(reader.get(clause)) is not None:
+            return None
+
+    select = as_list(reader['select'])
+    groupby = [clause['value'] for clause in as_list(reader.get('groupby'))]
+    if any(not isinstance(clause, dict) for clause in select) or any(
+        isinstance(expression, (int, float)) for expression in groupby
+    ):
+        # `SELECT *` and `GROUP BY 1`
+        return None
+
+    orderby = as_list(reader.get('orderby'))
+    expressions = list(groupby)
+    for json in [select, reader.get('having'), orderby]:
+        for aggregation in iter_aggregations(json):
+            if find_unsupported_expression(aggregation) is not None:
+                return None
+            if aggregation not in expressions:
+                expressions.append(aggregation)
+    if not expressions:
+        return None
+
+    names = [
+        expression if isinstance(expression, string_types)
+        else RESULT_NAME.format(i)
+        for i, expression in enumerate(expressions)
+    ]
+    results = list(zip(expressions, names))
+    remote = {
+        'select': [
+            {'value': expression, 'name': name} for expression, name in results
+        ],
+        'from': reader['from'],
+    }
+    for clause in ('where', 'groupby'):
+        if clause in reader:
+            remote[clause] = reader[clause]
+
+    local = {
+        'select': [
+            get_local_clause(clause, results) for clause in select],
+        'from': reader['from'],
+    }
+    if 'having' in reader:
+        local['where'] = rewrite(reader['having'], results)
+    if orderby:
+        local['orderby'] = [
+            dict(clause, value=rewrite(clause['value'], results))
+            for clause in orderby
+        ]
+    if 'limit' in reader:
+        local['limit'] = reader['limit']
+
+    # the columns of the sheet are not available in SQLite, only the results
+    aliases = {clause['name'] for clause in select if 'name' in clause}
+    if not all(
+        name in aliases or name in names
+        for json in [local['select'], local.get('where'), local.get('orderby')]
+        for name in iter_names(json)
+    ):
+        return None
+
+    return remote, local
+
+
+def get_local_clause(clause, results):
+    """
+    Rewrite a `SELECT` clause, naming it after the original expression.
+
+    The name lets outer queries refer to the clause, but it's normalized by
+    the formatter, so the names of the final results are taken from the
+    original query instead (see `gsheetsdb.sqlite.execute_plan`).
+
+    """
+    value = clause['value']
+    local = {'value': rewrite(value, results)}
+    name = clause.get('name')
+    if name is None:
+        if isinstance(value, dict) and 'distinct' in value:
+            value = value['distinct']
+        if isinstance(value, string_types):
+            name = value
+        else:
+            name = Formatter().dispatch(value)
+    if name != local['value']:
+        local['name'] = name
+    return local
+
+
+def name_results(reader):
+    """Name all the results of a query, as SQLite would name them."""
+    select = reader['select']
+    if select == '*':
+        return reader
+
+    formatter = Formatter()
+    names = set()
+    for clause in as_list(select):
+        if not isinstance(clause, dict):
+            return None
+        if 'name' not in clause:
+            value = clause['value']
+            clause['name'] = (
+                value if isinstance(value, string_types)
+                else formatter.dispatch(value))
+        if clause['name'] in names:
+            return None
+        names.add(clause['name'])
+
+    return reader
+
+
+def strip_qualifier(json, alias):
+    """Remove a table alias from qualified column names, eg, `t.country`."""
+    if alias is None:
+        return json
+    prefix = '{0}.'.format(alias)
+    if isinstance(json, string_types) and json.startswith(prefix):
+        return json[len(prefix):]
+    if isinstance(json, list):
+        return [strip_qualifier(element, alias) for element in json]
+    if isinstance(json, dict) and 'literal' not in json:
+        return {
+            key: strip_qualifier(value, alias) if key != 'from' else value
+            for key, value in json.items()
+        }
+    return json
+
+
+def iter_aggregations(json):
+    if isinstance(json, list):
+        for element in json:
+            for aggregation in iter_aggregations(element):
+                yield aggregation
+    elif isinstance(json, dict) and 'literal' not in json:
+        if len(json) == 1 and next(iter(json)) in AGGREGATIONS:
+            yield json
+            return
+        for value in json.values():
+            for aggregation in iter_aggregations(value):
+                yield aggregation
+
+
+def rewrite(json, results):
+    """Replace expressions computed by the API with the names of results."""
+    for expression, name in results:
+        if json == expression:
+            return name
+    if isinstance(json, list):
+        return [rewrite(element, results) for element in json]
+    if isinstance(json, dict) and 'literal' not in json:
+        return {key: rewrite(value, results) for key, value in json.items()}
+    return json
+
+
+def iter_names(json):
+    """Generate the names in expressions, except for aliases and literals."""
+    if isinstance(json, string_types):
+        yield json
+    elif isinstance(json, list):
+        for element in json:
+            for name in iter_names(element):
+                yield name
+    elif isinstance(json, dict) and 'literal' not in json:
+        for key, value in json.items():
+            if key not in ('name', 'sort'):
+                for name in iter_names(value):
+                    yield name
+
+
+def replace_node(json, node, replacement):
+    """Return a copy of a parsed query, with a node replaced."""
+    if json is node:
+        return replacement
+    if isinstance(json, list):
+        return [replace_node(element, node, replacement) for element in json]
+    if isinstance(json, dict):
+        return {
+            key: replace_node(value, node, replacement)
+            for key, value in json.items()
+        }
+    return json
+
+
+def as_list(json):
+    if json is None:
+        return []
+    return json if isinstance(json, list) else [json]
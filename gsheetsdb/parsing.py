@@ -0,0 +1,77 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import copy
+
+from moz_sql_parser import parse as parse_sql
+import pyparsing
+
+from gsheetsdb.exceptions import ProgrammingError
+from gsheetsdb.utils import format_moz_error
+
+
+class ParsedQuery(object):
+
+    """
+    A SQL query that is parsed at most once.
+
+    Parsing with `moz_sql_parser` is the most expensive step when running a
+    query, so a single `ParsedQuery` is built for each query and passed along
+    to URL extraction, translation and the SQLite fallback. The query is only
+    parsed when the tree is first needed.
+
+    """
+
+    def __init__(self, sql):
+        self.sql = sql
+
+        self._parsed = False
+        self._tree = None
+        self._error = None
+
+    @classmethod
+    def wrap(cls, query):
+        """Build a `ParsedQuery` from a string, if needed."""
+        if isinstance(query, cls):
+            return query
+        return cls(query)
+
+    @classmethod
+    def from_tree(cls, tree, sql):
+        """Build a `ParsedQuery` from a tree and its SQL, without parsing."""
+        query = cls(sql)
+        query._tree = tree
+        query._parsed = True
+        return query
+
+    @property
+    def tree(self):
+        """The parsed query, or `None` if the query is not valid."""
+        if not self._parsed:
+            try:
+                self._tree = parse_sql(self.sql)
+            except pyparsing.ParseException as e:
+                self._error = e
+            self._parsed = True
+
+        return self._tree
+
+    def check(self):
+        """Raise `ProgrammingError` if the query is not valid."""
+        if self.tree is None:
+            raise ProgrammingError(format_moz_error(self.sql, self._error))
+
+    def copy(self):
+        """
+        Return a copy of the parsed query that can be modified in place.
+
+        Raises `ProgrammingError` if the query is not valid.
+
+        """
+        self.check()
+        return copy.deepcopy(self._tree)
+
+    def __str__(self):
+        return self.sql
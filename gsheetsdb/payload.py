@@ -0,0 +1,223 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import csv
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+# the JSON payload has this in the beginning
+LEADING = ")]}'\n"
+LEADING_BYTES = LEADING.encode('utf-8')
+
+# the rows of the table follow this key
+ROWS = '"rows":'
+
+WHITESPACE = ' \t\r\n'
+
+# drop consumed text from the buffer once it's larger than this
+MAX_CONSUMED = 64 * 1024
+
+# parse CSV values, for the types that can be read from CSV
+csv_parsers = {
+    'string': lambda value: value,
+    'number': float,
+    'boolean': lambda value: value.upper() == 'TRUE',
+}
+
+
+def compact_object(obj):
+    """
+    Object hook that replaces cells by their values, and rows by tuples.
+
+    Cells are the only objects with a `v`, and rows the only ones with a
+    `c`; the formatted values in `f` are dropped.
+
+    """
+    if 'v' in obj:
+        return obj['v']
+    if 'c' in obj:
+        return tuple(obj['c'])
+    return obj
+
+
+decoder = json.JSONDecoder()
+compact_decoder = json.JSONDecoder(object_hook=compact_object)
+
+
+def decode_payload(content, compact=False):
+    """
+    Decode a payload from the bytes of a response.
+
+    With `compact` each row is decoded into a tuple of raw cell values,
+    without building the intermediate dictionaries. Otherwise the payload is
+    decoded with `orjson` or `ujson`, if installed.
+
+    """
+    start = len(LEADING) if content.startswith(LEADING_BYTES) else 0
+
+    if not compact:
+        if orjson is not None:
+            return orjson.loads(memoryview(content)[start:])
+        if ujson is not None:
+            return ujson.loads(content[start:])
+
+    text = content.decode('utf-8')
+    start = json.decoder.WHITESPACE.match(text, start).end()
+    payload, end = (compact_decoder if compact else decoder).raw_decode(
+        text, start)
+    if text[end:].strip():
+        raise ValueError('Extra data after payload')
+
+    return payload
+
+
+def close_json(prefix):
+    """
+    Return the characters needed to close all containers open in `prefix`.
+
+        >>> close_json('{"table": {"cols": [1, 2')
+        ']}}'
+
+    """
+    stack = []
+    in_string = escaped = False
+    for char in prefix:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]':
+            stack.pop()
+
+    return ''.join(reversed(stack))
+
+
+def decode_stream(chunks, compact=False):
+    """
+    Decode a payload incrementally from an iterable of text chunks.
+
+    Everything up to the rows of the table is decoded eagerly, so that the
+    status, errors and columns can be inspected right away; the returned
+    payload has a generator in `table.rows` that decodes one row at a time,
+    reading more chunks only as needed. With `compact` rows are decoded into
+    tuples of values, like in `decode_payload`.
+
+    """
+    chunks = iter(chunks)
+    buffer = ''
+    start = None
+    for chunk in chunks:
+        buffer += chunk
+        if buffer.startswith(LEADING):
+            buffer = buffer[len(LEADING):]
+
+        index = buffer.find(ROWS)
+        if index != -1:
+            start = buffer.find('[', index + len(ROWS))
+            if start != -1:
+                break
+
+    # errors have no rows, and are small
+    if start is None or start == -1:
+        return json.loads(buffer)
+
+    prefix = buffer[:start]
+    payload = json.loads(prefix + '[]' + close_json(prefix))
+    payload['table']['rows'] = iter_rows(
+        buffer, start + 1, chunks, compact_decoder if compact else decoder)
+
+    return payload
+
+
+def iter_rows(buffer, position, chunks, decoder=decoder):
+    """Decode the rows of a table, starting at `position` in `buffer`."""
+    while True:
+        while position < len(buffer) and buffer[position] in WHITESPACE + ',':
+            position += 1
+
+        if position < len(buffer):
+            if buffer[position] == ']':
+                return
+            try:
+                row, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                pass  # incomplete row
+            else:
+                yield row
+                if position > MAX_CONSUMED:
+                    buffer = buffer[position:]
+                    position = 0
+                continue
+
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise ValueError('Unexpected end of payload')
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_lines(chunks):
+    """Split text chunks into lines, keeping the line endings for `csv`."""
+    pending = ''
+    for chunk in chunks:
+        lines = (pending + chunk).splitlines(True)
+        pending = ''
+        if lines and not lines[-1].endswith(('\r', '\n')):
+            pending = lines.pop()
+        for line in lines:
+            yield line
+
+    if pending:
+        yield pending
+
+
+def decode_csv(chunks, cols):
+    """
+    Decode a CSV response into a payload with compact rows.
+
+    The CSV output has no types, so the columns of the sheet are passed in
+    `cols`, and used to parse the values; only string, number and boolean
+    columns are supported, and empty values are NULL. Rows are decoded
+    lazily, as in `decode_stream`.
+
+    Raises `ValueError` if the header doesn't match the columns.
+
+    """
+    reader = csv.reader(iter_lines(chunks))
+    header = next(reader, [])
+    if header != [col['label'] for col in cols]:
+        raise ValueError('Unexpected columns in CSV: {0}'.format(header))
+
+    parsers = [csv_parsers[col['type']] for col in cols]
+    rows = (
+        tuple(
+            None if value == '' else parse(value)
+            for parse, value in zip(parsers, row)
+        )
+        for row in reader
+        if row
+    )
+
+    return {
+        'status': 'ok',
+        'table': {'cols': [dict(col) for col in cols], 'rows': rows},
+    }
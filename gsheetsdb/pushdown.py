@@ -0,0 +1,251 @@
+"""
+Push projections and filters into the sheet fetched for SQLite.
+
+Queries running in SQLite used to fetch the whole sheet. When the query
+references only some columns, or filters the sheet with conditions the API
+understands, the sheet can be fetched with those columns and conditions
+instead, so that less data is downloaded and loaded into SQLite.
+
+Only conditions that give the same results in the API and in SQLite are
+pushed: comparisons between a number or string column and a literal of the
+same type, and `IS [NOT] NULL`, combined with `OR`, in the top-level `AND`
+of the only `WHERE` clause reading the sheet.
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import logging
+
+from six import string_types
+
+from gsheetsdb.payload import csv_parsers
+from gsheetsdb.translator import translate
+from gsheetsdb.url import iter_tables
+
+
+logger = logging.getLogger(__name__)
+
+COMPARISONS = {'eq', 'gt', 'gte', 'lt', 'lte'}
+
+
+def get_pushdown_query(query, cols, formatted_values=False):
+    """
+    Return the query fetching only the data of the sheet needed by `query`.
+
+    `cols` are the columns of the sheet (see `get_schema`). Returns the query,
+    and the columns of its results if they can be requested as CSV (see
+    `run_query`); or `(None, None)` if the whole sheet is needed.
+
+    """
+    tree = query.tree
+    if tree is None:
+        return None, None
+
+    names = OrderedDict((get_name(col).lower(), col) for col in cols)
+    projection = get_projection(tree, names)
+    where = get_pushed_filter(tree, names)
+    if projection is None and where is None:
+        return None, None
+
+    fetch_cols = projection or list(names.values())
+    fetch = {
+        'select': [{'value': get_name(col)} for col in fetch_cols],
+        'from': '',
+    }
+    if where is not None:
+        fetch['where'] = where
+
+    column_map = {get_name(col): col['id'] for col in cols}
+    fetch_query = translate(fetch, column_map, formatted_values)
+    logger.info('Pushed down query: {0}'.format(fetch_query))
+
+    csv_cols = None
+    if not formatted_values and all(
+            col['type'] in csv_parsers for col in fetch_cols):
+        csv_cols = fetch_cols
+
+    return fetch_query, csv_cols
+
+
+def get_name(col):
+    """Return the name of a column in SQLite (see `create_table`)."""
+    return col['label'] or col['id']
+
+
+def get_projection(tree, names):
+    """
+    Return the columns referenced by a query, in the order of the sheet.
+
+    Returns `None` if all columns are needed, because the query selects `*`
+    or doesn't reference any column.
+
+    """
+    if selects_all(tree):
+        return None
+
+    referenced = set()
+    for identifier in iter_identifiers(tree):
+        name = resolve(identifier, names)
+        if name is not None:
+            referenced.add(name)
+
+    if not referenced or len(referenced) == len(names):
+        return None
+
+    return [col for name, col in names.items() if name in referenced]
+
+
+def selects_all(json):
+    if isinstance(json, list):
+        return any(selects_all(element) for element in json)
+    if not isinstance(json, dict):
+        return False
+
+    if 'select' in json:
+        select = json['select']
+        for clause in select if isinstance(select, list) else [select]:
+            if isinstance(clause, dict):
+                clause = clause.get('value')
+            if isinstance(clause, string_types) and (
+                clause == '*' or clause.endswith('.*')
+            ):
+                return True
+
+    return any(selects_all(value) for value in json.values())
+
+
+def iter_identifiers(json):
+    """
+    Generate the strings in a parsed query, except for literals.
+
+    These include tables and aliases besides columns, but only the ones
+    naming a column of the sheet are used.
+
+    """
+    if isinstance(json, string_types):
+        yield json
+    elif isinstance(json, list):
+        for element in json:
+            for identifier in iter_identifiers(element):
+                yield identifier
+    elif isinstance(json, dict) and 'literal' not in json:
+        for value in json.values():
+            for identifier in iter_identifiers(value):
+                yield identifier
+
+
+def resolve(identifier, names):
+    """Return the lowercase name of the column an identifier refers to."""
+    identifier = identifier.lower()
+    if identifier in names:
+        return identifier
+    if '.' in identifier:
+        # qualified by the table or its alias
+        identifier = identifier.split('.', 1)[1]
+        if identifier in names:
+            return identifier
+    return None
+
+
+def get_pushed_filter(tree, names):
+    """Return the conditions that can filter the sheet in the API."""
+    readers = list(iter_sheet_readers(tree))
+    if len(readers) != 1 or len(list(iter_tables(tree))) != 1:
+        # the sheet is read more than once, eg, by a subquery or a JOIN,
+        # even directly as a table
+        return None
+
+    where = readers[0].get('where')
+    if where is None:
+        return None
+
+    conjuncts = where['and'] if 'and' in where else [where]
+    pushed = []
+    for conjunct in conjuncts:
+        condition = get_condition(conjunct, names)
+        if condition is not None:
+            pushed.append(condition)
+
+    if not pushed:
+        return None
+    return pushed[0] if len(pushed) == 1 else {'and': pushed}
+
+
+def iter_sheet_readers(json):
+    """Generate the `SELECT`s in a parsed query reading from the sheet."""
+    if isinstance(json, list):
+        for element in json:
+            for reader in iter_sheet_readers(element):
+                yield reader
+    elif isinstance(json, dict):
+        from_ = json.get('from')
+        if isinstance(from_, dict):
+            from_ = from_.get('value')
+        if 'select' in json and isinstance(from_, string_types):
+            yield json
+        for value in json.values():
+            for reader in iter_sheet_readers(value):
+                yield reader
+
+
+def get_condition(json, names):
+    """
+    Return a condition using column names, if it can run in the API.
+
+    `NOT` is never pushed, since it's not parsed with the same precedence
+    as in SQLite, and neither are `LIKE`, which is case sensitive only in
+    the API, and `!=`, which is true for empty cells only in the API.
+
+    """
+    if not isinstance(json, dict) or len(json) != 1:
+        return None
+    op, args = next(iter(json.items()))
+
+    if op == 'or':
+        conditions = [get_condition(arg, names) for arg in args]
+        if None in conditions:
+            return None
+        return {'or': conditions}
+
+    if op in ('missing', 'exists'):
+        name = resolve_column(args, names)
+        if name is None:
+            return None
+        return {op: get_name(names[name])}
+
+    if op in COMPARISONS and len(args) == 2:
+        resolved = [resolve_column(arg, names) for arg in args]
+        if resolved.count(None) != 1:
+            return None
+        i = 0 if resolved[0] is not None else 1
+        col, literal = names[resolved[i]], args[1 - i]
+        if not is_compatible(literal, col['type']):
+            return None
+        operands = [get_name(col), literal]
+        return {op: operands if i == 0 else operands[::-1]}
+
+    return None
+
+
+def resolve_column(json, names):
+    if isinstance(json, string_types):
+        return resolve(json, names)
+    return None
+
+
+def is_compatible(literal, type_):
+    """Return whether a literal compares the same way in the API and SQLite."""
+    if type_ == 'number':
+        return (
+            isinstance(literal, (int, float)) and
+            not isinstance(literal, bool))
+    if type_ == 'string':
+        return (
+            isinstance(literal, dict) and
+            list(literal) == ['literal'] and
+            isinstance(literal['literal'], string_types))
+    return False
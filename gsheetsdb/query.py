@@ -3,49 +3,323 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from collections import OrderedDict
-import json
+from collections import namedtuple, OrderedDict
+import copy
 import logging
 
-from google.auth.transport.requests import AuthorizedSession
-from moz_sql_parser import parse as parse_sql
-import pyparsing
-from requests import Session
 from six.moves.urllib import parse
 
-from gsheetsdb.convert import convert_rows
+from gsheetsdb.auth import (
+    credentials_manager,
+    get_credentials_identity,
+    is_shared_identity,
+)
+from gsheetsdb.cache import LRUCache, SingleFlight
+from gsheetsdb.columnar import convert_columns
+from gsheetsdb.convert import convert_rows, iter_convert_rows
 from gsheetsdb.exceptions import InterfaceError, ProgrammingError
+from gsheetsdb.parsing import ParsedQuery
+from gsheetsdb.payload import (  # noqa: F401
+    csv_parsers,
+    decode_csv,
+    decode_payload,
+    decode_stream,
+    LEADING,  # kept here for backwards compatibility
+)
 from gsheetsdb.processors import processors
-from gsheetsdb.translator import extract_column_aliases, translate
+from gsheetsdb.scheduler import BACKGROUND, INTERACTIVE, scheduler
+from gsheetsdb.transport import get_session
+from gsheetsdb.translator import extract_column_aliases, NO_FORMAT, translate
 from gsheetsdb.types import Type
-from gsheetsdb.url import extract_url, get_url
-from gsheetsdb.utils import format_gsheet_error, format_moz_error
+from gsheetsdb.url import extract_url, get_max_age, get_url, normalize_url
+from gsheetsdb.utils import format_gsheet_error
 
 
 logger = logging.getLogger(__name__)
 
-# the JSON payload has this in the beginning
-LEADING = ")]}'\n"
+# size of the chunks read when streaming results
+CHUNK_SIZE = 64 * 1024
 
+# the API reports this when a query references a column that doesn't exist
+NO_COLUMN = 'NO_COLUMN'
 
-def get_column_map(url, credentials=None):
-    query = 'SELECT * LIMIT 0'
-    result = run_query(url, query, credentials)
-    return OrderedDict(
-        sorted((col['label'], col['id']) for col in result['table']['cols']))
+# the API reports this when the data matches the signature in the request
+NOT_MODIFIED = 'not_modified'
 
+# columns of each sheet, keyed by URL and credentials identity
+column_map_cache = LRUCache(max_entries=1000, ttl=300)
 
-def run_query(baseurl, query, credentials=None):
-    url = '{baseurl}&tq={query}'.format(
-        baseurl=baseurl, query=parse.quote(query, safe='/()'))
+# translated queries, keyed by SQL and headers
+translation_cache = LRUCache(max_entries=1000)
+
+# requests in progress, keyed like the result cache; concurrent queries for
+# the same results wait for the same request, including schema probes
+inflight_requests = SingleFlight()
+
+
+# queries returning the whole sheet, whose columns are known from the schema
+FULL_SHEET_QUERY = 'SELECT * {options}'.format(options=NO_FORMAT)
+
+# queries whose results are kept in the snapshot store
+SNAPSHOT_QUERIES = (FULL_SHEET_QUERY, 'SELECT *')
+
+
+# Everything needed to run a query, except for the actual request. Plans are
+# shared between executions, so they should not be modified; in particular,
+# `processors` should be copied before calling `post_process`.
+Plan = namedtuple('Plan', [
+    'baseurl',
+    'max_age',
+    'column_map',
+    'translated_query',
+    'original_aliases',
+    'processed_aliases',
+    'processors',
+])
+
+
+def get_schema_key(url, credentials=None):
+    return normalize_url(url), get_credentials_identity(credentials)
+
+
+def get_cached_schema(url, credentials=None):
+    """Return the cached columns of a sheet, or `None`."""
+    return column_map_cache.get(get_schema_key(url, credentials))
+
+
+def get_schema(url, credentials=None, session=None, snapshots=None):
+    """
+    Return the columns of a sheet, with their ids, labels and types.
+
+    The columns are fetched with a `SELECT * LIMIT 0` query, and cached in
+    `column_map_cache` so that subsequent queries don't need the extra
+    request. Sheets with a fresh snapshot in `snapshots` are not requested.
+
+    """
+    key = get_schema_key(url, credentials)
+    cols = column_map_cache.get(key)
+    if cols is None and snapshots is not None:
+        cols = get_snapshot_cols(snapshots, url, credentials)
+        if cols is not None:
+            column_map_cache.set(key, cols)
+    if cols is None:
+        query = 'SELECT * LIMIT 0'
+        result = run_query(
+            url, query, credentials, session, priority=BACKGROUND)
+        cols = result['table']['cols']
+        column_map_cache.set(key, cols)
+
+    return cols
+
+
+def invalidate_schema(url=None, credentials=None):
+    """
+    Remove cached columns.
+
+    If no URL is passed the whole cache is cleared; otherwise only entries for
+    the URL are removed, optionally restricted to given credentials.
+
+    """
+    if url is None:
+        column_map_cache.invalidate()
+        return
+
+    url = normalize_url(url)
+    identity = get_credentials_identity(credentials)
+    column_map_cache.invalidate(
+        lambda key: key[0] == url and (
+            credentials is None or key[1] == identity))
+
+
+def get_column_map(url, credentials=None, session=None, snapshots=None):
+    return make_column_map(get_schema(url, credentials, session, snapshots))
+
+
+def make_column_map(cols):
+    return OrderedDict(sorted((col['label'], col['id']) for col in cols))
+
+
+def copy_payload(payload):
+    """
+    Copy a payload, so that cached payloads are not modified.
+
+    Only the parts modified by the post-processors and `execute` are copied:
+    the column definitions and the list of cells in each row. Compact rows
+    are tuples, and are not copied.
+
+    """
+    payload = dict(payload)
+    if 'table' in payload:
+        table = payload['table'] = dict(payload['table'])
+        table['cols'] = [dict(col) for col in table['cols']]
+        if 'rows' in table:
+            table['rows'] = [
+                row if isinstance(row, tuple) else dict(row)
+                for row in table['rows']
+            ]
+
+    return payload
+
+
+def run_query(
+    baseurl,
+    query,
+    credentials=None,
+    session=None,
+    result_cache=None,
+    max_age=None,
+    stream=False,
+    compact=False,
+    cols=None,
+    priority=INTERACTIVE,
+    snapshots=None,
+):
+    """
+    Run a query against the API, returning the decoded payload.
+
+    With `stream` the response is read in chunks, and the rows in the payload
+    are a generator that decodes them lazily (see `decode_stream`); streamed
+    payloads are never stored in the result cache.
+
+    With `compact` each row in the payload is a tuple of cell values, instead
+    of a dictionary of cells (see `decode_payload`).
+
+    When the columns of the result are known in advance, as in `SELECT *`,
+    they can be passed in `cols`: the results are then requested as CSV,
+    which is much smaller and faster to parse, and returned with compact
+    rows (see `decode_csv`).
+
+    If a `result_cache` is passed successful payloads are cached, keyed by the
+    query, URL and credentials identity; `max_age` overrides the TTL of the
+    cache for this query.
+
+    Expired payloads are revalidated by sending their signature (`sig`) to
+    the API, which then answers with a short `not_modified` error instead of
+    the full payload if the data hasn't changed. CSV responses have no
+    signature, so expired CSV results are requested as JSON, which has one.
+
+    Concurrent calls for the same results share a single request, and each
+    gets its own copy of the payload (see `inflight_requests`).
+
+    Requests go through the `scheduler`, which applies the rate limit, with
+    the given `priority`, and retries throttled requests and server errors.
+
+    Whole sheets with compact rows are also read from and stored in the
+    `snapshots` store, if any, which is checked after the result cache (see
+    `fetch_snapshot`).
+
+    """
+    key = get_result_key(baseurl, query, credentials, compact, cols)
+    payload, stale = get_cached_result(
+        result_cache, key, revalidate=not stream, csv=cols is not None)
+    if payload is not None:
+        return payload
+
+    snapshot_key = None
+    if snapshots is not None and compact and not stream:
+        snapshot_key = get_snapshot_key(baseurl, query, credentials)
+    if snapshot_key is not None:
+        payload = snapshots.get(snapshot_key)
+        if payload is not None:
+            return cache_result(result_cache, key, payload)
+
+    args = (
+        key,
+        baseurl,
+        query,
+        credentials,
+        session,
+        result_cache,
+        max_age,
+        stream,
+        compact,
+        cols,
+        stale,
+        priority,
+    )
+
+    # streamed payloads are read only once, so they can't be shared
+    if stream:
+        return fetch_payload(*args)
+
+    if snapshot_key is not None:
+        payload, shared = inflight_requests.do(
+            key, fetch_snapshot, snapshots, snapshot_key, args)
+    else:
+        payload, shared = inflight_requests.do(key, fetch_payload, *args)
+    return copy_payload(payload) if shared else payload
+
+
+def fetch_snapshot(snapshots, snapshot_key, args, force=False):
+    """
+    Fetch a whole sheet with `fetch_payload`, and store it in `snapshots`.
+
+    The sheet is locked while it's fetched, so that only one process
+    downloads it; the others wait, and then read the new snapshot.
+
+    An expired snapshot is revalidated with its signature, like the result
+    cache (see `run_query`), and kept if the sheet didn't change. With
+    `force` the snapshot is revalidated even if it hasn't expired.
+
+    """
+    key, result_cache, max_age, stale = args[0], args[5], args[6], args[10]
+    with snapshots.lock(snapshot_key):
+        payload = None if force else snapshots.get(snapshot_key)
+        if payload is not None:
+            return cache_result(result_cache, key, payload)
+
+        snapshot = None
+        if stale is None:
+            snapshot = snapshots.get_stale(snapshot_key)
+            args = args[:10] + (snapshot,) + args[11:]
+
+        payload = fetch_payload(*args)
+        if snapshot is not None and is_same_payload(payload, snapshot):
+            snapshots.refresh(snapshot_key)
+            return cache_result(result_cache, key, payload)
+        if is_cacheable(payload):
+            snapshots.set(snapshot_key, payload, max_age)
+
+    return payload
+
+
+def is_same_payload(payload, stale):
+    """Return whether a payload is the revalidated `stale` payload."""
+    sig = stale.value.get('sig')
+    return sig is not None and payload.get('sig') == sig
+
+
+def fetch_payload(
+    key,
+    baseurl,
+    query,
+    credentials,
+    session,
+    result_cache,
+    max_age,
+    stream,
+    compact,
+    cols,
+    stale,
+    priority,
+):
+    """Make the request for `run_query`, and decode the response."""
+    url = get_query_url(baseurl, query, cols, stale)
     headers = {'X-DataSource-Auth': 'true'}
 
+    # reuse the pooled session from the connection, if any
+    if session is None:
+        session = get_session(credentials)
+
+    # refresh the shared token ahead of time, so the session doesn't have to
     if credentials:
-        session = AuthorizedSession(credentials)
-    else:
-        session = Session()
+        credentials_manager.ensure_valid(credentials)
 
-    r = session.get(url, headers=headers)
+    r = scheduler.request(
+        get_credentials_identity(credentials),
+        lambda: session.get(url, headers=headers, stream=stream),
+        priority,
+    )
     if r.encoding is None:
         r.encoding = 'utf-8'
 
@@ -53,14 +327,227 @@ def run_query(baseurl, query, credentials=None):
     if r.status_code != 200:
         raise ProgrammingError(r.text)
 
-    if r.text.startswith(LEADING):
-        result = json.loads(r.text[len(LEADING):])
-    else:
-        result = r.json()
+    # errors are still sent as JSON
+    csv = cols is not None and is_csv(r)
+    if stream:
+        chunks = r.iter_content(CHUNK_SIZE, decode_unicode=True)
+        if csv:
+            return read_csv(chunks, cols, baseurl, credentials, stream)
+        return decode_stream(chunks, compact)
+
+    result = decode_result(
+        r.content, csv, compact, cols, baseurl, credentials, r.encoding)
+    return cache_result(
+        result_cache, key, result, stale, len(r.content), max_age)
+
+
+def get_result_key(baseurl, query, credentials=None, compact=False, cols=None):
+    return (
+        normalize_url(baseurl),
+        query,
+        get_credentials_identity(credentials),
+        compact,
+        cols is not None,
+    )
+
+
+def get_snapshot_key(baseurl, query, credentials=None):
+    """
+    Return the key of the results of a query in the snapshot store.
+
+    Returns `None` if the results are not kept in the store: only whole
+    sheets are, and only for credentials that are identified the same way in
+    every process, ie, service accounts, user credentials with a refresh
+    token, or no credentials at all.
+
+    """
+    identity = get_credentials_identity(credentials)
+    if query not in SNAPSHOT_QUERIES:
+        return None
+    if not is_shared_identity(identity):
+        return None
+
+    return normalize_url(baseurl), query, identity
+
+
+def get_snapshot_cols(snapshots, url, credentials=None):
+    """Return the columns of a sheet from a fresh snapshot, or `None`."""
+    for query in SNAPSHOT_QUERIES:
+        key = get_snapshot_key(url, query, credentials)
+        cols = key and snapshots.get_cols(key)
+        if cols is not None:
+            return cols
+
+    return None
+
+
+def warm_snapshot(snapshots, url, headers=0, credentials=None, session=None):
+    """
+    Store a fresh snapshot of a sheet, even if the current one hasn't expired.
+
+    The current snapshot is revalidated with its signature, if it has one,
+    so that an unchanged sheet is not downloaded again. Returns the number of
+    rows in the sheet.
+
+    """
+    baseurl = get_url(url, headers)
+    snapshot_key = get_snapshot_key(baseurl, FULL_SHEET_QUERY, credentials)
+    if snapshot_key is None:
+        raise InterfaceError(
+            'Snapshots need service account credentials, user credentials '
+            'with a refresh token, or no credentials')
+
+    get_schema(baseurl, credentials, session, snapshots)
+    cols = get_csv_cols(baseurl, FULL_SHEET_QUERY, credentials)
+    args = (
+        get_result_key(baseurl, FULL_SHEET_QUERY, credentials, True, cols),
+        baseurl,
+        FULL_SHEET_QUERY,
+        credentials,
+        session,
+        None,
+        get_max_age(url),
+        False,
+        True,
+        cols,
+        None,
+        INTERACTIVE,
+    )
+    payload = fetch_snapshot(snapshots, snapshot_key, args, force=True)
+
+    return len(payload['table']['rows'])
+
+
+def get_cached_result(result_cache, key, revalidate=True, csv=False):
+    """
+    Look up a payload in the result cache.
+
+    Returns a copy of the cached payload, or `None`, and the expired entry
+    that should be revalidated, if any. Entries without a signature can't be
+    revalidated, except for `csv` results: these are then fetched as JSON,
+    to get a signature for the next time (see `get_query_url`).
+
+    """
+    if result_cache is None:
+        return None, None
+
+    payload = result_cache.get(key)
+    if payload is not None:
+        return copy_payload(payload), None
+
+    stale = result_cache.get_stale(key) if revalidate else None
+    if stale is not None and not csv and not stale.value.get('sig'):
+        stale = None
+
+    return None, stale
+
+
+def get_query_url(baseurl, query, cols=None, stale=None):
+    """
+    Build the URL for a query.
+
+    Results are requested as CSV when their columns are passed in `cols`,
+    and only if modified when revalidating a `stale` cache entry. CSV
+    responses have no signature, so revalidation always uses JSON.
+
+    """
+    url = '{baseurl}&tq={query}'.format(
+        baseurl=baseurl, query=parse.quote(query, safe='/()'))
+
+    if stale is not None:
+        sig = stale.value.get('sig')
+        if sig:
+            url = '{url}&tqx=sig:{sig}'.format(url=url, sig=sig)
+    elif cols is not None:
+        url = '{url}&tqx=out:csv'.format(url=url)
+
+    return url
+
+
+def cache_result(result_cache, key, result, stale=None, size=0, max_age=None):
+    """
+    Store a successful payload in the result cache.
+
+    Returns the payload that should be used: if the data didn't change since
+    the `stale` entry was cached, this is a copy of the cached payload.
+
+    """
+    if stale is not None and is_not_modified(result):
+        if result_cache is not None:
+            result_cache.refresh(key)
+        return copy_payload(stale.value)
+
+    if result_cache is not None and is_cacheable(result):
+        result_cache.set(key, result, size=size, ttl=max_age)
+        result = copy_payload(result)
+
+    return result
+
+
+def read_csv(chunks, cols, baseurl, credentials=None, stream=False):
+    """Decode a CSV response, see `decode_csv`."""
+    try:
+        result = decode_csv(chunks, cols)
+        if not stream:
+            result['table']['rows'] = list(result['table']['rows'])
+    except ValueError as e:
+        # the cached columns are stale
+        invalidate_schema(baseurl, credentials)
+        raise ProgrammingError(str(e))
 
     return result
 
 
+def decode_result(
+    content,
+    csv=False,
+    compact=False,
+    cols=None,
+    baseurl=None,
+    credentials=None,
+    encoding='utf-8',
+):
+    """Decode the content of a response, as CSV with `cols` or as JSON."""
+    if csv:
+        return read_csv([content.decode(encoding)], cols, baseurl, credentials)
+    return decode_payload(content, compact)
+
+
+def is_csv(response):
+    return response.headers.get('Content-Type', '').startswith('text/csv')
+
+
+def get_csv_cols(baseurl, query, credentials=None):
+    """
+    Return the columns needed to read the results of a query as CSV.
+
+    CSV is used only for queries returning the whole sheet, when its columns
+    are already cached and can all be parsed from CSV; otherwise `None` is
+    returned.
+
+    """
+    if query != FULL_SHEET_QUERY:
+        return None
+
+    cols = get_cached_schema(baseurl, credentials)
+    if cols is None or not all(col['type'] in csv_parsers for col in cols):
+        return None
+
+    return cols
+
+
+def is_cacheable(payload):
+    return isinstance(payload, dict) and payload.get('status') == 'ok'
+
+
+def is_not_modified(payload):
+    if not isinstance(payload, dict) or payload.get('status') != 'error':
+        return False
+
+    return any(
+        error.get('reason') == NOT_MODIFIED for error in payload['errors'])
+
+
 def get_description_from_payload(payload):
     """
     Return description from a single row.
@@ -83,16 +570,13 @@ def get_description_from_payload(payload):
     ]
 
 
-def execute(query, headers=0, credentials=None):
-    try:
-        parsed_query = parse_sql(query)
-    except pyparsing.ParseException as e:
-        raise ProgrammingError(format_moz_error(query, e))
+def get_baseurl(query, headers=0):
+    """
+    Return the URL of the sheet in the `FROM` clause, and its `max_age`.
 
-    # fetch aliases, since they will be removed by the translator
-    original_aliases = extract_column_aliases(parsed_query)
+    Raises `InterfaceError` if the URL is not a Google spreadsheet.
 
-    # extract URL from the `FROM` clause
+    """
     from_ = extract_url(query)
     baseurl = get_url(from_, headers)
 
@@ -101,8 +585,48 @@ def execute(query, headers=0, credentials=None):
     if not parsed.netloc == 'docs.google.com':
         raise InterfaceError('Invalid URL, must be a docs.google.com URL!')
 
+    return baseurl, get_max_age(from_)
+
+
+def get_plan(
+    query,
+    headers=0,
+    credentials=None,
+    session=None,
+    formatted_values=False,
+    column_map=None,
+    snapshots=None,
+):
+    """
+    Build the plan for running a query, using `translation_cache`.
+
+    Cached plans are reused only if the columns of the sheet didn't change
+    since the plan was built. The columns are fetched from the schema cache,
+    or from `snapshots`, unless they're passed in `column_map`.
+
+    """
+    query = ParsedQuery.wrap(query)
+    key = get_plan_key(query, headers, formatted_values)
+    plan = translation_cache.get(key)
+    if plan is not None:
+        if column_map is None:
+            column_map = get_column_map(
+                plan.baseurl, credentials, session, snapshots)
+        if column_map == plan.column_map:
+            return plan
+
+    # work on a copy, since processors and the translator modify it in place
+    parsed_query = query.copy()
+
+    # fetch aliases, since they will be removed by the translator
+    original_aliases = extract_column_aliases(parsed_query)
+
+    # extract URL from the `FROM` clause
+    baseurl, max_age = get_baseurl(query, headers)
+
     # map between labels and ids, eg, `{ 'country': 'A' }`
-    column_map = get_column_map(baseurl, credentials)
+    if column_map is None:
+        column_map = get_column_map(baseurl, credentials, session, snapshots)
 
     # preprocess
     used_processors = []
@@ -114,23 +638,142 @@ def execute(query, headers=0, credentials=None):
     processed_aliases = extract_column_aliases(parsed_query)
 
     # translate colum names to ids and remove aliases
-    translated_query = translate(parsed_query, column_map)
-    logger.info('Original query: {}'.format(query))
+    translated_query = translate(parsed_query, column_map, formatted_values)
+
+    plan = Plan(
+        baseurl,
+        max_age,
+        column_map,
+        translated_query,
+        tuple(original_aliases),
+        tuple(processed_aliases),
+        tuple(used_processors),
+    )
+    translation_cache.set(key, plan)
+
+    return plan
+
+
+def get_plan_key(query, headers=0, formatted_values=False):
+    """Return the key of the plan of a query in `translation_cache`."""
+    return query.sql.strip(), headers, formatted_values
+
+
+def execute(
+    query,
+    headers=0,
+    credentials=None,
+    session=None,
+    result_cache=None,
+    stream=False,
+    as_tuples=False,
+    result_format='rows',
+    string_encoding=None,
+    formatted_values=False,
+    snapshots=None,
+):
+    """
+    Run a query, returning the rows and their description.
+
+    With `stream` the rows are returned as an iterator, and are downloaded,
+    decoded and converted only as they are consumed. Queries that need
+    post-processing are always read in full.
+
+    Rows are namedtuples, unless `as_tuples` is true. With a `result_format`
+    of `columnar` the results are a dictionary of columns instead (see
+    `convert_columns`), and are never streamed.
+
+    With a `string_encoding` repeated strings share storage: they're
+    interned in rows, and interned or dictionary-encoded in columns.
+
+    Formatted values are never used, so the API is asked to leave them out,
+    unless `formatted_values` is true.
+
+    Whole sheets are read from the `snapshots` store, if any, when they have
+    a fresh snapshot there.
+
+    """
+    query = ParsedQuery.wrap(query)
+    plan = get_plan(
+        query,
+        headers,
+        credentials,
+        session,
+        formatted_values,
+        snapshots=snapshots,
+    )
+    baseurl = plan.baseurl
+    translated_query = plan.translated_query
+    logger.info('Original query: {}'.format(query.sql))
     logger.info('Translated query: {}'.format(translated_query))
 
+    # post-processing and columns need all the rows
+    stream = (
+        stream and not plan.processors and result_format != 'columnar')
+
     # run query
-    payload = run_query(baseurl, translated_query, credentials)
+    payload = run_query(
+        baseurl,
+        translated_query,
+        credentials,
+        session,
+        result_cache,
+        plan.max_age,
+        stream,
+        # post-processors need the full payload
+        not plan.processors,
+        get_csv_cols(baseurl, translated_query, credentials),
+        snapshots=snapshots,
+    )
+
+    return process_payload(
+        query,
+        plan,
+        payload,
+        credentials,
+        stream,
+        as_tuples,
+        result_format,
+        string_encoding,
+    )
+
+
+def process_payload(
+    query,
+    plan,
+    payload,
+    credentials=None,
+    stream=False,
+    as_tuples=False,
+    result_format='rows',
+    string_encoding=None,
+):
+    """
+    Post-process the payload of a query, returning rows and description.
+
+    Raises `ProgrammingError` if the payload has errors.
+
+    """
+    baseurl = plan.baseurl
+    translated_query = plan.translated_query
     if payload['status'] == 'error':
+        # the cached columns might be stale
+        if any(
+            NO_COLUMN in error.get('detailed_message', '')
+            for error in payload['errors']
+        ):
+            invalidate_schema(baseurl, credentials)
         raise ProgrammingError(
-            format_gsheet_error(query, translated_query, payload['errors']))
+            format_gsheet_error(
+                query.sql, translated_query, payload['errors']))
 
-    # postprocess
-    for processor in used_processors:
-        payload = processor.post_process(payload, processed_aliases)
+    # postprocess, with a fresh copy of the processors
+    for processor in copy.deepcopy(plan.processors):
+        payload = processor.post_process(payload, plan.processed_aliases)
 
     # add aliases back
     cols = payload['table']['cols']
-    for alias, col in zip(original_aliases, cols):
+    for alias, col in zip(plan.original_aliases, cols):
         if alias is not None:
             col['label'] = alias
 
@@ -142,6 +785,12 @@ def execute(query, headers=0, credentials=None):
 
     # convert rows to proper type (datetime, eg)
     rows = payload['table']['rows']
-    results = convert_rows(cols, rows)
+    if result_format == 'columnar':
+        results = convert_columns(cols, rows, string_encoding)
+    elif stream:
+        results = iter_convert_rows(
+            cols, rows, as_tuples, bool(string_encoding))
+    else:
+        results = convert_rows(cols, rows, as_tuples, bool(string_encoding))
 
     return results, description
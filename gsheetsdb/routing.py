@@ -0,0 +1,205 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import namedtuple
+import json
+
+from six import string_types
+
+from gsheetsdb.cache import LRUCache
+from gsheetsdb.parsing import ParsedQuery
+from gsheetsdb.url import extract_url, get_url, normalize_url
+
+# engines that can run a query
+GVIZ = 'gviz'
+SQLITE = 'sqlite'
+
+# operators and functions supported by the API, or by the processors
+SUPPORTED_OPERATORS = {
+    # operators
+    'add',
+    'and',
+    'div',
+    'eq',
+    'exists',
+    'gt',
+    'gte',
+    'is',
+    'like',
+    'lt',
+    'lte',
+    'missing',
+    'mul',
+    'neq',
+    'not',
+    'or',
+    'sub',
+    # aggregations
+    'avg',
+    'count',
+    'max',
+    'min',
+    'sum',
+    # scalar functions
+    'datediff',
+    'datetrunc',
+    'day',
+    'dayofweek',
+    'hour',
+    'lower',
+    'millisecond',
+    'minute',
+    'month',
+    'now',
+    'quarter',
+    'second',
+    'todate',
+    'upper',
+    'year',
+}
+
+# (sheet, query shape) pairs that recently failed in the API
+remote_failures = LRUCache(max_entries=1000, ttl=600)
+
+# Why a query can't run in the API, if so, and its key in `remote_failures`
+# otherwise. Routes only depend on the SQL, so they're cached by SQL and
+# headers, and queries with a cached plan are not parsed again.
+Route = namedtuple('Route', ['reason', 'failure_key'])
+route_cache = LRUCache(max_entries=1000)
+
+
+def find_unsupported(tree):
+    """
+    Return the first construct in a parsed query that the API can't run.
+
+    Returns `None` if the query can be sent to the API.
+
+    """
+    if 'union' in tree:
+        return 'UNION'
+
+    from_ = tree.get('from')
+    if from_ is None:
+        return 'a query without FROM'
+    if isinstance(from_, list):
+        return 'JOIN'
+    if not isinstance(from_, string_types):
+        return 'subquery'
+
+    if 'having' in tree:
+        return 'HAVING'
+
+    for clause in ('select', 'where', 'groupby', 'orderby'):
+        construct = find_unsupported_expression(tree.get(clause))
+        if construct is not None:
+            return construct
+
+    return None
+
+
+def find_unsupported_expression(json):
+    if isinstance(json, list):
+        for element in json:
+            construct = find_unsupported_expression(element)
+            if construct is not None:
+                return construct
+
+    elif isinstance(json, dict):
+        if 'select' in json:
+            return 'subquery'
+        if 'value' in json:
+            return find_unsupported_expression(json['value'])
+        if 'literal' in json:
+            return None
+
+        for key, value in json.items():
+            if key == 'distinct':
+                return 'DISTINCT'
+            if key == 'case':
+                return 'CASE'
+            if key not in SUPPORTED_OPERATORS:
+                return key.upper()
+
+            construct = find_unsupported_expression(value)
+            if construct is not None:
+                return construct
+
+    return None
+
+
+def get_shape(tree):
+    """Return the shape of a parsed query, without its literal values."""
+    if isinstance(tree, list):
+        return [get_shape(element) for element in tree]
+    if isinstance(tree, dict):
+        if 'literal' in tree:
+            return {'literal': None}
+        return {key: get_shape(value) for key, value in tree.items()}
+    if isinstance(tree, string_types):
+        return tree
+    return None
+
+
+def get_failure_key(query, headers=0):
+    url = normalize_url(get_url(extract_url(query), headers))
+    shape = json.dumps(get_shape(query.tree), sort_keys=True)
+    return url, shape
+
+
+def choose_engine(query, headers=0):
+    """
+    Decide where to run a query, before sending any requests.
+
+    Queries go to SQLite if they can't be parsed, if they use constructs the
+    API doesn't support, or if a query with the same shape failed recently in
+    the API for the same sheet (see `record_failure`); otherwise they go to
+    the API.
+
+    Returns the engine and the reason for choosing it.
+
+    """
+    route = get_route(query, headers)
+    if route.reason is not None:
+        return SQLITE, route.reason
+
+    if route.failure_key in remote_failures:
+        return SQLITE, 'a similar query failed recently in the API'
+
+    return GVIZ, None
+
+
+def get_route(query, headers=0):
+    """Return the `Route` of a query, parsing it only the first time."""
+    query = ParsedQuery.wrap(query)
+    key = (query.sql.strip(), headers)
+    route = route_cache.get(key)
+    if route is not None:
+        return route
+
+    if query.tree is None:
+        route = Route('query could not be parsed', None)
+    else:
+        construct = find_unsupported(query.tree)
+        if construct is None:
+            route = Route(None, get_failure_key(query, headers))
+        else:
+            route = Route(
+                '{0} is not supported by the API'.format(construct), None)
+
+    route_cache.set(key, route)
+    return route
+
+
+def is_recent_failure(query, headers=0):
+    """Return whether a query with the same shape failed recently."""
+    failure_key = get_route(query, headers).failure_key
+    return failure_key is not None and failure_key in remote_failures
+
+
+def record_failure(query, headers=0):
+    """Remember that a query failed in the API, so similar ones skip it."""
+    failure_key = get_route(query, headers).failure_key
+    if failure_key is not None:
+        remote_failures.set(failure_key, True)
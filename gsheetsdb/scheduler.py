@@ -0,0 +1,265 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+from gsheetsdb.exceptions import OperationalError
+
+
+logger = logging.getLogger(__name__)
+
+# priorities, lower goes first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# responses that are retried after waiting: throttling and server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket(object):
+
+    """
+    A thread-safe token bucket rate limiter, with priorities.
+
+    Tokens are added at `rate` per second, up to `burst`. Callers waiting for
+    a token are served by priority, and by order of arrival within the same
+    priority.
+
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+
+        self._condition = threading.Condition()
+        self._tokens = burst
+        self._updated = time.time()
+        self._waiting = []
+        self._counter = itertools.count()
+
+    def acquire(self, priority=INTERACTIVE):
+        """Wait for a token, returning how long it took in seconds."""
+        start = time.time()
+        with self._condition:
+            ticket = self._enqueue(priority)
+            try:
+                delay = self._take(ticket)
+                while delay is not None:
+                    self._condition.wait(delay)
+                    delay = self._take(ticket)
+            finally:
+                self._dequeue(ticket)
+
+        return time.time() - start
+
+    def enqueue(self, priority=INTERACTIVE):
+        """
+        Queue for a token without blocking, returning a ticket to `poll`.
+
+        Used by the asyncio API, which waits between polls without blocking
+        the event loop.
+
+        """
+        with self._condition:
+            return self._enqueue(priority)
+
+    def poll(self, ticket):
+        """
+        Take a token for a queued ticket, returning `None` if it was taken, or
+        how long to wait before polling again.
+
+        """
+        with self._condition:
+            delay = self._take(ticket)
+            if delay is None:
+                self._dequeue(ticket)
+            return delay
+
+    def cancel(self, ticket):
+        """Leave the queue without taking a token."""
+        with self._condition:
+            if ticket in self._waiting:
+                self._dequeue(ticket)
+
+    def _enqueue(self, priority):
+        ticket = (priority, next(self._counter))
+        heapq.heappush(self._waiting, ticket)
+        return ticket
+
+    def _dequeue(self, ticket):
+        self._waiting.remove(ticket)
+        heapq.heapify(self._waiting)
+        self._condition.notify_all()
+
+    def _take(self, ticket):
+        self._refill()
+        if self._waiting[0] != ticket:
+            # wait for the callers ahead; blocking callers are notified when
+            # they are served, but asynchronous ones have to poll
+            return 1 / self.rate
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return None
+        return (1 - self._tokens) / self.rate
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class QueueStats(object):
+
+    """Time spent waiting for the rate limit, for one priority."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def add(self, wait):
+        self.count += 1
+        self.total += wait
+        self.max = max(self.max, wait)
+
+
+class RequestScheduler(object):
+
+    """
+    Send requests to the API within its quota.
+
+    Requests are rate limited with a token bucket per credentials identity,
+    allowing `rate` requests per second with bursts of up to `burst`; by
+    default there's no limit. Interactive requests are sent before background
+    ones, like schema probes, when both are waiting.
+
+    Throttled requests and server errors are retried up to `max_retries`
+    times, with exponential backoff and full jitter starting at `backoff`
+    seconds, or waiting as long as the API asks in `Retry-After`.
+
+    """
+
+    def __init__(
+        self,
+        rate=None,
+        burst=None,
+        max_retries=3,
+        backoff=0.5,
+        max_backoff=30,
+    ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self.configure(rate, burst)
+
+        # statistics
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.queue_stats = {
+            INTERACTIVE: QueueStats(),
+            BACKGROUND: QueueStats(),
+        }
+
+    def configure(self, rate=None, burst=None):
+        """Change the rate limit, in requests per second."""
+        with self._lock:
+            self._buckets = {}
+            self.rate = rate
+            self.burst = burst or max(1, rate or 0)
+
+    def get_bucket(self, identity):
+        if self.rate is None:
+            return None
+
+        with self._lock:
+            if identity not in self._buckets:
+                self._buckets[identity] = TokenBucket(self.rate, self.burst)
+            return self._buckets[identity]
+
+    def request(self, identity, send, priority=INTERACTIVE):
+        """
+        Call `send` to make a request when the quota allows it.
+
+        `identity` is the identity of the credentials (see
+        `get_credentials_identity`), and `send` returns the response.
+
+        Raises `OperationalError` if the request still fails after retrying.
+
+        """
+        bucket = self.get_bucket(identity)
+        for attempt in itertools.count():
+            wait = bucket.acquire(priority) if bucket else 0.0
+            self.record_request(priority, wait)
+
+            response = send()
+            delay = self.check_response(
+                attempt, response.status_code, response.headers)
+            if delay is None:
+                break
+            response.close()
+            time.sleep(delay)
+
+        if response.status_code in RETRY_STATUSES:
+            raise self.get_failure(response.status_code, response.text)
+        return response
+
+    def record_request(self, priority, wait):
+        with self._lock:
+            self.requests += 1
+            self.queue_stats[priority].add(wait)
+
+    def check_response(self, attempt, status, headers):
+        """
+        Return how long to wait before retrying a response, or `None` if it's
+        not retried: because it didn't fail, or it failed too many times.
+
+        """
+        if status not in RETRY_STATUSES:
+            return None
+
+        with self._lock:
+            if status == 429:
+                self.throttled += 1
+            if attempt == self.max_retries:
+                self.failures += 1
+                return None
+            self.retries += 1
+
+        delay = self.get_delay(attempt, headers)
+        logger.info('Status {0}, retrying in {1:.2f}s'.format(status, delay))
+        return delay
+
+    def get_failure(self, status, text):
+        return OperationalError(
+            'Request failed with status {0} after {1} retries: {2}'.format(
+                status, self.max_retries, text))
+
+    def get_delay(self, attempt, headers):
+        retry_after = headers.get('Retry-After')
+        try:
+            return min(float(retry_after), self.max_backoff)
+        except (TypeError, ValueError):
+            pass
+
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+# shared by all connections, so that the limit applies to the whole process
+scheduler = RequestScheduler()
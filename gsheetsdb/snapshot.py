@@ -0,0 +1,352 @@
+"""
+Snapshots of whole sheets on disk, shared by processes and across restarts.
+
+Each sheet is stored in its own SQLite file in a directory. Files are written
+to a temporary file and atomically renamed, so readers always see a complete
+snapshot, and writers hold a lock on the sheet while fetching it, so that
+only one process downloads a sheet at a time. Expired snapshots are kept
+until purged, so that they can be revalidated with their signature.
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from contextlib import contextmanager
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from six.moves.urllib.request import pathname2url
+
+from gsheetsdb.cache import Entry
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(
+    os.path.expanduser('~'), '.cache', 'gsheetsdb')
+
+SUFFIX = '.sqlite'
+LOCK_SUFFIX = '.lock'
+TMP_SUFFIX = '.tmp'
+
+# temporary files not written to for this many seconds were left behind by
+# processes that died while writing a snapshot
+ORPHAN_AGE = 600
+
+
+class SnapshotStore(object):
+
+    """
+    A directory of sheet snapshots.
+
+    Snapshots are keyed by a JSON serializable key (see `get_snapshot_key`),
+    and expire after `ttl` seconds, unless they were stored with their own
+    TTL. Payloads must have compact rows.
+
+    Without `fcntl` (on Windows) sheets are not locked while they're fetched;
+    snapshots are still written atomically.
+
+    """
+
+    def __init__(self, path=None, ttl=None):
+        self.path = path or DEFAULT_SNAPSHOT_DIR
+        self.ttl = ttl
+
+        try:
+            os.makedirs(self.path)
+        except OSError:
+            if not os.path.isdir(self.path):
+                raise
+
+        self._lock = threading.Lock()
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.revalidations = 0
+
+    def get_filename(self, key):
+        digest = hashlib.sha1(
+            json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest + SUFFIX)
+
+    def get(self, key):
+        """Return the payload of a fresh snapshot, or `None`."""
+        payload = self._read(self.get_filename(key), key, rows=True)
+        with self._lock:
+            if payload is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return payload
+
+    def get_stale(self, key):
+        """Return a snapshot even if it has expired, as an `Entry`."""
+        payload = self._read(
+            self.get_filename(key), key, rows=True, expired=True)
+        if payload is None:
+            return None
+        return Entry(None, payload, 0, None)
+
+    def refresh(self, key):
+        """Mark an expired snapshot as fresh again, after revalidating it."""
+        filename = self.get_filename(key)
+        if not os.path.exists(filename):
+            return
+
+        try:
+            conn = sqlite3.connect(
+                'file:{0}?mode=rw'.format(pathname2url(filename)), uri=True)
+            try:
+                with conn:
+                    conn.execute(
+                        "UPDATE meta SET value = ? WHERE name = 'timestamp'",
+                        (json.dumps(time.time()),),
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning('Unable to refresh snapshot {0}: {1}'.format(
+                filename, e))
+            return
+
+        with self._lock:
+            self.revalidations += 1
+
+    def get_cols(self, key):
+        """Return the columns of a fresh snapshot, or `None`."""
+        payload = self._read(self.get_filename(key), key, rows=False)
+        return payload and payload['table']['cols']
+
+    def set(self, key, payload, ttl=None):
+        """
+        Store the payload of a sheet, replacing any older snapshot.
+
+        `ttl` overrides the default TTL of the store for this snapshot.
+
+        """
+        cols = payload['table']['cols']
+        if not cols:
+            return
+
+        fd, tmp = tempfile.mkstemp(suffix=TMP_SUFFIX, dir=self.path)
+        os.close(fd)
+        try:
+            conn = sqlite3.connect(tmp)
+            try:
+                write_snapshot(conn, key, payload, ttl)
+            finally:
+                conn.close()
+            os.replace(tmp, self.get_filename(key))
+        except sqlite3.Error as e:
+            # snapshots only save requests, so queries don't fail without them
+            os.remove(tmp)
+            logger.warning('Could not write snapshot: {0}'.format(e))
+            return
+        except Exception:
+            os.remove(tmp)
+            raise
+
+        with self._lock:
+            self.writes += 1
+
+    @contextmanager
+    def lock(self, key):
+        """Hold an exclusive lock on a sheet, across processes."""
+        if fcntl is None:
+            yield
+            return
+
+        with open(self.get_filename(key) + LOCK_SUFFIX, 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def purge(self, expired_only=False):
+        """
+        Remove all snapshots, or only the expired ones; return how many.
+
+        The locks of the removed snapshots are removed too, unless they're
+        held, and so are temporary files left behind by writers that died.
+
+        """
+        count = 0
+        names = os.listdir(self.path)
+        for name in names:
+            if not name.endswith(SUFFIX):
+                continue
+            filename = os.path.join(self.path, name)
+            if expired_only and self._read(filename) is not None:
+                continue
+
+            try:
+                os.remove(filename)
+            except OSError:
+                continue  # removed by another process
+            count += 1
+
+        for name in names:
+            filename = os.path.join(self.path, name)
+            if name.endswith(LOCK_SUFFIX):
+                snapshot = filename[:-len(LOCK_SUFFIX)]
+                if not os.path.exists(snapshot):
+                    remove_lock(filename)
+            elif name.endswith(TMP_SUFFIX):
+                try:
+                    if time.time() - os.path.getmtime(filename) > ORPHAN_AGE:
+                        os.remove(filename)
+                except OSError:
+                    continue  # renamed or removed by another process
+
+        return count
+
+    def _read(self, filename, key=None, rows=False, expired=False):
+        if not os.path.exists(filename):
+            return None
+
+        try:
+            conn = sqlite3.connect(
+                'file:{0}?mode=ro'.format(pathname2url(filename)), uri=True)
+        except sqlite3.Error:
+            return None  # removed since
+        try:
+            return read_snapshot(conn, key, rows, self.ttl, expired)
+        except sqlite3.Error as e:
+            logger.warning('Invalid snapshot {0}: {1}'.format(filename, e))
+            return None
+        finally:
+            conn.close()
+
+
+def write_snapshot(conn, key, payload, ttl=None):
+    cols = payload['table']['cols']
+    meta = {
+        'key': key,
+        'cols': cols,
+        'sig': payload.get('sig'),
+        'timestamp': time.time(),
+        'ttl': ttl,
+    }
+
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)')
+    conn.executemany(
+        'INSERT INTO meta VALUES (?, ?)',
+        [(name, json.dumps(value)) for name, value in meta.items()],
+    )
+    # untyped columns keep the values as they are, except for booleans, and
+    # for times of day, which are lists and are stored as JSON
+    rows = payload['table']['rows']
+    lists = get_columns(cols, 'timeofday')
+    if lists:
+        rows = (dump_lists(row, lists) for row in rows)
+    conn.execute('CREATE TABLE rows ({0})'.format(
+        ', '.join('c{0}'.format(i) for i in range(len(cols)))))
+    conn.executemany(
+        'INSERT INTO rows VALUES ({0})'.format(', '.join('?' for col in cols)),
+        rows,
+    )
+    conn.commit()
+
+
+def remove_lock(filename):
+    """Remove a lock file, unless another process holds the lock."""
+    if fcntl is None:
+        return
+
+    try:
+        with open(filename, 'a') as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                return  # held
+            try:
+                os.remove(filename)
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    except OSError:
+        pass  # removed by another process
+
+
+def read_snapshot(
+    conn,
+    key=None,
+    rows=False,
+    default_ttl=None,
+    expired=False,
+):
+    """
+    Read a snapshot, returning its payload or `None` if it expired.
+
+    With `expired` the payload is returned even if the snapshot expired.
+
+    """
+    meta = {
+        name: json.loads(value)
+        for name, value in conn.execute('SELECT name, value FROM meta')
+    }
+    if key is not None and meta['key'] != json.loads(json.dumps(key)):
+        return None
+
+    ttl = default_ttl if meta['ttl'] is None else meta['ttl']
+    if not expired and ttl is not None and (
+        time.time() - meta['timestamp'] > ttl
+    ):
+        return None
+
+    cols = meta['cols']
+    payload = {'status': 'ok', 'table': {'cols': cols, 'rows': []}}
+    if meta['sig'] is not None:
+        payload['sig'] = meta['sig']
+
+    if rows:
+        booleans = get_columns(cols, 'boolean')
+        lists = get_columns(cols, 'timeofday')
+        cursor = conn.execute('SELECT * FROM rows')
+        if booleans or lists:
+            payload['table']['rows'] = [
+                restore_row(row, booleans, lists) for row in cursor]
+        else:
+            payload['table']['rows'] = cursor.fetchall()
+
+    return payload
+
+
+def get_columns(cols, type_):
+    return [i for i, col in enumerate(cols) if col['type'] == type_]
+
+
+def dump_lists(row, lists):
+    row = list(row)
+    for i in lists:
+        if row[i] is not None:
+            row[i] = json.dumps(row[i])
+    return row
+
+
+def restore_row(row, booleans, lists):
+    row = list(row)
+    for i in booleans:
+        if row[i] is not None:
+            row[i] = bool(row[i])
+    for i in lists:
+        if row[i] is not None:
+            row[i] = json.loads(row[i])
+    return tuple(row)
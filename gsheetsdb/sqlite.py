@@ -2,14 +2,30 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from collections import namedtuple, OrderedDict
 import datetime
 import logging
 import sqlite3
+import threading
+import time
 
+from gsheetsdb.auth import get_credentials_identity
 from gsheetsdb.convert import convert_rows
-from gsheetsdb.exceptions import ProgrammingError
-from gsheetsdb.query import run_query
-from gsheetsdb.url import extract_url, get_url
+from gsheetsdb.exceptions import NotSupportedError, ProgrammingError
+from gsheetsdb.hybrid import split_query
+from gsheetsdb.parsing import ParsedQuery
+from gsheetsdb.query import (
+    execute as gviz_execute,
+    FULL_SHEET_QUERY,
+    get_csv_cols,
+    get_result_key,
+    get_schema,
+    run_query,
+)
+from gsheetsdb.pushdown import get_pushdown_query
+from gsheetsdb.routing import is_recent_failure, record_failure
+from gsheetsdb.steps import call, run
+from gsheetsdb.url import extract_url, extract_urls, get_max_age, get_url
 
 
 logger = logging.getLogger(__name__)
@@ -63,29 +79,575 @@ def insert_into(cursor, table, payload):
     values = ', '.join('?' for col in cols)
     query = 'INSERT INTO "{table}" VALUES ({values})'.format(
         table=table, values=values)
-    rows = convert_rows(cols, payload['table']['rows'])
+    rows = convert_rows(cols, payload['table']['rows'], as_tuples=True)
     logger.info(query)
     cursor.executemany(query, rows)
 
 
-def execute(query, headers=0, credentials=None):
-    # fetch all the data
+def load_table(cursor, table, payload):
+    create_table(cursor, table, payload)
+    insert_into(cursor, table, payload)
+
+
+def get_source(query, headers=0, formatted_values=False):
+    """
+    Return the table name, the URL of the sheet and the query fetching it.
+
+    Raises `ProgrammingError` if the query has no `FROM` clause.
+
+    """
     from_ = extract_url(query)
     if not from_:
-        raise ProgrammingError('Invalid query: {query}'.format(query=query))
+        raise ProgrammingError(
+            'Invalid query: {query}'.format(query=query.sql))
     baseurl = get_url(from_, headers)
-    payload = run_query(baseurl, 'SELECT *', credentials)
+    sheet_query = 'SELECT *' if formatted_values else FULL_SHEET_QUERY
+
+    return from_, baseurl, sheet_query
+
+
+def get_sources(query, sheet_query, headers=0, credentials=None):
+    """
+    Return the sheets used by a query, mapped to the source of their data in
+    a mirror (see `get_result_key`).
+
+    """
+    return OrderedDict(
+        (
+            table,
+            get_result_key(
+                get_url(table, headers), sheet_query, credentials, True),
+        )
+        for table in extract_urls(query)
+    )
+
+
+def execute(
+    query,
+    headers=0,
+    credentials=None,
+    session=None,
+    result_cache=None,
+    formatted_values=False,
+    mirror=None,
+    snapshots=None,
+):
+    return run(
+        execute_steps(
+            query,
+            headers,
+            credentials,
+            session,
+            result_cache,
+            formatted_values,
+            mirror,
+            snapshots,
+        ),
+        {
+            'execute': gviz_execute,
+            'get_schema': get_schema,
+            'run_query': run_query,
+        },
+    )
+
+
+def execute_steps(
+    query,
+    headers=0,
+    credentials=None,
+    session=None,
+    result_cache=None,
+    formatted_values=False,
+    mirror=None,
+    snapshots=None,
+):
+    """
+    Run a query in SQLite, as steps calling `execute`, `get_schema` and
+    `run_query` (see `gsheetsdb.steps`).
+
+    """
+    query = ParsedQuery.wrap(query)
+    from_, baseurl, sheet_query = get_source(query, headers, formatted_values)
+    sources = get_sources(query, sheet_query, headers, credentials)
+
+    def fetch(tables):
+        return [
+            fetch_sheet(
+                table,
+                sheet_query,
+                headers,
+                credentials,
+                session,
+                result_cache,
+                snapshots,
+            )
+            for table in tables
+        ]
+
+    # reuse the sheets if they're already loaded, and load the others with
+    # the credentials of the query
+    if mirror is not None:
+        identity = get_credentials_identity(credentials)
+        result = mirror.execute(query, sources, identity)
+        ttls = dict((table, get_max_age(table)) for table in sources)
+        payloads = {}
+        while result is None:
+            missing = [
+                table
+                for table in mirror.missing(sources, identity)
+                if table not in payloads
+            ]
+            payloads.update(zip(missing, (yield fetch(missing))))
+            result = mirror.execute_payloads(
+                query, sources, payloads, ttls, identity)
+        return result
+
+    # run what the API supports there, or fetch only the data needed,
+    # unless the whole sheet is kept
+    payload = None
+    if snapshots is None and len(sources) == 1:
+        result = yield from execute_hybrid(
+            query,
+            headers,
+            credentials,
+            session,
+            result_cache,
+            formatted_values,
+        )
+        if result is not None:
+            return result
+
+        payload = yield from fetch_pushed_down(
+            query,
+            from_,
+            baseurl,
+            credentials,
+            session,
+            result_cache,
+            formatted_values,
+        )
+
+    # fetch all the data
+    if payload is None:
+        payloads = OrderedDict(zip(sources, (yield fetch(sources))))
+    else:
+        payloads = OrderedDict([(from_, payload)])
+    return execute_payloads(query, payloads)
+
+
+def fetch_sheet(
+    table,
+    sheet_query,
+    headers=0,
+    credentials=None,
+    session=None,
+    result_cache=None,
+    snapshots=None,
+):
+    """Return the call fetching all the data of a sheet, with `sheet_query`."""
+    baseurl = get_url(table, headers)
+    return call(
+        'run_query',
+        baseurl,
+        sheet_query,
+        credentials,
+        session,
+        result_cache,
+        get_max_age(table),
+        compact=True,
+        cols=get_csv_cols(baseurl, sheet_query, credentials),
+        snapshots=snapshots,
+    )
 
-    # create table
+
+def execute_hybrid(
+    query,
+    headers=0,
+    credentials=None,
+    session=None,
+    result_cache=None,
+    formatted_values=False,
+):
+    """
+    Run part of a query in the API, and the rest in SQLite over its results,
+    as steps.
+
+    Returns `None` if the query can't be split (see `split_query`), or if
+    either part fails; failures are remembered, so that similar queries
+    don't try again.
+
+    """
+    plan = split_query(query)
+    if plan is None or is_recent_failure(plan.remote, headers):
+        return None
+
+    try:
+        results, description = yield call(
+            'execute',
+            plan.remote,
+            headers,
+            credentials,
+            session,
+            result_cache,
+            as_tuples=True,
+            formatted_values=formatted_values,
+        )
+        cols = yield call(
+            'get_schema', get_url(plan.table, headers), credentials, session)
+        return execute_plan(plan, results, description, cols)
+    except (NotSupportedError, ProgrammingError, sqlite3.Error) as e:
+        logger.warning(
+            'Hybrid query failed, running in SQLite: {0}'.format(e))
+        record_failure(plan.remote, headers)
+        return None
+
+
+def fetch_pushed_down(
+    query,
+    from_,
+    baseurl,
+    credentials=None,
+    session=None,
+    result_cache=None,
+    formatted_values=False,
+):
+    """
+    Fetch only the columns and rows of a sheet needed by a query, as steps.
+
+    Returns `None` if the whole sheet is needed, or if the API rejects the
+    reduced query (see `get_pushdown_query`).
+
+    """
+    cols = yield call('get_schema', baseurl, credentials, session)
+    fetch_query, csv_cols = get_pushdown_query(query, cols, formatted_values)
+    if fetch_query is None:
+        return None
+
+    try:
+        return (yield call(
+            'run_query',
+            baseurl,
+            fetch_query,
+            credentials,
+            session,
+            result_cache,
+            get_max_age(from_),
+            compact=True,
+            cols=csv_cols,
+        ))
+    except ProgrammingError as e:
+        logger.warning(
+            'Pushed down query failed, fetching the whole sheet: {0}'.format(
+                e))
+        return None
+
+
+def execute_payloads(query, payloads):
+    """
+    Load the data of sheets into SQLite, and run the query there.
+
+    `payloads` maps the tables used by the query to the data of their sheets.
+
+    """
     conn = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES)
     cursor = conn.cursor()
-    create_table(cursor, from_, payload)
-    insert_into(cursor, from_, payload)
+    for table, payload in payloads.items():
+        load_table(cursor, table, payload)
     conn.commit()
 
     # run query in SQLite instead
-    logger.info('SQLite query: {}'.format(query))
-    results = cursor.execute(query).fetchall()
+    logger.info('SQLite query: {}'.format(query.sql))
+    results = cursor.execute(query.sql).fetchall()
     description = cursor.description
 
     return results, description
+
+
+def execute_plan(plan, results, description, cols):
+    """
+    Run the SQLite part of a hybrid plan over the results of its API part.
+
+    The results are named like SQLite names the results of the original
+    query, which is run on an empty table with the columns of the sheet,
+    `cols`, to get the names.
+
+    """
+    names = get_result_names(plan.query, plan.table, cols)
+    results, description = execute_results(
+        plan.local, plan.table, results, description)
+    if len(names) != len(description):
+        raise NotSupportedError(
+            'Unexpected results from split query: {0}'.format(
+                plan.local.sql))
+
+    description = [
+        (name,) + tuple(column[1:])
+        for name, column in zip(names, description)
+    ]
+    return results, description
+
+
+def get_result_names(query, table, cols):
+    """Return the names SQLite gives to the results of a query."""
+    conn = sqlite3.connect(':memory:')
+    try:
+        cursor = conn.cursor()
+        create_table(cursor, table, {'table': {'cols': cols}})
+        cursor.execute(query.sql)
+        return [column[0] for column in cursor.description]
+    finally:
+        conn.close()
+
+
+def execute_results(query, table, results, description):
+    """Load the results of a query into SQLite, and run a query on them."""
+    conn = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES)
+    cursor = conn.cursor()
+    cols = [
+        {'id': column[0], 'label': column[0], 'type': column[1].value}
+        for column in description
+    ]
+    create_table(cursor, table, {'table': {'cols': cols}})
+    cursor.executemany(
+        'INSERT INTO "{table}" VALUES ({values})'.format(
+            table=table, values=', '.join('?' for col in cols)),
+        results,
+    )
+    conn.commit()
+
+    logger.info('SQLite query: {}'.format(query.sql))
+    results = cursor.execute(query.sql).fetchall()
+    description = cursor.description
+
+    return results, description
+
+
+MirroredTable = namedtuple(
+    'MirroredTable', ['source', 'timestamp', 'size', 'ttl'])
+
+
+class SQLiteMirror(object):
+
+    """
+    A SQLite database keeping the sheets used by queries run in SQLite.
+
+    Each sheet is loaded into its own table the first time it's queried, and
+    reused by later queries until it's older than `ttl` seconds, or than the
+    `max_age` of its URL. When the tables use more than `max_size` bytes the
+    least recently used ones are dropped.
+
+    Sheets read with different credentials are kept in different databases,
+    so that queries only see the sheets loaded with their own credentials.
+    Tables are only modified when loading, queries can't change them.
+
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        # (credentials identity, table) -> MirroredTable
+        self._tables = OrderedDict()
+        self._conns = {}
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_time = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+        self.evictions = 0
+
+    @property
+    def size(self):
+        return sum(table.size for table in self._tables.values())
+
+    def __len__(self):
+        return len(self._tables)
+
+    def __contains__(self, table):
+        with self._lock:
+            return any(name == table for _, name in self._tables)
+
+    def missing(self, sources, identity=None):
+        """
+        Return the tables that need to be loaded for a query.
+
+        `sources` maps each table used by the query to the source of its
+        data, see `get_result_key`, and `identity` identifies the credentials
+        reading them, see `get_credentials_identity`. Tables are missing if
+        they aren't loaded, are stale or were loaded from a different source.
+
+        """
+        with self._lock:
+            return self._missing(sources, identity)
+
+    def execute(self, query, sources, identity=None):
+        """
+        Run a query on loaded tables.
+
+        Returns the results and their description, or `None` if any of the
+        tables used by the query is missing, see `missing`.
+
+        """
+        with self._lock:
+            if self._missing(sources, identity):
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            for table in sources:
+                self._tables.move_to_end((identity, table))
+            return self._run(query, identity)
+
+    def execute_payloads(
+        self,
+        query,
+        sources,
+        payloads,
+        ttls=None,
+        identity=None,
+    ):
+        """
+        Load sheets into tables, replacing any older versions, and run a
+        query on them.
+
+        `payloads` maps tables to the data of their sheets, and `ttls`
+        optionally maps them to a TTL overriding the default of the mirror.
+        Returns `None` if other tables used by the query are missing.
+
+        """
+        ttls = ttls or {}
+        with self._lock:
+            start = time.time()
+            conn = self._connect(identity)
+            cursor = conn.cursor()
+            cursor.execute('PRAGMA query_only = OFF')
+            try:
+                for table, payload in payloads.items():
+                    self._drop(cursor, identity, table)
+                    before = self._used_size(cursor)
+                    cursor.execute('BEGIN')
+                    load_table(cursor, table, payload)
+                    cursor.execute('COMMIT')
+                    size = self._used_size(cursor) - before
+
+                    self._tables[identity, table] = MirroredTable(
+                        sources[table], time.time(), size, ttls.get(table))
+                    self.loads += 1
+            except Exception:
+                if conn.in_transaction:
+                    cursor.execute('ROLLBACK')
+                raise
+            finally:
+                cursor.execute('PRAGMA query_only = ON')
+            self.load_time += time.time() - start
+
+            others = dict(
+                (table, source)
+                for table, source in sources.items()
+                if table not in payloads
+            )
+            if self._missing(others, identity):
+                return None
+
+            for table in sources:
+                self._tables.move_to_end((identity, table))
+            try:
+                return self._run(query, identity)
+            finally:
+                self._evict()
+
+    def invalidate(self, table=None):
+        """Drop a table, or all of them, for all credentials."""
+        with self._lock:
+            for identity, name in list(self._tables):
+                if table is None or name == table:
+                    self._drop_table(identity, name)
+
+    def close(self):
+        with self._lock:
+            for conn in self._conns.values():
+                conn.close()
+            self._conns.clear()
+            self._tables.clear()
+
+    def _connect(self, identity):
+        if identity not in self._conns:
+            # shared by the threads of the connection, under the lock
+            conn = sqlite3.connect(
+                ':memory:',
+                detect_types=sqlite3.PARSE_DECLTYPES,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            # return the pages of dropped tables, so that the size is exact
+            conn.execute('PRAGMA auto_vacuum = FULL')
+            self._conns[identity] = conn
+        return self._conns[identity]
+
+    def _missing(self, sources, identity):
+        missing = []
+        for table, source in sources.items():
+            entry = self._tables.get((identity, table))
+            if (
+                entry is None or
+                entry.source != source or
+                self._expired(entry)
+            ):
+                missing.append(table)
+        return missing
+
+    def _run(self, query, identity):
+        start = time.time()
+        logger.info('SQLite query: {}'.format(query.sql))
+        cursor = self._connect(identity).cursor()
+        results = cursor.execute(query.sql).fetchall()
+        self.queries += 1
+        self.query_time += time.time() - start
+
+        return results, cursor.description
+
+    def _expired(self, entry):
+        ttl = self.ttl if entry.ttl is None else entry.ttl
+        return ttl is not None and time.time() - entry.timestamp > ttl
+
+    def _drop(self, cursor, identity, table):
+        cursor.execute('DROP TABLE IF EXISTS "{0}"'.format(table))
+        self._tables.pop((identity, table), None)
+
+    def _drop_table(self, identity, table):
+        conn = self._conns.get(identity)
+        if conn is None:
+            self._tables.pop((identity, table), None)
+            return
+
+        cursor = conn.cursor()
+        cursor.execute('PRAGMA query_only = OFF')
+        try:
+            self._drop(cursor, identity, table)
+        finally:
+            cursor.execute('PRAGMA query_only = ON')
+
+        # free the database of credentials without tables
+        if not any(key[0] == identity for key in self._tables):
+            self._conns.pop(identity).close()
+
+    def _evict(self):
+        if self.max_size is None:
+            return
+
+        while self._tables and self.size > self.max_size:
+            self._drop_table(*next(iter(self._tables)))
+            self.evictions += 1
+
+    def _used_size(self, cursor):
+        page_count = cursor.execute('PRAGMA page_count').fetchone()[0]
+        page_size = cursor.execute('PRAGMA page_size').fetchone()[0]
+        return page_count * page_size
+
+
+# shared by the connections created with `shared_mirror=True`
+shared_mirror = SQLiteMirror(max_size=100 * 1024 * 1024, ttl=60)
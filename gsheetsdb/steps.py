@@ -0,0 +1,56 @@
+"""
+Steps: code shared by the blocking and the asyncio APIs.
+
+Functions that make requests in the middle of their logic, like the SQLite
+fallback, are written once as generators of steps: each request is yielded
+as a `Call` of a function by name, eg, `run_query`, and the generator is
+sent its result, or thrown its exception. `run` makes the calls with the
+blocking functions, and `gsheetsdb.aio` awaits the asynchronous ones.
+
+A list of calls can be yielded instead, and is answered with the list of
+their results; the asyncio API makes them concurrently.
+
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from collections import namedtuple
+
+
+Call = namedtuple('Call', ['name', 'args', 'kwargs'])
+
+
+def call(name, *args, **kwargs):
+    return Call(name, args, kwargs)
+
+
+def run(steps, functions):
+    """
+    Run a generator of steps, making its calls with blocking `functions`,
+    a dictionary of functions by name. Returns the value of the generator.
+
+    """
+    result = error = None
+    while True:
+        try:
+            if error is not None:
+                calls = steps.throw(error)
+            else:
+                calls = steps.send(result)
+        except StopIteration as e:
+            return e.value
+
+        result = error = None
+        try:
+            if isinstance(calls, list):
+                result = [make_call(functions, c) for c in calls]
+            else:
+                result = make_call(functions, calls)
+        except Exception as e:
+            error = e
+
+
+def make_call(functions, step):
+    return functions[step.name](*step.args, **step.kwargs)
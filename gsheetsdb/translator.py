@@ -11,6 +11,9 @@ from six import string_types
 
 from gsheetsdb.exceptions import NotSupportedError
 
+# tell the API to leave out formatted values, which roughly halves payloads
+NO_FORMAT = 'OPTIONS no_format'
+
 
 def replace(obj, replacements):
     """
@@ -77,7 +80,14 @@ def extract_column_aliases(parsed_query):
     return aliases
 
 
-def translate(parsed_query, column_map=None):
+def translate(parsed_query, column_map=None, formatted_values=True):
+    """
+    Translate a parsed query to the Google Visualization query language.
+
+    Unless `formatted_values` is true the API is asked to return only the
+    raw values of the cells.
+
+    """
     if column_map is None:
         column_map = {}
 
@@ -93,4 +103,8 @@ def translate(parsed_query, column_map=None):
     remove_aliases(parsed_query)
     replace(parsed_query, column_map)
 
-    return format(parsed_query)
+    query = format(parsed_query)
+    if not formatted_values:
+        query = '{query} {options}'.format(query=query, options=NO_FORMAT)
+
+    return query
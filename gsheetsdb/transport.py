@@ -0,0 +1,48 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from google.auth.transport.requests import AuthorizedSession
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+
+# number of hosts to keep connection pools for; queries only go to
+# docs.google.com, so this is usually 1
+DEFAULT_POOL_CONNECTIONS = 4
+
+# number of keep-alive connections kept per host
+DEFAULT_POOL_MAXSIZE = 10
+
+
+def get_session(
+    credentials=None,
+    pool_connections=DEFAULT_POOL_CONNECTIONS,
+    pool_maxsize=DEFAULT_POOL_MAXSIZE,
+    pool_block=False,
+):
+    """
+    Build a session with a pool of keep-alive connections.
+
+    The session can be shared between threads: the underlying `urllib3` pools
+    are thread-safe, and each request checks out its own connection. Up to
+    `pool_maxsize` connections are kept open per host; if `pool_block` is true
+    that is also a hard limit, and additional requests will wait for a free
+    connection instead of opening a new one.
+
+    """
+    if credentials:
+        session = AuthorizedSession(credentials)
+    else:
+        session = Session()
+
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
@@ -5,17 +5,25 @@ from __future__ import unicode_literals
 
 from collections import OrderedDict
 
-from moz_sql_parser import parse as parse_sql
-import pyparsing
 import re
+from six import string_types
 from six.moves.urllib import parse
+
 from gsheetsdb.exceptions import ProgrammingError
+from gsheetsdb.parsing import ParsedQuery
 
 
 FROM_REGEX = re.compile(' from ("http.*?")', re.IGNORECASE)
 
 
 def get_url(url, headers=0, gid=0, sheet=None):
+    """
+    Build the gviz URL for a sheet.
+
+    Only `headers`, `gid` and `sheet` are passed to the API; other arguments,
+    like `max_age` (see `get_max_age`), are used only by this module.
+
+    """
     parts = parse.urlparse(url)
     if parts.path.endswith('/edit'):
         path = parts.path[:-len('/edit')]
@@ -49,17 +57,105 @@ def get_url(url, headers=0, gid=0, sheet=None):
         (parts.scheme, netloc, path, None, params, None))
 
 
-def extract_url(sql):
+def get_max_age(url):
+    """
+    Return the `max_age` passed on a sheet URL, if any.
+
+    This overrides the TTL of cached results for a given sheet, eg,
+    `https://docs.google.com/spreadsheets/d/.../edit?max_age=300#gid=0`.
+
+    """
+    qs = parse.parse_qs(parse.urlparse(url).query)
+    if 'max_age' not in qs:
+        return None
+
+    value = qs['max_age'][-1]
     try:
-        url = parse_sql(sql)['from']
-    except pyparsing.ParseException:
+        max_age = float(value)
+    except ValueError:
+        max_age = None
+    if max_age is None or not max_age >= 0:
+        raise ProgrammingError(
+            'Invalid max_age in {0}: {1!r}, should be a number of '
+            'seconds'.format(url, value))
+    return max_age
+
+
+def normalize_url(url):
+    """Normalize a URL, so equivalent URLs can share cache entries."""
+    parts = parse.urlparse(url)
+    params = parse.urlencode(sorted(parse.parse_qsl(parts.query)))
+
+    return parse.urlunparse((
+        parts.scheme.lower(),
+        parts.netloc.lower(),
+        parts.path,
+        parts.params,
+        params,
+        None,
+    ))
+
+
+def extract_url(query):
+    query = ParsedQuery.wrap(query)
+    if query.tree is None:
         # fallback to regex to extract from
-        match = FROM_REGEX.search(sql)
+        match = FROM_REGEX.search(query.sql)
         if match:
             return match.group(1).strip('"')
         return
 
-    while isinstance(url, dict):
-        url = url['value']['from']
+    # the first table is the one used by queries that run in the API
+    for url in iter_tables(query.tree):
+        return url
+
+
+def extract_urls(query):
+    """Return the distinct sheets used by a query, in order."""
+    query = ParsedQuery.wrap(query)
+    if query.tree is None:
+        url = extract_url(query)
+        return [url] if url else []
+
+    urls = []
+    for url in iter_tables(query.tree):
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
+def iter_tables(json):
+    """Generate the tables in the `FROM` clauses of a parsed query."""
+    if isinstance(json, list):
+        for element in json:
+            for table in iter_tables(element):
+                yield table
+    elif isinstance(json, dict) and 'literal' not in json:
+        for key, value in json.items():
+            if key in ('from', 'join'):
+                for table in iter_from(value):
+                    yield table
+            else:
+                for table in iter_tables(value):
+                    yield table
+
 
-    return url
+def iter_from(from_):
+    if isinstance(from_, string_types):
+        yield from_
+    elif isinstance(from_, list):
+        for element in from_:
+            for table in iter_from(element):
+                yield table
+    elif isinstance(from_, dict) and 'select' in from_:
+        for table in iter_tables(from_):
+            yield table
+    elif isinstance(from_, dict):
+        # an aliased table or subquery, or a JOIN
+        for key, value in from_.items():
+            if key in ('value', 'join'):
+                for table in iter_from(value):
+                    yield table
+            else:
+                for table in iter_tables(value):
+                    yield table
@@ -26,11 +26,29 @@ REQUIRED = [
 ]
 if sys.version_info < (3, 4):
     REQUIRED.append('enum34')
+if sys.version_info < (3, 2):
+    REQUIRED.append('futures')
 
 sqlalchemy_extras = [
     'sqlalchemy',
 ]
 
+numpy_extras = [
+    'numpy',
+]
+
+pandas_extras = [
+    'pandas',
+]
+
+arrow_extras = [
+    'pyarrow',
+]
+
+aio_extras = [
+    'aiohttp',
+]
+
 cli_extras = [
     'docopt',
     'pygments',
@@ -46,10 +64,13 @@ development_extras = [
     'pytest>=2.8',
     'pytest-cov',
     'requests_mock',
+    'rsa',  # test keys for service accounts
     'twine',
 ]
 if sys.version_info < (3, 3):
     development_extras.append('mock')
+if sys.version_info >= (3, 5):
+    development_extras.extend(aio_extras)
 
 
 # The rest you shouldn't have to touch too much :)
@@ -126,8 +147,12 @@ setup(
     },
     install_requires=REQUIRED,
     extras_require={
+        'aio': aio_extras,
         'cli': cli_extras,
+        'arrow': arrow_extras,
         'dev': development_extras,
+        'numpy': numpy_extras,
+        'pandas': pandas_extras,
         'sqlalchemy': sqlalchemy_extras,
     },
     include_package_data=True,
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
+import asyncio
+import time
+import unittest
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .context import (
+    aio,
+    column_map_cache,
+    exceptions,
+    INTERACTIVE,
+    remote_failures,
+    translation_cache,
+)
+
+if aiohttp is not None:
+    from .fake_gviz_aio import AsyncFakeGvizServer
+
+
+QUERY = 'SELECT * FROM "http://docs.google.com/"'
+
+cols = [
+    {'id': 'A', 'label': 'country', 'type': 'string'},
+    {'id': 'B', 'label': 'cnt', 'type': 'number'},
+]
+rows = [
+    {'c': [{'v': 'BR'}, {'v': 1.0}]},
+    {'c': [{'v': 'IN'}, {'v': 2.0}]},
+]
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class AsyncTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        column_map_cache.clear()
+        translation_cache.clear()
+        remote_failures.clear()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_with_server(
+        self,
+        test,
+        latency=0,
+        run_queries=False,
+        quota=None,
+        **kwargs
+    ):
+        """Run `test(server, conn)` with a server and a connection to it."""
+        async def run():
+            server = AsyncFakeGvizServer(
+                cols, rows, latency, run_queries, quota)
+            async with server:
+                session = server.client_session()
+                conn = await aio.connect(session=session, **kwargs)
+                try:
+                    return await test(server, conn)
+                finally:
+                    await conn.close()
+                    await session.close()
+
+        return self.loop.run_until_complete(run())
+
+    def test_execute(self):
+        async def test(server, conn):
+            cursor = await conn.execute(QUERY)
+            self.assertEqual(cursor.rowcount, 2)
+            self.assertEqual(
+                [column[0] for column in cursor.description],
+                ['country', 'cnt'])
+            result = await cursor.fetchall()
+            self.assertEqual(result, [('BR', 1.0), ('IN', 2.0)])
+            self.assertEqual(result[0].country, 'BR')
+
+            # the schema is fetched first, then the sheet as CSV
+            self.assertEqual(server.requests[0]['tq'], 'SELECT * LIMIT 0')
+            self.assertEqual(server.requests[1]['tqx'], 'out:csv')
+
+        self.run_with_server(test)
+
+    def test_fetch(self):
+        async def test(server, conn):
+            cursor = conn.cursor()
+            with self.assertRaises(exceptions.Error):
+                await cursor.fetchone()
+
+            await cursor.execute(
+                'SELECT country FROM "http://docs.google.com/" '
+                'WHERE cnt > %(cnt)s',
+                {'cnt': 0},
+            )
+            self.assertEqual(server.requests[-1]['tq'], (
+                'SELECT A WHERE B > 0 OPTIONS no_format'))
+
+            # the fake server ignores the query
+            self.assertEqual(await cursor.fetchone(), ('BR', 1.0))
+            self.assertEqual(await cursor.fetchmany(5), [('IN', 2.0)])
+            self.assertIsNone(await cursor.fetchone())
+
+            await cursor.execute(QUERY)
+            self.assertEqual(
+                [row async for row in cursor], [('BR', 1.0), ('IN', 2.0)])
+
+            cursor.close()
+            with self.assertRaises(exceptions.Error):
+                await cursor.fetchall()
+
+        self.run_with_server(test, as_tuples=True)
+
+    def test_fetch_columns(self):
+        async def test(server, conn):
+            cursor = await conn.execute(QUERY, result_format='columnar')
+            self.assertEqual(cursor.rowcount, 2)
+            columns = await cursor.fetch_columns()
+            self.assertEqual(list(columns['country']), ['BR', 'IN'])
+            self.assertEqual(list(columns['cnt']), [1.0, 2.0])
+            self.assertEqual(await cursor.fetchall(), [])
+            self.assertEqual(cursor.rowcount, 2)
+
+            with self.assertRaises(exceptions.ProgrammingError):
+                await conn.execute(QUERY, result_format='arrow')
+
+        self.run_with_server(test)
+
+    def test_sqlite(self):
+        async def test(server, conn):
+            cursor = await conn.execute(
+                'SELECT country, SUM(cnt) AS total '
+                'FROM "http://docs.google.com/" '
+                'GROUP BY country HAVING SUM(cnt) > 1'
+            )
+            self.assertEqual(await cursor.fetchall(), [('IN', 2.0)])
+            self.assertEqual(cursor.description[1][0], 'total')
+
+        self.run_with_server(test)
+
+    def test_sqlite_pushdown(self):
+        async def test(server, conn):
+            cursor = await conn.execute(
+                'SELECT DISTINCT country FROM "http://docs.google.com/" '
+                'WHERE cnt > 1'
+            )
+            self.assertEqual(await cursor.fetchall(), [('IN',)])
+            self.assertEqual(
+                server.requests[-1]['tq'],
+                'SELECT A, B WHERE B > 1 OPTIONS no_format')
+
+        self.run_with_server(test, run_queries=True)
+
+    def test_sqlite_hybrid(self):
+        async def test(server, conn):
+            cursor = await conn.execute(
+                'SELECT country FROM "http://docs.google.com/" '
+                'GROUP BY country HAVING SUM(cnt) > 1'
+            )
+            self.assertEqual(await cursor.fetchall(), [('IN',)])
+            self.assertEqual(cursor.engine, 'sqlite')
+            self.assertEqual(
+                server.requests[-1]['tq'],
+                'SELECT A, SUM(B) GROUP BY A OPTIONS no_format')
+
+        self.run_with_server(test, run_queries=True)
+
+    def test_result_cache(self):
+        async def test(server, conn):
+            await conn.execute(QUERY)
+            count = len(server.requests)
+            cursor = await conn.execute(QUERY)
+            self.assertEqual(len(await cursor.fetchall()), 2)
+            self.assertEqual(len(server.requests), count)
+
+        self.run_with_server(test, result_cache_size=1024 * 1024)
+
+    def test_mirror(self):
+        async def test(server, conn):
+            query = (
+                'SELECT country FROM "http://docs.google.com/" '
+                'GROUP BY country HAVING SUM(cnt) > {0}'
+            )
+            await conn.execute(query.format(1))
+            count = len(server.requests)
+            cursor = await conn.execute(query.format(0))
+            self.assertEqual(await cursor.fetchall(), [('BR',), ('IN',)])
+            self.assertEqual(len(server.requests), count)
+            self.assertEqual(conn.mirror.hits, 1)
+
+        self.run_with_server(test, mirror_size=1024 * 1024)
+
+    def test_sheets(self):
+        async def test(server, conn):
+            cursor = await conn.execute(
+                'SELECT a.country, b.cnt FROM "http://docs.google.com/a" AS a '
+                'JOIN "http://docs.google.com/b" AS b ON a.cnt = b.cnt')
+            self.assertEqual(cursor.engine, 'sqlite')
+            self.assertEqual(
+                await cursor.fetchall(), [('BR', 1.0), ('IN', 2.0)])
+
+            # the sheets are fetched at the same time
+            self.assertEqual(len(server.requests), 2)
+            self.assertEqual(server.max_in_flight, 2)
+
+        self.run_with_server(test, latency=0.1)
+
+    def test_concurrent_queries(self):
+        async def test(server, conn):
+            await conn.execute(QUERY)  # fetch the schema
+
+            cursors = await asyncio.gather(*[
+                conn.execute(
+                    'SELECT country FROM "http://docs.google.com/" '
+                    'WHERE cnt > {0}'.format(i)
+                )
+                for i in range(10)
+            ])
+            for cursor in cursors:
+                self.assertEqual(len(await cursor.fetchall()), 2)
+            self.assertEqual(len(server.requests), 12)
+            self.assertEqual(server.max_in_flight, 10)
+
+        self.run_with_server(test, latency=0.1)
+
+    def test_coalesced(self):
+        async def test(server, conn):
+            await conn.execute(QUERY)  # fetch the schema
+            count = len(server.requests)
+            coalesced = aio.inflight_requests.coalesced
+
+            cursors = await asyncio.gather(*[
+                conn.execute(QUERY) for i in range(5)])
+            for cursor in cursors:
+                self.assertEqual(
+                    await cursor.fetchall(), [('BR', 1.0), ('IN', 2.0)])
+            self.assertEqual(len(server.requests), count + 1)
+            self.assertEqual(aio.inflight_requests.coalesced - coalesced, 4)
+
+            # each query gets its own copy of the payload
+            payloads = await asyncio.gather(*[
+                aio.run_query(server.url, 'SELECT *', session=conn.session)
+                for i in range(2)
+            ])
+            self.assertEqual(payloads[0], payloads[1])
+            self.assertIsNot(payloads[0], payloads[1])
+            self.assertEqual(len(server.requests), count + 2)
+
+        self.run_with_server(test, latency=0.1)
+
+    def test_rate_limit(self):
+        async def test(server, conn):
+            await conn.execute(QUERY)  # fetch the schema
+
+            stats = aio.scheduler.queue_stats[INTERACTIVE]
+            count = stats.count
+            start = time.time()
+            await asyncio.gather(*[
+                conn.execute(
+                    'SELECT country FROM "http://docs.google.com/" '
+                    'WHERE cnt > {0}'.format(i)
+                )
+                for i in range(3)
+            ])
+            self.assertEqual(stats.count, count + 3)
+            self.assertGreater(time.time() - start, 0.1)
+
+        aio.scheduler.configure(rate=20, burst=1)
+        try:
+            self.run_with_server(test)
+        finally:
+            aio.scheduler.configure()
+
+    @patch.object(aio.scheduler, 'backoff', 0)
+    def test_throttled(self):
+        async def test(server, conn):
+            retries = aio.scheduler.retries
+
+            # throttled requests are retried, and then fail without falling
+            # back to SQLite, which would request the sheet again
+            with self.assertRaises(exceptions.OperationalError):
+                await conn.execute(QUERY)
+            self.assertEqual(len(server.requests), 5)
+            self.assertEqual(server.throttled, 4)
+            self.assertEqual(aio.scheduler.retries, retries + 3)
+
+        self.run_with_server(test, quota=1, mirror_size=1024 * 1024)
+
+    def test_close(self):
+        async def test(server, conn):
+            cursor = conn.cursor()
+            await conn.close()
+            self.assertTrue(cursor.closed)
+            with self.assertRaises(exceptions.Error):
+                conn.cursor()
+
+            # the session was passed in, so it's still open
+            self.assertFalse(conn.session.closed)
+            conn.closed = False  # so it can be closed again
+
+        self.run_with_server(test)
+
+    def test_connect(self):
+        async def test():
+            conn = await aio.connect()
+            self.assertIsInstance(conn.session, aiohttp.ClientSession)
+            async with conn:
+                pass
+            self.assertTrue(conn.closed)
+            self.assertTrue(conn.session.closed)
+
+            with self.assertRaises(exceptions.InterfaceError):
+                await aio.connect(string_encoding='utf-8')
+
+        self.loop.run_until_complete(test())
+
+    def test_get_headers(self):
+        credentials = Mock()
+        credentials.valid = True
+
+        def apply(headers):
+            headers['authorization'] = 'Bearer token'
+        credentials.apply.side_effect = apply
+
+        headers = self.loop.run_until_complete(aio.get_headers(credentials))
+        self.assertEqual(headers, {
+            'X-DataSource-Auth': 'true',
+            'authorization': 'Bearer token',
+        })
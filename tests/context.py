@@ -5,9 +5,21 @@ sys.path.insert(0, os.path.abspath(
     os.path.join(os.path.dirname(__file__), '..')))
 
 import gsheetsdb
+if sys.version_info >= (3, 5):
+    from gsheetsdb import aio
+else:
+    aio = None
 from gsheetsdb import console
 from gsheetsdb import exceptions
-from gsheetsdb.convert import convert_rows
+from gsheetsdb.cache import LRUCache, SingleFlight
+from gsheetsdb.columnar import (
+    convert_columns,
+    DictionaryColumn,
+    rows_to_columns,
+    to_arrow,
+    to_dataframe,
+)
+from gsheetsdb.convert import convert_rows, row_class_cache
 from gsheetsdb.db import (
     apply_parameters,
     Connection,
@@ -16,6 +28,7 @@ from gsheetsdb.db import (
     check_result,
 )
 from gsheetsdb.dialect import add_headers, GSheetsDialect
+from gsheetsdb.hybrid import split_query
 from gsheetsdb.processors import (
     Any,
     CountStar,
@@ -25,13 +38,65 @@ from gsheetsdb.processors import (
     SubsetMatcher,
 )
 from gsheetsdb.query import (
+    column_map_cache,
     execute,
+    FULL_SHEET_QUERY,
+    get_cached_schema,
     get_column_map,
+    get_csv_cols,
     get_description_from_payload,
+    get_plan,
+    get_schema,
+    get_schema_key,
+    get_snapshot_key,
+    inflight_requests,
+    invalidate_schema,
     LEADING,
     run_query,
+    translation_cache,
+    warm_snapshot,
+)
+from gsheetsdb.pushdown import get_pushdown_query
+from gsheetsdb.routing import (
+    choose_engine,
+    find_unsupported,
+    get_shape,
+    GVIZ,
+    record_failure,
+    remote_failures,
+    route_cache,
+    SQLITE,
+)
+from gsheetsdb.scheduler import (
+    BACKGROUND,
+    INTERACTIVE,
+    RequestScheduler,
+    TokenBucket,
 )
+from gsheetsdb.sqlite import SQLiteMirror
+from gsheetsdb.snapshot import SnapshotStore
+from gsheetsdb.steps import call, run as run_steps
 from gsheetsdb.translator import extract_column_aliases, translate
 from gsheetsdb.types import Type
 from gsheetsdb.utils import format_gsheet_error, format_moz_error
-from gsheetsdb.url import extract_url, get_url
+from gsheetsdb.url import (
+    extract_url,
+    extract_urls,
+    get_max_age,
+    get_url,
+    normalize_url,
+)
+from gsheetsdb.transport import get_session
+from gsheetsdb.auth import (
+    CredentialsManager,
+    get_credentials_from_auth,
+    get_credentials_identity,
+)
+from gsheetsdb.parsing import ParsedQuery
+from gsheetsdb.payload import (
+    close_json,
+    decode_csv,
+    decode_payload,
+    decode_stream,
+    iter_lines,
+)
@@ -0,0 +1,442 @@
+# -*- coding: utf-8 -*-
+
+"""
+A local stand-in for the Google Visualization API.
+
+The server answers every query with the same table (queries ending in
+`LIMIT 0` get no rows), and implements the signature protocol: responses
+carry a `sig`, and requests sending the current signature in `tqx` get a
+`not_modified` error instead of the payload. Formatted values (`f`) are
+left out of the cells when the query has `OPTIONS no_format`, and the table
+is sent as CSV when requested with `tqx=out:csv`.
+
+`FakeGvizServer` runs in a thread, and is used with `requests`; an asyncio
+version for `aiohttp` is in `fake_gviz_aio`.
+
+Every response can be delayed by some `latency`; `max_in_flight` is the
+largest number of requests that were being answered at the same time. With
+a `quota`, requests beyond that many per second get a 429 response.
+
+For big tables `rows` can be a function returning an iterator, so that the
+rows are generated while the response is written, instead of being kept in
+memory.
+
+With `run_queries` the server also runs simple queries: a list of columns or
+aggregations of columns, a `WHERE` clause with comparisons to literals,
+`IS [NOT] NULL`, `AND` and `OR`, and a `GROUP BY` on columns.
+
+"""
+
+import csv
+import json
+import operator
+import re
+import threading
+import time
+import zlib
+
+from moz_sql_parser import parse as parse_sql
+from requests.adapters import HTTPAdapter
+from six import StringIO
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib import parse
+
+LEADING = ")]}'\n"
+
+QUERY_REGEX = re.compile(
+    r'^SELECT (?P<select>.+?)'
+    r'(?P<rest>(?: WHERE .+?)?(?: GROUP BY \w+(?:, \w+)*)?)'
+    r'(?: LIMIT 0)?(?: OPTIONS no_format)?$',
+    re.IGNORECASE,
+)
+
+AGGREGATIONS = {
+    'avg': lambda values: sum(values) / len(values) if values else None,
+    'count': len,
+    'max': lambda values: max(values) if values else None,
+    'min': lambda values: min(values) if values else None,
+    'sum': sum,
+}
+
+COMPARISONS = {
+    'eq': operator.eq,
+    'neq': operator.ne,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+}
+
+
+def parse_tqx(tqx):
+    """Parse a `tqx` argument like `sig:123;out:csv`."""
+    return dict(
+        option.split(':', 1) for option in tqx.split(';') if ':' in option)
+
+
+def format_csv(cell):
+    value = cell.get('v') if cell else None
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    return str(value)
+
+
+def remove_format(cell):
+    if cell is None:
+        return None
+    return {key: value for key, value in cell.items() if key != 'f'}
+
+
+def evaluate(condition, values):
+    """Evaluate a parsed condition on a row, given as a dict of values."""
+    op, args = next(iter(condition.items()))
+    if op == 'and':
+        return all(evaluate(arg, values) for arg in args)
+    if op == 'or':
+        return any(evaluate(arg, values) for arg in args)
+    if op == 'missing':
+        return values[args] is None
+    if op == 'exists':
+        return values[args] is not None
+
+    operands = [
+        arg['literal'] if isinstance(arg, dict) else values.get(arg, arg)
+        for arg in args
+    ]
+    if None in operands:
+        return False
+    return COMPARISONS[op](*operands)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeGviz(object):
+
+    """The table and the protocol, shared by the servers."""
+
+    def __init__(
+        self,
+        cols=None,
+        rows=None,
+        latency=0,
+        quota=None,
+        run_queries=False,
+    ):
+        self.cols = cols or []
+        self.rows = rows or []
+        self.latency = latency
+        self.quota = quota
+        self.run_queries = run_queries
+
+        # every request, as a dict of query arguments
+        self.requests = []
+        self.bytes_sent = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        self.throttled = 0
+
+        self._lock = threading.Lock()
+        self._recent = []
+
+    @property
+    def sig(self):
+        if callable(self.rows):
+            return str(id(self.rows))
+        body = json.dumps([self.cols, self.rows], sort_keys=True)
+        return str(zlib.crc32(body.encode('utf-8')) & 0xffffffff)
+
+    def set_table(self, cols, rows):
+        with self._lock:
+            self.cols = cols
+            self.rows = rows
+
+    def get_table(self, tq):
+        """Return the columns and rows of the results of a query."""
+        with self._lock:
+            cols = self.cols
+            rows = [] if tq.upper().endswith('LIMIT 0') else self.rows
+
+        match = QUERY_REGEX.match(tq)
+        if not self.run_queries or match is None:
+            return cols, rows
+        try:
+            tree = parse_sql('SELECT {0} FROM t{1}'.format(
+                match.group('select'), match.group('rest')))
+        except Exception:
+            return cols, rows
+
+        ids = [col['id'] for col in cols]
+        select = tree['select']
+        if select == '*':
+            select = [{'value': id_} for id_ in ids]
+        elif not isinstance(select, list):
+            select = [select]
+        groupby = tree.get('groupby', [])
+        if not isinstance(groupby, list):
+            groupby = [groupby]
+        groupby = [clause['value'] for clause in groupby]
+        aggregated = bool(groupby) or any(
+            isinstance(clause['value'], dict) for clause in select)
+
+        result_cols = []
+        for clause in select:
+            value = clause['value']
+            if isinstance(value, dict):
+                name, id_ = next(iter(value.items()))
+                col = cols[ids.index(id_)]
+                result_cols.append({
+                    'id': '{0}-{1}'.format(name, id_),
+                    'label': '{0} {1}'.format(name, col['label']),
+                    'type': (
+                        col['type'] if name in ('min', 'max') else 'number'),
+                })
+            else:
+                result_cols.append(cols[ids.index(value)])
+
+        def filtered():
+            for row in rows() if callable(rows) else rows:
+                values = {
+                    id_: cell.get('v') if cell else None
+                    for id_, cell in zip(ids, row['c'])
+                }
+                if 'where' not in tree or evaluate(tree['where'], values):
+                    yield row, values
+
+        def run():
+            if not aggregated:
+                for row, values in filtered():
+                    yield {'c': [
+                        row['c'][ids.index(clause['value'])]
+                        for clause in select
+                    ]}
+                return
+
+            groups = {}
+            for row, values in filtered():
+                key = tuple(values[id_] for id_ in groupby)
+                groups.setdefault(key, []).append(values)
+            for key in sorted(groups, key=str):
+                group = groups[key]
+                cells = []
+                for clause in select:
+                    value = clause['value']
+                    if isinstance(value, dict):
+                        name, id_ = next(iter(value.items()))
+                        cells.append({'v': AGGREGATIONS[name]([
+                            values[id_] for values in group
+                            if values[id_] is not None
+                        ])})
+                    else:
+                        cells.append({'v': group[0][value]})
+                yield {'c': cells}
+
+        return result_cols, run
+
+    def start_request(self, args):
+        """Record a request, returning the content type of the response."""
+        with self._lock:
+            self.requests.append(args)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        if parse_tqx(args.get('tqx', '')).get('out') == 'csv':
+            return 'text/csv; charset=utf-8'
+        return 'application/json; charset=utf-8'
+
+    def respond(self, args):
+        """Return the body of the response for the query arguments."""
+        return ''.join(self.iter_response(args))
+
+    def iter_response(self, args):
+        """Generate the body of the response in chunks."""
+        tq = args.get('tq', '')
+        tqx = parse_tqx(args.get('tqx', ''))
+        if tqx.get('out') == 'csv':
+            for chunk in self.iter_csv(tq):
+                yield chunk
+            return
+
+        cols, rows = self.get_table(tq)
+        with self._lock:
+            sig = self.sig
+            if tqx.get('sig') == sig:
+                payload = {
+                    'version': '0.6',
+                    'reqId': '0',
+                    'status': 'error',
+                    'errors': [{
+                        'reason': 'not_modified',
+                        'message': 'Data not modified',
+                    }],
+                }
+            else:
+                payload = {
+                    'version': '0.6',
+                    'reqId': '0',
+                    'status': 'ok',
+                    'sig': sig,
+                    'table': {'cols': cols, 'rows': []},
+                }
+
+        yield LEADING
+        if payload['status'] == 'error':
+            yield json.dumps(payload)
+            return
+
+        # write the rows one at a time, since they might be generated lazily
+        no_format = tq.upper().endswith('OPTIONS NO_FORMAT')
+        head, tail = json.dumps(payload).split('"rows": []')
+        yield head + '"rows": ['
+        for i, row in enumerate(rows() if callable(rows) else rows):
+            if no_format:
+                row = {'c': [remove_format(cell) for cell in row['c']]}
+            yield (', ' if i else '') + json.dumps(row)
+        yield ']' + tail
+
+    def iter_csv(self, tq):
+        """Generate the table as CSV, one line at a time."""
+        cols, rows = self.get_table(tq)
+
+        buffer = StringIO()
+        writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+        writer.writerow([col['label'] for col in cols])
+        for row in rows() if callable(rows) else rows:
+            writer.writerow([format_csv(cell) for cell in row['c']])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    def is_throttled(self):
+        """Return whether a request is over the quota."""
+        if self.quota is None:
+            return False
+
+        now = time.time()
+        with self._lock:
+            self._recent = [t for t in self._recent if now - t < 1]
+            if len(self._recent) >= self.quota:
+                self.throttled += 1
+                return True
+            self._recent.append(now)
+            return False
+
+    def end_request(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def count_bytes(self, body):
+        with self._lock:
+            self.bytes_sent += len(body)
+
+
+class FakeGvizServer(FakeGviz):
+
+    def __init__(
+        self,
+        cols=None,
+        rows=None,
+        latency=0,
+        quota=None,
+        run_queries=False,
+    ):
+        super(FakeGvizServer, self).__init__(
+            cols, rows, latency, quota, run_queries)
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return 'http://{0}:{1}/gviz/tq?gid=0'.format(host, port)
+
+    def mount(self, session):
+        """Send requests from a session to docs.google.com to the server."""
+        adapter = RedirectAdapter(self)
+        session.mount('http://docs.google.com', adapter)
+        session.mount('https://docs.google.com', adapter)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                query = parse.urlparse(self.path).query
+                args = dict(parse.parse_qsl(query))
+                content_type = fake.start_request(args)
+                try:
+                    self.respond(args, content_type)
+                finally:
+                    fake.end_request()
+
+            def respond(self, args, content_type):
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                if fake.is_throttled():
+                    self.send_response(429)
+                    self.end_headers()
+                    self.wfile.write(b'Rate limit exceeded')
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.end_headers()
+
+                # the body ends when the connection is closed
+                buffer = []
+                for chunk in fake.iter_response(args):
+                    buffer.append(chunk.encode('utf-8'))
+                    if len(buffer) == 1000:
+                        fake._write(self.wfile, buffer)
+                        buffer = []
+                fake._write(self.wfile, buffer)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _write(self, wfile, chunks):
+        body = b''.join(chunks)
+        self.count_bytes(body)
+        wfile.write(body)
+
+
+class RedirectAdapter(HTTPAdapter):
+
+    """A transport adapter that sends all requests to a fake server."""
+
+    def __init__(self, server, *args, **kwargs):
+        super(RedirectAdapter, self).__init__(*args, **kwargs)
+        self.server = server
+
+    def send(self, request, **kwargs):
+        host, port = self.server._server.server_address
+        parts = parse.urlparse(request.url)
+        request.url = parse.urlunparse(parts._replace(
+            scheme='http', netloc='{0}:{1}'.format(host, port)))
+        return super(RedirectAdapter, self).send(request, **kwargs)
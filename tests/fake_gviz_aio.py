@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+An asyncio version of the fake Visualization API server, for `aiohttp`.
+
+It serves the same table and protocol as `FakeGvizServer`.
+
+"""
+
+import asyncio
+import socket
+
+import aiohttp
+from aiohttp import web
+
+from .fake_gviz import FakeGviz
+
+
+class AsyncFakeGvizServer(FakeGviz):
+
+    def __init__(
+        self,
+        cols=None,
+        rows=None,
+        latency=0,
+        run_queries=False,
+        quota=None,
+    ):
+        super(AsyncFakeGvizServer, self).__init__(
+            cols, rows, latency, quota, run_queries)
+
+        self._socket = socket.socket()
+        self._socket.bind(('127.0.0.1', 0))
+        self._runner = None
+
+    @property
+    def url(self):
+        host, port = self._socket.getsockname()
+        return 'http://{0}:{1}/gviz/tq?gid=0'.format(host, port)
+
+    def client_session(self, **kwargs):
+        """Build a session that sends requests to docs.google.com here."""
+        host, port = self._socket.getsockname()
+
+        class RedirectRequest(aiohttp.ClientRequest):
+
+            def __init__(self, method, url, *args, **kwargs):
+                if url.host == 'docs.google.com':
+                    url = url.with_scheme('http').with_host(host).with_port(
+                        port)
+                super(RedirectRequest, self).__init__(
+                    method, url, *args, **kwargs)
+
+        return aiohttp.ClientSession(request_class=RedirectRequest, **kwargs)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/{path:.*}', self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.SockSite(self._runner, self._socket).start()
+        return self
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def handle(self, request):
+        args = dict(request.query)
+        content_type = self.start_request(args)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if self.is_throttled():
+                return web.Response(status=429, text='Rate limit exceeded')
+            return await self.respond_async(request, args, content_type)
+        finally:
+            self.end_request()
+
+    async def respond_async(self, request, args, content_type):
+        response = web.StreamResponse(headers={'Content-Type': content_type})
+        await response.prepare(request)
+
+        buffer = []
+        for chunk in self.iter_response(args):
+            buffer.append(chunk.encode('utf-8'))
+            if len(buffer) == 1000:
+                await self._write(response, buffer)
+                buffer = []
+        await self._write(response, buffer)
+        await response.write_eof()
+
+        return response
+
+    async def _write(self, response, chunks):
+        body = b''.join(chunks)
+        self.count_bytes(body)
+        await response.write(body)
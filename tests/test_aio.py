@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+
+import sys
+
+# the tests use `async def`, which needs Python 3.5+
+if sys.version_info >= (3, 5):
+    from .aio_cases import AsyncTestSuite  # noqa: F401
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
+import datetime
+import gc
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from google.oauth2 import credentials as user_credentials
+from google.oauth2 import service_account
+import rsa
+
+from .context import (
+    CredentialsManager,
+    get_credentials_from_auth,
+    get_credentials_identity,
+)
+
+
+private_key = rsa.newkeys(512)[1].save_pkcs1().decode('utf-8')
+
+service_account_info = {
+    'type': 'service_account',
+    'client_email': 'test@example.iam.gserviceaccount.com',
+    'private_key_id': '1',
+    'private_key': private_key,
+    'token_uri': 'https://oauth2.googleapis.com/token',
+}
+
+
+def refresh(credentials, request, lifetime=3600):
+    credentials.token = 'token'
+    credentials.expiry = (
+        datetime.datetime.utcnow() + datetime.timedelta(seconds=lifetime))
+
+
+class AuthTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'key.json')
+        with open(self.path, 'w') as fp:
+            json.dump(service_account_info, fp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_credentials_from_auth(self):
+        self.assertIsNone(get_credentials_from_auth())
+
+        credentials = get_credentials_from_auth(
+            service_account_info=service_account_info, subject='a@b.com')
+        self.assertIsInstance(credentials, service_account.Credentials)
+        self.assertIs(
+            credentials,
+            get_credentials_from_auth(self.path, subject='a@b.com'),
+        )
+
+    def test_load_key_cached(self):
+        manager = CredentialsManager()
+        with patch('gsheetsdb.auth.json.load') as load:
+            load.return_value = service_account_info
+            manager.load_key(self.path)
+            manager.load_key(self.path)
+        self.assertEqual(load.call_count, 1)
+
+    def test_get_credentials_shared(self):
+        manager = CredentialsManager()
+        credentials1 = manager.get_credentials(self.path)
+        credentials2 = manager.get_credentials(self.path)
+        credentials3 = manager.get_credentials(self.path, subject='a@b.com')
+
+        self.assertIs(credentials1, credentials2)
+        self.assertIsNot(credentials1, credentials3)
+        self.assertEqual(credentials3._subject, 'a@b.com')
+
+    def test_ensure_valid_blocking(self):
+        manager = CredentialsManager()
+        credentials = manager.get_credentials(self.path)
+
+        with patch.object(
+            service_account.Credentials,
+            'refresh',
+            autospec=True,
+            side_effect=refresh,
+        ) as mock_refresh:
+            manager.ensure_valid(credentials)
+            manager.ensure_valid(credentials)
+
+        self.assertEqual(mock_refresh.call_count, 1)
+        self.assertEqual(credentials.token, 'token')
+        self.assertEqual(manager.refreshes, 1)
+        self.assertEqual(manager.blocked_queries, 1)
+
+    def test_refresh_locks_released(self):
+        manager = CredentialsManager()
+        credentials = service_account.Credentials.from_service_account_info(
+            service_account_info)
+
+        with patch.object(
+            service_account.Credentials,
+            'refresh',
+            autospec=True,
+            side_effect=refresh,
+        ):
+            manager.ensure_valid(credentials)
+        self.assertEqual(len(manager._refresh_locks), 1)
+
+        del credentials
+        gc.collect()
+        self.assertEqual(len(manager._refresh_locks), 0)
+
+    def test_get_credentials_identity(self):
+        self.assertIsNone(get_credentials_identity(None))
+
+        credentials = get_credentials_from_auth(self.path, subject='a@b.com')
+        self.assertEqual(
+            get_credentials_identity(credentials),
+            ('test@example.iam.gserviceaccount.com', 'a@b.com'))
+
+        # user credentials are identified by their refresh token
+        user1 = user_credentials.Credentials(
+            'token1', refresh_token='refresh1', client_id='client')
+        user2 = user_credentials.Credentials(
+            'token2', refresh_token='refresh1', client_id='client')
+        user3 = user_credentials.Credentials(
+            'token1', refresh_token='refresh2', client_id='client')
+        self.assertEqual(
+            get_credentials_identity(user1), get_credentials_identity(user2))
+        self.assertNotEqual(
+            get_credentials_identity(user1), get_credentials_identity(user3))
+        self.assertNotIn('refresh1', repr(get_credentials_identity(user1)))
+
+    def test_get_credentials_identity_not_reused(self):
+        credentials = user_credentials.Credentials('token')
+        identity = get_credentials_identity(credentials)
+        self.assertEqual(get_credentials_identity(credentials), identity)
+
+        # new credentials may get the same id after these are collected
+        identities = {identity}
+        for _ in range(10):
+            del credentials
+            gc.collect()
+            credentials = user_credentials.Credentials('token')
+            identity = get_credentials_identity(credentials)
+            self.assertNotIn(identity, identities)
+            identities.add(identity)
+
+    def test_ensure_valid_background(self):
+        manager = CredentialsManager()
+        credentials = manager.get_credentials(self.path)
+
+        # token is still valid, but about to expire
+        refresh(credentials, None, lifetime=60)
+        old_expiry = credentials.expiry
+
+        with patch.object(
+            service_account.Credentials,
+            'refresh',
+            autospec=True,
+            side_effect=refresh,
+        ):
+            manager.ensure_valid(credentials)
+            for _ in range(100):
+                if manager.refreshes:
+                    break
+                time.sleep(0.01)
+
+        self.assertEqual(manager.refreshes, 1)
+        self.assertEqual(manager.blocked_queries, 0)
+        self.assertGreater(credentials.expiry, old_expiry)
+
+    def test_ensure_valid_not_google_credentials(self):
+        manager = CredentialsManager()
+        credentials = Mock()
+        manager.ensure_valid(credentials)
+        credentials.refresh.assert_not_called()
+        self.assertEqual(manager.refreshes, 0)
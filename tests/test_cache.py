@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import threading
+import time
+import unittest
+
+from .context import LRUCache, SingleFlight
+
+
+class CacheTestSuite(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = LRUCache()
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIn('a', cache)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_lru_eviction(self):
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.evictions, 1)
+
+    @patch('gsheetsdb.cache.time')
+    def test_ttl(self, time):
+        cache = LRUCache(ttl=10)
+        time.time.return_value = 0
+        cache.set('a', 1)
+
+        time.time.return_value = 10
+        self.assertEqual(cache.get('a'), 1)
+
+        time.time.return_value = 11
+        self.assertIsNone(cache.get('a'))
+        self.assertNotIn('a', cache)
+
+    @patch('gsheetsdb.cache.time')
+    def test_revalidation(self, time):
+        cache = LRUCache(ttl=10)
+        time.time.return_value = 0
+        cache.set('a', 1, size=5)
+
+        # expired entries are kept until evicted
+        time.time.return_value = 11
+        self.assertIsNone(cache.get('a'))
+        entry = cache.get_stale('a')
+        self.assertEqual(entry.value, 1)
+        self.assertEqual(entry.size, 5)
+        self.assertIsNone(cache.get_stale('b'))
+
+        cache.refresh('a')
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.revalidations, 1)
+
+    def test_max_size(self):
+        cache = LRUCache(max_size=10)
+        cache.set('a', 1, size=4)
+        cache.set('b', 2, size=4)
+        self.assertEqual(cache.size, 8)
+
+        cache.set('c', 3, size=4)
+        self.assertEqual(cache.size, 8)
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.evictions, 1)
+
+        # too big to be cached
+        cache.set('d', 4, size=11)
+        self.assertNotIn('d', cache)
+        self.assertEqual(cache.size, 8)
+
+        cache.set('b', 5, size=1)
+        self.assertEqual(cache.size, 5)
+
+    @patch('gsheetsdb.cache.time')
+    def test_entry_ttl(self, time):
+        cache = LRUCache(ttl=10)
+        time.time.return_value = 0
+        cache.set('a', 1, ttl=100)
+        cache.set('b', 2)
+
+        time.time.return_value = 50
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+
+    def test_invalidate(self):
+        cache = LRUCache()
+        cache.set(('a', 1), 1)
+        cache.set(('a', 2), 2)
+        cache.set(('b', 1), 3)
+
+        cache.invalidate(lambda key: key[0] == 'a')
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get(('b', 1)), 3)
+
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+    def test_clear(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        cache.get('a')
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.hits, 0)
+
+
+class SingleFlightTestSuite(unittest.TestCase):
+
+    def run_concurrently(self, flights, function, release, n=5):
+        """
+        Call `function` from `n` threads, returning their outcomes.
+
+        `release` is set once all the threads are waiting for the same call.
+
+        """
+        outcomes = [None] * n
+
+        def run(i):
+            try:
+                outcomes[i] = flights.do('key', function)
+            except Exception as e:
+                outcomes[i] = e
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+        for thread in threads:
+            thread.start()
+
+        # wait until the other threads joined the first call
+        deadline = time.time() + 5
+        while flights.coalesced < n - 1 and time.time() < deadline:
+            time.sleep(0.01)
+        release.set()
+
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_do(self):
+        flights = SingleFlight()
+        self.assertEqual(flights.do('key', lambda: 1), (1, False))
+        self.assertEqual(flights.do('key', lambda: 2), (2, False))
+        self.assertEqual(flights.coalesced, 0)
+
+    def test_coalesce(self):
+        flights = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def function():
+            calls.append(1)
+            release.wait()
+            return object()
+
+        outcomes = self.run_concurrently(flights, function, release)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flights.coalesced, 4)
+        self.assertEqual(len(set(id(result) for result, _ in outcomes)), 1)
+        self.assertTrue(all(shared for _, shared in outcomes))
+
+        # the call is done, so the next one is not coalesced
+        self.assertEqual(flights.do('key', function)[1], False)
+        self.assertEqual(len(calls), 2)
+
+    def test_coalesce_error(self):
+        flights = SingleFlight()
+        release = threading.Event()
+
+        def function():
+            release.wait()
+            raise ValueError('error')
+
+        outcomes = self.run_concurrently(flights, function, release)
+        self.assertTrue(all(isinstance(e, ValueError) for e in outcomes))
+        self.assertEqual(flights.coalesced, 4)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from array import array
+import datetime
+import math
+import sys
+import unittest
+
+from .context import (
+    convert_columns,
+    DictionaryColumn,
+    exceptions,
+    get_description_from_payload,
+    rows_to_columns,
+    to_arrow,
+    to_dataframe,
+    Type,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+class ColumnarTestSuite(unittest.TestCase):
+
+    cols = [
+        {'id': 'A', 'label': 'country', 'type': 'string'},
+        {'id': 'B', 'label': 'cnt', 'type': 'number'},
+        {'id': 'C', 'label': 'active', 'type': 'boolean'},
+        {'id': 'D', 'label': 'day', 'type': 'date'},
+        {'id': 'E', 'label': 'time', 'type': 'datetime'},
+        {'id': 'F', 'label': 'hour', 'type': 'timeofday'},
+    ]
+
+    rows = [
+        {'c': [
+            {'v': 'BR'},
+            {'v': 1.0},
+            {'v': True},
+            {'v': 'Date(2018,0,1)'},
+            {'v': 'Date(2018,8,1,12,30,0)'},
+            {'v': [17, 0, 0, 0]},
+        ]},
+        {'c': [{'v': 'IN'}, None, {'v': False}, None, None, None]},
+    ]
+
+    @unittest.skipIf(np is None, 'NumPy is not installed')
+    def test_convert_columns_numpy(self):
+        result = convert_columns(self.cols, self.rows)
+        self.assertEqual(
+            list(result), ['country', 'cnt', 'active', 'day', 'time', 'hour'])
+
+        self.assertEqual(result['country'].dtype, np.object_)
+        self.assertEqual(list(result['country']), ['BR', 'IN'])
+
+        self.assertEqual(result['cnt'].dtype, np.float64)
+        self.assertEqual(result['cnt'][0], 1.0)
+        self.assertTrue(np.isnan(result['cnt'][1]))
+
+        self.assertEqual(result['active'].dtype, np.bool_)
+        self.assertEqual(list(result['active']), [True, False])
+
+        self.assertEqual(result['day'].dtype, np.dtype('datetime64[D]'))
+        self.assertEqual(result['day'][0], np.datetime64('2018-01-01'))
+        self.assertTrue(np.isnat(result['day'][1]))
+
+        self.assertEqual(result['time'].dtype, np.dtype('datetime64[us]'))
+        self.assertEqual(
+            result['time'][0], np.datetime64('2018-09-01T12:30:00'))
+
+        self.assertEqual(
+            list(result['hour']), [datetime.time(17, 0), None])
+
+    @patch('gsheetsdb.columnar.np', None)
+    def test_convert_columns_no_numpy(self):
+        result = convert_columns(self.cols, self.rows)
+
+        self.assertEqual(result['country'], ['BR', 'IN'])
+        self.assertIsInstance(result['cnt'], array)
+        self.assertEqual(result['cnt'][0], 1.0)
+        self.assertTrue(math.isnan(result['cnt'][1]))
+        self.assertEqual(result['active'], array(str('b'), [1, 0]))
+        self.assertEqual(result['day'], [datetime.date(2018, 1, 1), None])
+        self.assertEqual(
+            result['time'], [datetime.datetime(2018, 9, 1, 12, 30), None])
+
+    @patch('gsheetsdb.columnar.np', None)
+    def test_convert_columns_boolean_nulls(self):
+        cols = [{'id': 'A', 'label': 'active', 'type': 'boolean'}]
+        rows = [{'c': [{'v': True}]}, {'c': [None]}]
+        result = convert_columns(cols, rows)
+        self.assertEqual(result['active'], [True, None])
+
+    @patch('gsheetsdb.columnar.np', None)
+    def test_rows_to_columns(self):
+        description = [
+            ('country', Type.STRING, None, None, None, None, True),
+            ('total', None, None, None, None, None, True),
+            ('first', None, None, None, None, None, True),
+        ]
+        rows = [
+            ('BR', 1.0, datetime.date(2018, 1, 1)),
+            ('IN', 2, None),
+        ]
+        result = rows_to_columns(description, rows)
+        self.assertEqual(result['country'], ['BR', 'IN'])
+        self.assertEqual(result['total'], array(str('d'), [1.0, 2.0]))
+        self.assertEqual(result['first'], [datetime.date(2018, 1, 1), None])
+
+        result = rows_to_columns(description, [])
+        self.assertEqual(list(result), ['country', 'total', 'first'])
+        self.assertEqual(result['country'], [])
+
+    @patch('gsheetsdb.columnar.np', None)
+    def test_duplicate_labels(self):
+        cols = [
+            {'id': 'A', 'label': 'a', 'type': 'number'},
+            {'id': 'B', 'label': 'a', 'type': 'string'},
+        ]
+        rows = [{'c': [{'v': 1.0}, {'v': 'x'}]}]
+        result = convert_columns(cols, rows)
+        self.assertEqual(list(result), ['a', 'a'])
+        self.assertEqual(len(result), 2)
+        self.assertEqual(
+            result.items(), [('a', array(str('d'), [1.0])), ('a', ['x'])])
+        self.assertEqual(result['a'], array(str('d'), [1.0]))
+
+        description = [
+            ('a', None, None, None, None, None, True),
+            ('a', None, None, None, None, None, True),
+        ]
+        result = rows_to_columns(description, [(1.0, 'x')])
+        self.assertEqual(result.values(), [array(str('d'), [1.0]), ['x']])
+
+    @unittest.skipIf(pd is None, 'pandas is not installed')
+    def test_to_dataframe_duplicate_labels(self):
+        description = [
+            ('a', None, None, None, None, None, True),
+            ('a', None, None, None, None, None, True),
+        ]
+        result = to_dataframe(rows_to_columns(description, [(1.0, 'x')]))
+        self.assertEqual(list(result.columns), ['a', 'a'])
+        self.assertEqual(result.values.tolist(), [[1.0, 'x']])
+
+    def test_dictionary_encoding(self):
+        cols = [{'id': 'A', 'label': 'country', 'type': 'string'}]
+        rows = [
+            {'c': [{'v': 'BR'}]},
+            {'c': [{'v': 'IN'}]},
+            {'c': [None]},
+            {'c': [{'v': 'BR'}]},
+        ]
+        result = convert_columns(cols, rows, string_encoding='dictionary')
+        column = result['country']
+        self.assertIsInstance(column, DictionaryColumn)
+        self.assertEqual(list(column.codes), [0, 1, -1, 0])
+        self.assertEqual(column.categories, ['BR', 'IN'])
+        self.assertEqual(len(column), 4)
+        self.assertEqual(list(column), ['BR', 'IN', None, 'BR'])
+        self.assertEqual(column[2], None)
+        self.assertEqual(column[3], 'BR')
+
+        result = convert_columns(cols, rows, string_encoding='intern')
+        self.assertEqual(list(result['country']), ['BR', 'IN', None, 'BR'])
+
+    @unittest.skipIf(pd is None, 'pandas is not installed')
+    def test_to_dataframe_dictionary(self):
+        columns = convert_columns(
+            self.cols, self.rows, string_encoding='dictionary')
+        result = to_dataframe(columns)
+        self.assertEqual(str(result['country'].dtype), 'category')
+        self.assertEqual(list(result['country']), ['BR', 'IN'])
+
+    @unittest.skipIf(pa is None, 'pyarrow is not installed')
+    def test_to_arrow_dictionary(self):
+        cols = [{'id': 'A', 'label': 'country', 'type': 'string'}]
+        rows = [{'c': [{'v': 'BR'}]}, {'c': [None]}, {'c': [{'v': 'BR'}]}]
+        columns = convert_columns(cols, rows, string_encoding='dictionary')
+        description = get_description_from_payload({'table': {'cols': cols}})
+        result = to_arrow(description, columns)
+        self.assertEqual(
+            result.schema.types, [pa.dictionary(pa.int32(), pa.string())])
+        self.assertEqual(
+            result.column('country').to_pylist(), ['BR', None, 'BR'])
+
+    @unittest.skipIf(pd is None, 'pandas is not installed')
+    def test_to_dataframe(self):
+        columns = convert_columns(self.cols, self.rows)
+        result = to_dataframe(columns)
+        self.assertEqual(
+            [str(dtype) for dtype in result.dtypes],
+            [
+                'object',
+                'float64',
+                'bool',
+                'datetime64[ns]',
+                'datetime64[ns]',
+                'object',
+            ],
+        )
+        self.assertEqual(list(result['country']), ['BR', 'IN'])
+        self.assertTrue(pd.isnull(result['day'][1]))
+
+    @unittest.skipIf(pa is None, 'pyarrow is not installed')
+    def test_to_arrow(self):
+        columns = convert_columns(self.cols, self.rows)
+        description = get_description_from_payload(
+            {'table': {'cols': self.cols}})
+        result = to_arrow(description, columns)
+        self.assertEqual(
+            result.schema.types,
+            [
+                pa.string(),
+                pa.float64(),
+                pa.bool_(),
+                pa.date32(),
+                pa.timestamp('us'),
+                pa.time64('us'),
+            ],
+        )
+        self.assertEqual(result.column('cnt').to_pylist(), [1.0, None])
+        self.assertEqual(
+            result.column('day').to_pylist(),
+            [datetime.date(2018, 1, 1), None],
+        )
+
+    def test_missing_dependencies(self):
+        columns = convert_columns(self.cols, self.rows)
+        with patch.dict(sys.modules, {'pandas': None, 'pyarrow': None}):
+            with self.assertRaises(exceptions.NotSupportedError):
+                to_dataframe(columns)
+            with self.assertRaises(exceptions.NotSupportedError):
+                to_arrow([], columns)
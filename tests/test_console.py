@@ -5,16 +5,29 @@ try:
 except ImportError:
     from mock import patch
 
+import shutil
+import tempfile
 import unittest
 
 import requests_mock
 from six import StringIO
 
-from .context import console, exceptions
+from .context import (
+    column_map_cache,
+    console,
+    exceptions,
+    remote_failures,
+    translation_cache,
+)
 
 
 class ConsoleTestSuite(unittest.TestCase):
 
+    def setUp(self):
+        column_map_cache.clear()
+        translation_cache.clear()
+        remote_failures.clear()
+
     @patch('gsheetsdb.console.docopt')
     @patch('sys.stdout', new_callable=StringIO)
     @patch('gsheetsdb.console.prompt')
@@ -29,6 +42,24 @@ class ConsoleTestSuite(unittest.TestCase):
         console.main()
         self.assertEqual(stdout.getvalue(), 'See ya!\n')
 
+    @patch('gsheetsdb.console.docopt')
+    @patch('gsheetsdb.console.connect')
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('gsheetsdb.console.prompt')
+    def test_main_snapshots(self, prompt, stdout, connect, docopt):
+        docopt.return_value = {
+            '--headers': '0',
+            '--raise': False,
+            '--service-account-file': None,
+            '--subject': None,
+            '--snapshot-dir': '/tmp/snapshots',
+            '--snapshot-ttl': '300',
+        }
+        prompt.side_effect = EOFError()
+        console.main()
+        connect.assert_called_once_with(
+            None, snapshot_dir='/tmp/snapshots', snapshot_ttl=300.0)
+
     @patch('gsheetsdb.console.docopt')
     @requests_mock.Mocker()
     @patch('sys.stdout', new_callable=StringIO)
@@ -76,7 +107,8 @@ class ConsoleTestSuite(unittest.TestCase):
             json=header_payload,
         )
         m.get(
-            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A',
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
             json=query_payload,
         )
 
@@ -138,3 +170,54 @@ class ConsoleTestSuite(unittest.TestCase):
         prompt.side_effect = gen()
         with self.assertRaises(exceptions.ProgrammingError):
             console.main()
+
+    @patch('gsheetsdb.console.docopt')
+    @requests_mock.Mocker()
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_warm_purge(self, m, stdout, docopt):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        payload = {
+            'status': 'ok',
+            'table': {
+                'cols': [{'id': 'A', 'label': 'country', 'type': 'string'}],
+                'rows': [{'c': [{'v': 'BR'}]}, {'c': [{'v': 'IN'}]}],
+            },
+        }
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json=payload,
+        )
+
+        docopt.return_value = {
+            'warm': True,
+            'purge': False,
+            '<url>': ['http://docs.google.com/', 'http://example.com/'],
+            '--headers': '0',
+            '--raise': False,
+            '--service-account-file': None,
+            '--subject': None,
+            '--snapshot-dir': path,
+            '--snapshot-ttl': '60',
+        }
+        console.main()
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(lines[0], 'http://docs.google.com/: 2 rows')
+        self.assertTrue(lines[1].startswith('http://example.com/: '))
+
+        docopt.return_value = {
+            'warm': False,
+            'purge': True,
+            '--expired': False,
+            '--snapshot-dir': path,
+            '--snapshot-ttl': None,
+        }
+        console.main()
+        self.assertEqual(
+            stdout.getvalue().splitlines()[-1],
+            'Removed 1 snapshots from {0}'.format(path))
@@ -4,7 +4,7 @@ from collections import namedtuple
 import datetime
 import unittest
 
-from .context import convert_rows
+from .context import convert_rows, row_class_cache
 
 
 class ConvertTestSuite(unittest.TestCase):
@@ -101,3 +101,73 @@ class ConvertTestSuite(unittest.TestCase):
             ),
         ]
         self.assertEqual(result, expected)
+
+    def test_convert_as_tuples(self):
+        cols = self.payload['table']['cols']
+        rows = self.payload['table']['rows']
+        result = convert_rows(cols, rows, as_tuples=True)
+        expected = [
+            (
+                datetime.datetime(2018, 9, 1, 0, 0),
+                1.0,
+                True,
+                datetime.date(2018, 1, 1),
+                datetime.time(17, 0),
+                'test',
+            ),
+            (None, 1.0, True, None, None, 'test'),
+        ]
+        self.assertEqual(result, expected)
+        self.assertIs(type(result[0]), tuple)
+
+    def test_convert_reuses_row_class(self):
+        row_class_cache.clear()
+        cols = self.payload['table']['cols']
+        rows = self.payload['table']['rows']
+        first = convert_rows(cols, rows)
+        second = convert_rows(cols, rows)
+        self.assertIs(type(first[0]), type(second[0]))
+        self.assertEqual(len(row_class_cache), 1)
+
+    def test_convert_extra_cells(self):
+        cols = [{'id': 'A', 'label': 'a', 'type': 'date'}]
+        rows = [
+            {'c': [{'v': 'Date(2018,0,1)'}, {'v': 1.0}]},
+            {'c': [{'v': None}]},
+        ]
+        result = convert_rows(cols, rows)
+        self.assertEqual(result, [(datetime.date(2018, 1, 1),), (None,)])
+
+    def test_convert_intern_strings(self):
+        cols = [
+            {'id': 'A', 'label': 'country', 'type': 'string'},
+            {'id': 'B', 'label': 'team', 'type': 'string'},
+        ]
+        # build the strings at runtime, so they're different objects
+        rows = [
+            {'c': [{'v': ''.join(['B', 'R'])}, {'v': ''.join(['B', 'R'])}]},
+            {'c': [{'v': ''.join(['B', 'R'])}, None]},
+        ]
+        self.assertIsNot(rows[0]['c'][0]['v'], rows[1]['c'][0]['v'])
+
+        result = convert_rows(cols, rows, intern_strings=True)
+        self.assertEqual(result, [('BR', 'BR'), ('BR', None)])
+        self.assertIs(result[0].country, result[1].country)
+        self.assertIs(result[0].country, result[0].team)
+
+        result = convert_rows(cols, rows)
+        self.assertIsNot(result[0].country, result[1].country)
+
+    def test_convert_compact_rows(self):
+        cols = self.payload['table']['cols']
+        rows = [
+            tuple(cell['v'] if cell else None for cell in row['c'])
+            for row in self.payload['table']['rows']
+        ]
+        self.assertEqual(
+            convert_rows(cols, rows),
+            convert_rows(cols, self.payload['table']['rows']),
+        )
+
+        cols = [{'id': 'A', 'label': 'a', 'type': 'number'}]
+        self.assertEqual(convert_rows(cols, [(1.0, 'extra')]), [(1.0,)])
@@ -1,20 +1,45 @@
 # -*- coding: utf-8 -*-
 
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
 from collections import namedtuple
+import datetime
+import shutil
+import tempfile
 import unittest
 
+from moz_sql_parser import parse
 import requests_mock
 
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+from .fake_gviz import FakeGvizServer
 from .context import (
     apply_parameters,
+    column_map_cache,
     Connection,
     connect,
     exceptions,
+    remote_failures,
+    route_cache,
+    translation_cache,
 )
 
 
 class DBTestSuite(unittest.TestCase):
 
+    def setUp(self):
+        column_map_cache.clear()
+        translation_cache.clear()
+        remote_failures.clear()
+        route_cache.clear()
+
     header_payload = {
         'table': {
             'cols': [
@@ -48,11 +73,58 @@ class DBTestSuite(unittest.TestCase):
         },
     }
 
+    # the results of `SELECT country, SUM(cnt) ... GROUP BY country`
+    grouped_payload = {
+        'status': 'ok',
+        'table': {
+            'cols': [
+                {'id': 'A', 'label': 'country', 'type': 'string'},
+                {'id': 'sum-B', 'label': 'sum cnt', 'type': 'number'},
+            ],
+            'rows': [
+                {'c': [{'v': 'BR'}, {'v': 1.0}]},
+                {'c': [{'v': 'IN'}, {'v': 2.0}]},
+            ],
+        },
+    }
+
     def test_connection(self):
         conn = connect()
         self.assertFalse(conn.closed)
         self.assertEqual(conn.cursors, [])
 
+    def test_connection_session(self):
+        conn = connect(pool_maxsize=2)
+        adapter = conn.session.get_adapter('https://docs.google.com/')
+        self.assertEqual(adapter._pool_maxsize, 2)
+
+        # all cursors share the pooled session
+        cursor1 = conn.cursor()
+        cursor2 = conn.cursor()
+        self.assertIs(cursor1.session, conn.session)
+        self.assertIs(cursor2.session, conn.session)
+
+    @requests_mock.Mocker()
+    def test_connection_reuses_session(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json=self.query_payload,
+        )
+
+        with patch('gsheetsdb.query.get_session') as get_session:
+            with Connection() as conn:
+                conn.execute('SELECT * FROM "http://docs.google.com/"')
+                conn.execute('SELECT * FROM "http://docs.google.com/"')
+        get_session.assert_not_called()
+
+        # the column map is fetched only once
+        self.assertEqual(m.call_count, 3)
+
     def test_check_closed(self):
         conn = connect()
         conn.close()
@@ -82,7 +154,8 @@ class DBTestSuite(unittest.TestCase):
             json=self.header_payload,
         )
         m.get(
-            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A',
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
             json=self.query_payload,
         )
 
@@ -93,6 +166,49 @@ class DBTestSuite(unittest.TestCase):
         expected = [Row(country=u'BR', cnt=1.0), Row(country=u'IN', cnt=2.0)]
         self.assertEqual(result, expected)
 
+    def test_connection_execute_many_concurrently(self):
+        cols = self.header_payload['table']['cols']
+        rows = self.query_payload['table']['rows']
+        queries = [
+            'SELECT * FROM "http://docs.google.com/"',
+            (
+                'SELECT country FROM "http://docs.google.com/" '
+                'WHERE cnt > %(cnt)s',
+                {'cnt': 1},
+            ),
+            'SELECT * FROM "http://example.com/"',
+            'SELECT cnt FROM "http://docs.google.com/"',
+        ]
+
+        with FakeGvizServer(cols, rows, latency=0.3) as server:
+            conn = Connection()
+            server.mount(conn.session)
+            # plan the queries one at a time, so that only the requests
+            # overlap when they run concurrently
+            conn.execute_many_concurrently(queries, max_workers=1)
+            self.assertEqual(server.max_in_flight, 1)
+
+            results = conn.execute_many_concurrently(queries, max_workers=4)
+            self.assertEqual(len(results), 4)
+            self.assertEqual(
+                results[0].fetchall(), [('BR', 1.0), ('IN', 2.0)])
+            self.assertEqual(results[1].rowcount, 2)
+            self.assertIsInstance(results[2], exceptions.InterfaceError)
+            self.assertEqual(results[3].rowcount, 2)
+            self.assertEqual(server.max_in_flight, 3)
+
+            # the fake server ignores the query, but it was translated
+            tqs = sorted(args['tq'] for args in server.requests[-3:])
+            self.assertEqual(tqs, [
+                'SELECT * OPTIONS no_format',
+                'SELECT A WHERE B > 1 OPTIONS no_format',
+                'SELECT B OPTIONS no_format',
+            ])
+
+        conn.close()
+        with self.assertRaises(exceptions.Error):
+            conn.execute_many_concurrently(queries)
+
     @requests_mock.Mocker()
     def test_cursor_execute(self, m):
         m.get(
@@ -100,7 +216,8 @@ class DBTestSuite(unittest.TestCase):
             json=self.header_payload,
         )
         m.get(
-            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A',
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
             json=self.query_payload,
         )
 
@@ -112,6 +229,263 @@ class DBTestSuite(unittest.TestCase):
         expected = [Row(country=u'BR', cnt=1.0), Row(country=u'IN', cnt=2.0)]
         self.assertEqual(result, expected)
 
+    @requests_mock.Mocker()
+    def test_cursor_execute_parses_once(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json=self.query_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20A%2C%20SUM(B)%20GROUP%20BY%20A%20OPTIONS%20no_format',
+            json=self.grouped_payload,
+        )
+
+        # HAVING is not supported by the API, so it runs in SQLite
+        query = (
+            'SELECT country, SUM(cnt) FROM "http://docs.google.com/" '
+            'GROUP BY country HAVING SUM(cnt) > 1'
+        )
+        with patch('gsheetsdb.parsing.parse_sql', wraps=parse) as parse_sql:
+            with Connection() as conn:
+                result = conn.execute(query).fetchall()
+        self.assertEqual(result, [(u'IN', 2.0)])
+        self.assertEqual(parse_sql.call_count, 1)
+
+    @requests_mock.Mocker()
+    def test_cursor_execute_cached_plan(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json=self.query_payload,
+        )
+
+        # neither routing nor planning parse queries with a cached plan
+        query = 'SELECT * FROM "http://docs.google.com/"'
+        with patch('gsheetsdb.parsing.parse_sql', wraps=parse) as parse_sql:
+            with Connection() as conn:
+                for _ in range(5):
+                    result = conn.execute(query).fetchall()
+        self.assertEqual(result, [(u'BR', 1.0), (u'IN', 2.0)])
+        self.assertEqual(parse_sql.call_count, 1)
+        self.assertEqual(translation_cache.hits, 4)
+
+    def test_cursor_engine(self):
+        cols = self.header_payload['table']['cols']
+        rows = self.query_payload['table']['rows']
+        with FakeGvizServer(cols, rows) as server:
+            conn = Connection()
+            server.mount(conn.session)
+
+            cursor = conn.execute('SELECT * FROM "http://docs.google.com/"')
+            self.assertEqual(cursor.engine, 'gviz')
+
+            # HAVING is not supported, so the API only groups the sheet
+            cursor = conn.execute(
+                'SELECT country, SUM(cnt) FROM "http://docs.google.com/" '
+                'GROUP BY country HAVING SUM(cnt) > 1')
+            self.assertEqual(cursor.engine, 'sqlite')
+            self.assertEqual(cursor.fetchall(), [(u'IN', 2.0)])
+
+        tqs = [args['tq'] for args in server.requests]
+        self.assertEqual(tqs, [
+            'SELECT * LIMIT 0',
+            'SELECT * OPTIONS no_format',
+            'SELECT A, SUM(B) GROUP BY A OPTIONS no_format',
+        ])
+
+    @requests_mock.Mocker()
+    def test_cursor_engine_remembers_failures(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20A%20WHERE%20B%20%3E%201%20OPTIONS%20no_format',
+            status_code=400,
+            text='Invalid query',
+        )
+        # the filter is pushed into the fetch for SQLite
+        for value, text in [(0, '"BR","1"\n"IN","2"\n'), (1, '"IN","2"\n')]:
+            m.get(
+                'http://docs.google.com/gviz/tq?gid=0&'
+                'tq=SELECT%20A%2C%20B%20WHERE%20B%20%3E%20{0}%20'
+                'OPTIONS%20no_format&tqx=out:csv'.format(value),
+                text='"country","cnt"\n' + text,
+                headers={'Content-Type': 'text/csv'},
+            )
+        query = 'SELECT country FROM "http://docs.google.com/" WHERE cnt > {0}'
+
+        conn = Connection()
+        cursor = conn.execute(query.format(1))
+        self.assertEqual(cursor.engine, 'sqlite')
+        self.assertEqual(cursor.fetchall(), [(u'IN',)])
+        self.assertEqual(m.call_count, 3)
+
+        # a query with the same shape goes straight to SQLite
+        cursor = conn.execute(query.format(0))
+        self.assertEqual(cursor.engine, 'sqlite')
+        self.assertEqual(cursor.fetchall(), [(u'BR',), (u'IN',)])
+        self.assertEqual(m.call_count, 4)
+        self.assertEqual(
+            m.last_request.qs['tq'],
+            ['select a, b where b > 0 options no_format'])
+
+    @requests_mock.Mocker()
+    def test_connection_mirror(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json=self.query_payload,
+        )
+        query = (
+            'SELECT country, SUM(cnt) FROM "http://docs.google.com/" '
+            'GROUP BY country HAVING SUM(cnt) > {0}'
+        )
+
+        conn = connect()
+        self.assertIsNone(conn.mirror)
+
+        conn = connect(mirror_size=10000000, mirror_ttl=60)
+        self.assertIs(conn.cursor().mirror, conn.mirror)
+        result = conn.execute(query.format(1)).fetchall()
+        self.assertEqual(result, [(u'IN', 2.0)])
+        result = conn.execute(query.format(0)).fetchall()
+        self.assertEqual(result, [(u'BR', 1.0), (u'IN', 2.0)])
+
+        # the sheet is requested only once
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual(conn.mirror.loads, 1)
+        self.assertEqual(conn.mirror.hits, 1)
+
+        # the sheet is loaded again with other headers
+        conn.execute(query.format(0), headers=1)
+        self.assertEqual(conn.mirror.loads, 2)
+
+        mirror = conn.mirror
+        conn.close()
+        self.assertEqual(len(mirror), 0)
+
+        conn = connect(shared_mirror=True)
+        self.assertIs(conn.mirror, connect(shared_mirror=True).mirror)
+        conn.close()
+
+    def test_connection_shared_mirror_credentials(self):
+        cols = [{'id': 'A', 'label': 'country', 'type': 'string'}]
+        query = (
+            'SELECT a.country FROM "http://docs.google.com/a" AS a '
+            'JOIN "http://docs.google.com/b" AS b ON a.country = b.country'
+        )
+        alice = Mock(spec=['before_request'])
+        bob = Mock(spec=['before_request'])
+        self.addCleanup(connect(shared_mirror=True).mirror.invalidate)
+
+        with FakeGvizServer(cols, [{'c': [{'v': 'BR'}]}]) as alice_server:
+            conn = connect(credentials=alice, shared_mirror=True)
+            alice_server.mount(conn.session)
+            conn.execute('SELECT * FROM "http://docs.google.com/b"')
+
+        with FakeGvizServer(cols, [{'c': [{'v': 'IN'}]}]) as bob_server:
+            conn = connect(credentials=bob, shared_mirror=True)
+            bob_server.mount(conn.session)
+            cursor = conn.execute(query)
+            self.assertEqual(cursor.engine, 'sqlite')
+
+            # every sheet is read with the credentials of the query
+            self.assertEqual(cursor.fetchall(), [(u'IN',)])
+            self.assertEqual(len(bob_server.requests), 2)
+
+            cursor = conn.execute(query)
+            self.assertEqual(cursor.fetchall(), [(u'IN',)])
+            self.assertEqual(len(bob_server.requests), 2)
+
+    @requests_mock.Mocker()
+    def test_connection_snapshots(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json=self.query_payload,
+        )
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        query = (
+            'SELECT country, SUM(cnt) FROM "http://docs.google.com/" '
+            'GROUP BY country HAVING SUM(cnt) > 1'
+        )
+
+        conn = connect(snapshot_dir=path, snapshot_ttl=60)
+        self.assertEqual(conn.cursor().snapshots.path, path)
+        self.assertEqual(conn.execute(query).fetchall(), [(u'IN', 2.0)])
+        self.assertEqual(m.call_count, 1)
+
+        # new connections, in this or other processes, read the snapshot
+        conn = connect(snapshot_dir=path)
+        self.assertEqual(conn.execute(query).fetchall(), [(u'IN', 2.0)])
+        self.assertEqual(m.call_count, 1)
+
+    @requests_mock.Mocker()
+    def test_connection_snapshots_timeofday(self, m):
+        m.get(requests_mock.ANY, json={
+            'status': 'ok',
+            'table': {
+                'cols': [{'id': 'A', 'label': 'at', 'type': 'timeofday'}],
+                'rows': [{'c': [{'v': [12, 30, 0, 0]}]}],
+            },
+        })
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        query = 'SELECT * FROM "http://docs.google.com/"'
+
+        # times of day are lists in the payload, and kept in snapshots too
+        for _ in range(2):
+            conn = connect(snapshot_dir=path, snapshot_ttl=60)
+            result = conn.execute(query).fetchall()
+            self.assertEqual(result, [(datetime.time(12, 30),)])
+        self.assertEqual(conn.cursor().snapshots.hits, 1)
+
+    @requests_mock.Mocker()
+    def test_connection_result_cache(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json=self.query_payload,
+        )
+
+        conn = connect()
+        self.assertIsNone(conn.result_cache)
+
+        conn = connect(result_cache_size=10000, result_cache_ttl=60)
+        self.assertIs(conn.cursor().result_cache, conn.result_cache)
+        Row = namedtuple('Row', 'country cnt')
+        expected = [Row(country=u'BR', cnt=1.0), Row(country=u'IN', cnt=2.0)]
+        for _ in range(3):
+            result = conn.execute(
+                'SELECT * FROM "http://docs.google.com/"').fetchall()
+            self.assertEqual(result, expected)
+
+        # one request for the columns, one for the results
+        self.assertEqual(m.call_count, 2)
+        self.assertEqual(conn.result_cache.hits, 2)
+        self.assertEqual(conn.result_cache.misses, 1)
+
     def test_cursor_executemany(self):
         conn = Connection()
         cursor = conn.cursor()
@@ -125,7 +499,8 @@ class DBTestSuite(unittest.TestCase):
             json=self.header_payload,
         )
         m.get(
-            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A',
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
             json=self.query_payload,
         )
 
@@ -141,7 +516,8 @@ class DBTestSuite(unittest.TestCase):
             json=self.header_payload,
         )
         m.get(
-            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A',
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
             json=self.query_payload,
         )
 
@@ -154,6 +530,10 @@ class DBTestSuite(unittest.TestCase):
         cursor.execute('SELECT * FROM "http://docs.google.com/"')
         self.assertEqual(cursor.rowcount, 2)
 
+        # fetching rows doesn't change the row count
+        cursor.fetchall()
+        self.assertEqual(cursor.rowcount, 2)
+
     @requests_mock.Mocker()
     def test_cursor_fetchone(self, m):
         m.get(
@@ -161,7 +541,8 @@ class DBTestSuite(unittest.TestCase):
             json=self.header_payload,
         )
         m.get(
-            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A',
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
             json=self.query_payload,
         )
 
@@ -181,7 +562,8 @@ class DBTestSuite(unittest.TestCase):
             json=self.header_payload,
         )
         m.get(
-            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A',
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
             json=self.query_payload,
         )
 
@@ -200,7 +582,8 @@ class DBTestSuite(unittest.TestCase):
             json=self.header_payload,
         )
         m.get(
-            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A',
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
             json=self.query_payload,
         )
 
@@ -220,7 +603,8 @@ class DBTestSuite(unittest.TestCase):
             json=self.header_payload,
         )
         m.get(
-            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A',
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
             json=self.query_payload,
         )
 
@@ -234,6 +618,290 @@ class DBTestSuite(unittest.TestCase):
             [Row(country=u'BR', cnt=1.0), Row(country=u'IN', cnt=2.0)],
         )
 
+    @requests_mock.Mocker()
+    def test_cursor_iter_consumes_rows(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json=self.query_payload,
+        )
+
+        conn = Connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM "http://docs.google.com/"')
+        Row = namedtuple('Row', 'country cnt')
+
+        self.assertEqual(cursor.fetchone(), Row(country=u'BR', cnt=1.0))
+        self.assertEqual(list(cursor), [Row(country=u'IN', cnt=2.0)])
+        self.assertEqual(list(cursor), [])
+        self.assertIsNone(cursor.fetchone())
+        self.assertEqual(cursor.fetchmany(10), [])
+        self.assertEqual(cursor.fetchall(), [])
+
+    @requests_mock.Mocker()
+    def test_cursor_as_tuples(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json=self.query_payload,
+        )
+
+        conn = connect(as_tuples=True)
+        cursor = conn.cursor()
+        self.assertTrue(cursor.as_tuples)
+        result = cursor.execute(
+            'SELECT * FROM "http://docs.google.com/"').fetchall()
+        self.assertEqual(result, [(u'BR', 1.0), (u'IN', 2.0)])
+        self.assertIs(type(result[0]), tuple)
+
+    @requests_mock.Mocker()
+    def test_cursor_fetch_columns(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json=self.query_payload,
+        )
+        query = 'SELECT * FROM "http://docs.google.com/"'
+
+        conn = Connection()
+        cursor = conn.execute(query, result_format='columnar')
+        self.assertEqual(cursor.rowcount, 2)
+        result = cursor.fetch_columns()
+        self.assertEqual(list(result), ['country', 'cnt'])
+        self.assertEqual(list(result['country']), [u'BR', u'IN'])
+        self.assertEqual(list(result['cnt']), [1.0, 2.0])
+        self.assertEqual(cursor.fetchall(), [])
+        self.assertEqual(cursor.rowcount, 2)
+
+        # rows can still be fetched from columnar results
+        cursor = conn.execute(query, result_format='columnar')
+        self.assertEqual(cursor.fetchone(), (u'BR', 1.0))
+        result = cursor.fetch_columns()
+        self.assertEqual(list(result['country']), [u'IN'])
+
+        # and columns from row results
+        cursor = conn.execute(query)
+        result = cursor.fetch_columns()
+        self.assertEqual(list(result['cnt']), [1.0, 2.0])
+
+        with self.assertRaises(exceptions.ProgrammingError):
+            conn.execute(query, result_format='arrow')
+
+    @requests_mock.Mocker()
+    def test_cursor_fetch_columns_duplicate_labels(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        country = {'id': 'A', 'label': 'country', 'type': 'string'}
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20A%2C%20A%20OPTIONS%20no_format',
+            json={
+                'status': 'ok',
+                'table': {
+                    'cols': [country, country],
+                    'rows': [{'c': [{'v': 'BR'}, {'v': 'BR'}]}],
+                },
+            },
+        )
+        query = 'SELECT country, country FROM "http://docs.google.com/"'
+
+        conn = Connection()
+        cursor = conn.execute(query, result_format='columnar')
+        self.assertEqual(len(cursor.description), 2)
+        self.assertEqual(cursor.fetchall(), [(u'BR', u'BR')])
+
+        cursor = conn.execute(query, result_format='columnar')
+        result = cursor.fetch_columns()
+        self.assertEqual(list(result), ['country', 'country'])
+
+    @requests_mock.Mocker()
+    def test_cursor_fetch_columns_sqlite(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json=self.query_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20A%2C%20SUM(B)%20GROUP%20BY%20A%20OPTIONS%20no_format',
+            json=self.grouped_payload,
+        )
+        query = (
+            'SELECT country, SUM(cnt) AS total FROM "http://docs.google.com/" '
+            'GROUP BY country HAVING SUM(cnt) > 1'
+        )
+
+        conn = Connection()
+        cursor = conn.execute(query, result_format='columnar')
+        result = cursor.fetch_columns()
+        self.assertEqual(list(result['country']), [u'IN'])
+        self.assertEqual(list(result['total']), [2.0])
+
+    @unittest.skipIf(pd is None, 'pandas is not installed')
+    @requests_mock.Mocker()
+    def test_cursor_fetch_dataframe(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json=self.query_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20A%2C%20SUM(B)%20GROUP%20BY%20A%20OPTIONS%20no_format',
+            json=self.grouped_payload,
+        )
+
+        conn = Connection()
+        for query in [
+            'SELECT * FROM "http://docs.google.com/"',
+            # runs in SQLite
+            'SELECT country, SUM(cnt) AS cnt FROM "http://docs.google.com/" '
+            'GROUP BY country HAVING SUM(cnt) > 0',
+        ]:
+            for result_format in ['rows', 'columnar']:
+                cursor = conn.execute(query, result_format=result_format)
+                result = cursor.fetch_dataframe()
+                self.assertEqual(list(result.columns), ['country', 'cnt'])
+                self.assertEqual(str(result['cnt'].dtype), 'float64')
+                self.assertEqual(list(result['country']), [u'BR', u'IN'])
+
+    @requests_mock.Mocker()
+    def test_cursor_string_encoding(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json=self.query_payload,
+        )
+        query = 'SELECT * FROM "http://docs.google.com/"'
+
+        conn = connect(string_encoding='dictionary')
+        result = conn.execute(query, result_format='columnar').fetch_columns()
+        self.assertEqual(result['country'].categories, [u'BR', u'IN'])
+        result = conn.execute(query).fetchall()
+        self.assertEqual(result, [(u'BR', 1.0), (u'IN', 2.0)])
+
+        with self.assertRaises(exceptions.InterfaceError):
+            connect(string_encoding='utf-8')
+
+    @requests_mock.Mocker()
+    def test_connection_formatted_values(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A',
+            json=self.query_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20A%2C%20SUM(B)%20GROUP%20BY%20A',
+            json=self.grouped_payload,
+        )
+
+        conn = connect(formatted_values=True)
+        self.assertTrue(conn.cursor().formatted_values)
+        result = conn.execute(
+            'SELECT * FROM "http://docs.google.com/"').fetchall()
+        self.assertEqual(result, [(u'BR', 1.0), (u'IN', 2.0)])
+
+        # queries running in SQLite also fetch formatted values
+        result = conn.execute(
+            'SELECT country, SUM(cnt) FROM "http://docs.google.com/" '
+            'GROUP BY country HAVING SUM(cnt) > 1').fetchall()
+        self.assertEqual(result, [(u'IN', 2.0)])
+        self.assertEqual(
+            m.last_request.qs['tq'], ['select a, sum(b) group by a'])
+
+    @requests_mock.Mocker()
+    def test_cursor_stream(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json=self.query_payload,
+        )
+
+        conn = Connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM "http://docs.google.com/"', stream=True)
+        Row = namedtuple('Row', 'country cnt')
+
+        # the number of rows is not known until they're all read
+        self.assertEqual(cursor.rowcount, -1)
+        self.assertEqual(
+            [d[0] for d in cursor.description], ['country', 'cnt'])
+        self.assertEqual(cursor.fetchmany(1), [Row(country=u'BR', cnt=1.0)])
+        self.assertEqual(cursor.fetchall(), [Row(country=u'IN', cnt=2.0)])
+        self.assertTrue(m.last_request.stream)
+
+        cursor.stream = True
+        cursor.execute('SELECT * FROM "http://docs.google.com/"')
+        self.assertEqual(cursor.rowcount, -1)
+        self.assertEqual(len(cursor.fetchall()), 2)
+
+    @requests_mock.Mocker()
+    def test_cursor_stream_processors(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=self.header_payload,
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20COUNT(B)%2C%20COUNT(A)%20OPTIONS%20no_format',
+            json={
+                'status': 'ok',
+                'table': {
+                    'cols': [
+                        {'id': 'count-B', 'label': 'count cnt',
+                         'type': 'number'},
+                        {'id': 'count-A', 'label': 'count country',
+                         'type': 'number'},
+                    ],
+                    'rows': [{'c': [{'v': 2.0}, {'v': 2.0}]}],
+                },
+            },
+        )
+
+        # post-processing needs all the rows, so they're not streamed
+        conn = Connection()
+        cursor = conn.execute(
+            'SELECT COUNT(*) AS total FROM "http://docs.google.com/"',
+            stream=True,
+        )
+        self.assertEqual(cursor.rowcount, 1)
+        self.assertEqual(cursor.fetchall(), [(2,)])
+        self.assertFalse(m.last_request.stream)
+
     def test_apply_parameters(self):
         query = 'SELECT * FROM table WHERE name=%(name)s'
         parameters = {'name': 'Alice'}
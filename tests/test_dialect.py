@@ -13,11 +13,25 @@ from sqlalchemy.engine import create_engine
 from sqlalchemy.engine.url import make_url
 from sqlalchemy.sql import sqltypes
 
-from .context import add_headers, connect, gsheetsdb, GSheetsDialect, Type
+from .context import (
+    add_headers,
+    column_map_cache,
+    connect,
+    gsheetsdb,
+    GSheetsDialect,
+    remote_failures,
+    translation_cache,
+    Type,
+)
 
 
 class DialectTestSuite(unittest.TestCase):
 
+    def setUp(self):
+        column_map_cache.clear()
+        translation_cache.clear()
+        remote_failures.clear()
+
     def test_add_headers(self):
         url = 'http://docs.google.com/'
         headers = 10
@@ -49,6 +63,21 @@ class DialectTestSuite(unittest.TestCase):
         self.assertEqual(
             dialect.url, '{0}://docs.google.com/'.format(dialect.scheme))
 
+    def test_create_connect_args_query(self):
+        dialect = GSheetsDialect()
+
+        url = make_url(
+            'gsheets:///?result_cache_size=1000&result_cache_ttl=60&foo=bar')
+        args = dialect.create_connect_args(url)
+        self.assertEqual(
+            args,
+            ([None], {'result_cache_size': 1000, 'result_cache_ttl': 60.0}),
+        )
+
+        url = make_url('gsheets:///?as_tuples=true')
+        args = dialect.create_connect_args(url)
+        self.assertEqual(args, ([None], {'as_tuples': True}))
+
     def test_get_schema_names(self):
         connection = Mock()
         connection.execute = Mock()
@@ -193,6 +222,36 @@ class DialectTestSuite(unittest.TestCase):
         ]
         self.assertEqual(result, expected)
 
+    def test_get_columns_cached(self):
+        cols = [
+            {'id': 'A', 'label': 'country', 'type': 'string'},
+            {'id': 'B', 'label': 'cnt', 'type': 'number'},
+            {'id': 'C', 'label': '', 'type': 'string'},
+        ]
+        column_map_cache.set(
+            ('http://docs.google.com/gviz/tq?gid=0&headers=1', None), cols)
+        connection = Mock()
+
+        dialect = GSheetsDialect()
+        result = dialect.get_columns(
+            connection, 'http://docs.google.com/?headers=1&gid=0')
+        expected = [
+            {
+                'name': 'country',
+                'type': sqltypes.String,
+                'nullable': True,
+                'default': None,
+            },
+            {
+                'name': 'cnt',
+                'type': sqltypes.Numeric,
+                'nullable': True,
+                'default': None,
+            },
+        ]
+        self.assertEqual(result, expected)
+        connection.execute.assert_not_called()
+
     def test_get_view_names(self):
         connection = connect()
         dialect = GSheetsDialect()
@@ -303,7 +362,8 @@ class DialectTestSuite(unittest.TestCase):
             json=header_payload,
         )
         m.get(
-            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A',
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
             json=header_payload,
         )
         engine = create_engine('gsheets://')
@@ -313,3 +373,40 @@ class DialectTestSuite(unittest.TestCase):
         result = str(query)
         expected = 'SELECT country \nFROM "http://docs.google.com/"'
         self.assertEqual(result, expected)
+
+    @requests_mock.Mocker()
+    def test_stream_results(self, m):
+        cols = [
+            {'id': 'A', 'label': 'country', 'type': 'string'},
+            {'id': 'B', 'label': 'cnt', 'type': 'number'},
+        ]
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json={'status': 'ok', 'table': {'cols': cols, 'rows': []}},
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json={
+                'status': 'ok',
+                'table': {
+                    'cols': cols,
+                    'rows': [
+                        {'c': [{'v': 'BR'}, {'v': 1.0}]},
+                        {'c': [{'v': 'IN'}, {'v': 2.0}]},
+                    ],
+                },
+            },
+        )
+        engine = create_engine('gsheets://')
+        query = 'SELECT * FROM "http://docs.google.com/"'
+
+        result = engine.execute(query)
+        self.assertFalse(result.cursor.stream)
+        self.assertFalse(m.last_request.stream)
+
+        connection = engine.connect().execution_options(stream_results=True)
+        result = connection.execute(query)
+        self.assertTrue(result.cursor.stream)
+        self.assertTrue(m.last_request.stream)
+        self.assertEqual(result.fetchall(), [(u'BR', 1.0), (u'IN', 2.0)])
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import unittest
+
+import requests_mock
+
+from .context import (
+    column_map_cache,
+    connect,
+    remote_failures,
+    split_query,
+)
+from .fake_gviz import FakeGvizServer
+
+
+URL = '"http://docs.google.com/"'
+
+cols = [
+    {'id': 'A', 'label': 'country', 'type': 'string'},
+    {'id': 'B', 'label': 'cnt', 'type': 'number'},
+]
+rows = [
+    {'c': [{'v': 'BR'}, {'v': 1.0}]},
+    {'c': [{'v': 'IN'}, {'v': 2.0}]},
+    {'c': [{'v': 'IN'}, {'v': 3.0}]},
+]
+
+
+class HybridTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        column_map_cache.clear()
+        remote_failures.clear()
+
+    def split_query(self, query):
+        plan = split_query(query.format(url=URL))
+        if plan is None:
+            return None
+        return plan.remote.sql, plan.local.sql, plan.table
+
+    def test_split_having(self):
+        self.assertEqual(
+            self.split_query(
+                'SELECT country FROM {url} GROUP BY country '
+                'HAVING SUM(cnt) > 1'),
+            (
+                'SELECT country AS country, SUM(cnt) AS __hybrid_1 '
+                'FROM "http://docs.google.com/" GROUP BY country',
+                'SELECT country FROM "http://docs.google.com/" '
+                'WHERE __hybrid_1 > 1',
+                'http://docs.google.com/',
+            ),
+        )
+
+    def test_split_order_by_aggregation(self):
+        self.assertEqual(
+            self.split_query(
+                'SELECT t.country FROM {url} AS t GROUP BY t.country '
+                'HAVING SUM(t.cnt) > 1 ORDER BY SUM(t.cnt) DESC LIMIT 5'),
+            (
+                'SELECT country AS country, SUM(cnt) AS __hybrid_1 '
+                'FROM "http://docs.google.com/" GROUP BY country',
+                'SELECT country FROM "http://docs.google.com/" '
+                'WHERE __hybrid_1 > 1 ORDER BY __hybrid_1 DESC LIMIT 5',
+                'http://docs.google.com/',
+            ),
+        )
+
+    def test_split_expressions(self):
+        # expressions keep a name, so that outer queries can refer to them
+        self.assertEqual(
+            self.split_query(
+                'SELECT country, CASE WHEN SUM(cnt) > 1 THEN 1 ELSE 0 END '
+                'AS big FROM {url} GROUP BY country'),
+            (
+                'SELECT country AS country, SUM(cnt) AS __hybrid_1 '
+                'FROM "http://docs.google.com/" GROUP BY country',
+                'SELECT country, CASE WHEN __hybrid_1 > 1 THEN 1 ELSE 0 END '
+                'AS big FROM "http://docs.google.com/"',
+                'http://docs.google.com/',
+            ),
+        )
+        self.assertEqual(
+            self.split_query(
+                'SELECT DISTINCT COUNT(*) FROM {url} GROUP BY country'),
+            (
+                'SELECT country AS country, COUNT(*) AS __hybrid_1 '
+                'FROM "http://docs.google.com/" GROUP BY country',
+                'SELECT DISTINCT(__hybrid_1) AS "COUNT(*)" '
+                'FROM "http://docs.google.com/"',
+                'http://docs.google.com/',
+            ),
+        )
+
+    def test_split_subquery(self):
+        self.assertEqual(
+            self.split_query(
+                'SELECT COUNT(*) FROM (SELECT country, cnt FROM {url} '
+                'WHERE cnt > 1) GROUP BY country HAVING COUNT(*) > 1'),
+            (
+                'SELECT country AS country, cnt AS cnt '
+                'FROM "http://docs.google.com/" WHERE cnt > 1',
+                'SELECT COUNT(*) FROM (SELECT * '
+                'FROM "http://docs.google.com/") GROUP BY country '
+                'HAVING COUNT(*) > 1',
+                'http://docs.google.com/',
+            ),
+        )
+
+    def test_split_unsupported(self):
+        queries = [
+            # runs in the API
+            'SELECT country FROM {url} GROUP BY country',
+            # the parser drops the offset
+            'SELECT country FROM {url} GROUP BY country '
+            'HAVING SUM(cnt) > 1 LIMIT 1 OFFSET 1',
+            # reads the sheet twice
+            'SELECT a.country FROM {url} a JOIN {url} b '
+            'ON a.country = b.country',
+            'SELECT s.country, t.country FROM (SELECT country, cnt '
+            'FROM {url} WHERE cnt > 2) s JOIN {url} t ON s.cnt > t.cnt',
+            # the aggregation can't run in the API
+            'SELECT country FROM {url} GROUP BY country '
+            'HAVING MAX(LENGTH(country)) > 1',
+            # needs a column that is not in the results
+            'SELECT country FROM {url} GROUP BY country '
+            'HAVING SUM(cnt) > 1 AND cnt > 1',
+            'invalid',
+        ]
+        for query in queries:
+            self.assertIsNone(self.split_query(query), query)
+
+    def test_execute(self):
+        query = (
+            'SELECT country, SUM(cnt) AS total FROM {url} GROUP BY country '
+            'HAVING SUM(cnt) > 1 ORDER BY total DESC'.format(url=URL)
+        )
+
+        with FakeGvizServer(cols, rows, run_queries=True) as server:
+            conn = connect()
+            server.mount(conn.session)
+            cursor = conn.execute(query)
+            self.assertEqual(cursor.engine, 'sqlite')
+            self.assertEqual(
+                [column[0] for column in cursor.description],
+                ['country', 'total'])
+            self.assertEqual(cursor.fetchall(), [('IN', 5.0)])
+
+            # the sheet is never fetched, only the groups
+            self.assertEqual(
+                [args['tq'] for args in server.requests],
+                [
+                    'SELECT * LIMIT 0',
+                    'SELECT A, SUM(B) GROUP BY A OPTIONS no_format',
+                ],
+            )
+
+    def test_execute_names(self):
+        queries = [
+            'SELECT country, sum(cnt) FROM {url} GROUP BY country '
+            'HAVING SUM(cnt) > 0',
+            'SELECT country, SUM(cnt)*2 FROM {url} GROUP BY country '
+            'HAVING SUM(cnt) > 0',
+            'SELECT country, CASE WHEN sum(cnt)>1 THEN 1 ELSE 0 END '
+            'FROM {url} GROUP BY country',
+            'SELECT t.country, MAX(t.cnt) FROM {url} AS t '
+            'GROUP BY t.country HAVING MAX(t.cnt) > 0',
+            'SELECT * FROM (SELECT country, sum(cnt) FROM {url} '
+            'GROUP BY country HAVING sum(cnt) > 0)',
+        ]
+
+        def get_names(query):
+            conn = connect()
+            server.mount(conn.session)
+            cursor = conn.execute(query)
+            return [column[0] for column in cursor.description]
+
+        # results have the same names as when running only in SQLite
+        with FakeGvizServer(cols, rows, run_queries=True) as server:
+            for query in queries:
+                query = query.format(url=URL)
+                self.assertIsNotNone(split_query(query), query)
+                names = get_names(query)
+                with patch(
+                    'gsheetsdb.sqlite.split_query',
+                    return_value=None,
+                ):
+                    self.assertEqual(get_names(query), names)
+
+    def test_execute_qualified(self):
+        queries = [
+            (
+                'SELECT s.country FROM (SELECT country, cnt FROM {url} '
+                'WHERE cnt > 1) AS s',
+                [('IN',), ('IN',)],
+            ),
+            (
+                'SELECT DISTINCT s.country FROM (SELECT country, cnt '
+                'FROM {url} WHERE cnt > 1) AS s',
+                [('IN',)],
+            ),
+        ]
+
+        # qualified columns are read from the subquery, not as strings
+        with FakeGvizServer(cols, rows, run_queries=True) as server:
+            for query, expected in queries:
+                conn = connect()
+                server.mount(conn.session)
+                cursor = conn.execute(query.format(url=URL))
+                self.assertEqual(cursor.fetchall(), expected, query)
+
+    @requests_mock.Mocker()
+    def test_execute_rejected(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json={'table': {'cols': cols}},
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20A%2C%20SUM%28B%29%20GROUP%20BY%20A%20'
+            'OPTIONS%20no_format',
+            status_code=400,
+            text='Invalid query',
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json={'status': 'ok', 'table': {'cols': cols, 'rows': rows}},
+        )
+        query = (
+            'SELECT country FROM {url} GROUP BY country '
+            'HAVING SUM(cnt) > 1'.format(url=URL)
+        )
+
+        # the whole sheet is fetched if the API rejects its part
+        conn = connect()
+        self.assertEqual(conn.execute(query).fetchall(), [('IN',)])
+        count = m.call_count
+
+        # and the API is not asked again
+        self.assertEqual(conn.execute(query).fetchall(), [('IN',)])
+        self.assertEqual(m.call_count, count + 1)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import unittest
+
+from moz_sql_parser import parse
+
+from .context import exceptions, ParsedQuery
+
+
+class ParsingTestSuite(unittest.TestCase):
+
+    def test_parsed_query(self):
+        sql = 'SELECT country FROM "http://docs.google.com"'
+        query = ParsedQuery(sql)
+        self.assertEqual(query.sql, sql)
+        self.assertEqual(str(query), sql)
+        self.assertEqual(query.tree, parse(sql))
+
+    def test_parsed_once(self):
+        sql = 'SELECT country FROM "http://docs.google.com"'
+        with patch('gsheetsdb.parsing.parse_sql', wraps=parse) as parse_sql:
+            query = ParsedQuery(sql)
+            parse_sql.assert_not_called()
+            query.tree
+            query.copy()
+            query.copy()
+        self.assertEqual(parse_sql.call_count, 1)
+
+    def test_copy(self):
+        query = ParsedQuery('SELECT country FROM "http://docs.google.com"')
+        tree = query.copy()
+        tree.pop('from')
+        self.assertIn('from', query.tree)
+        self.assertIsNot(query.copy(), query.copy())
+
+    def test_invalid_query(self):
+        query = ParsedQuery('SELECT ORDER BY FROM table')
+        self.assertIsNone(query.tree)
+        with self.assertRaises(exceptions.ProgrammingError):
+            query.copy()
+
+    def test_wrap(self):
+        query = ParsedQuery('SELECT 1')
+        self.assertIs(ParsedQuery.wrap(query), query)
+        self.assertEqual(ParsedQuery.wrap('SELECT 1').sql, 'SELECT 1')
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import json
+import types
+import unittest
+
+from .context import (
+    close_json,
+    decode_csv,
+    decode_payload,
+    decode_stream,
+    iter_lines,
+)
+
+
+def split(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class PayloadTestSuite(unittest.TestCase):
+
+    payload = {
+        'version': '0.6',
+        'status': 'ok',
+        'table': {
+            'cols': [
+                {'id': 'A', 'label': 'country [1]', 'type': 'string'},
+                {'id': 'B', 'label': 'cnt', 'type': 'number'},
+            ],
+            'rows': [
+                {'c': [{'v': 'BR'}, {'v': 1.0}]},
+                {'c': [{'v': u'a "quoted" ]} value'}, {'v': 2.0}]},
+                {'c': [None, {'v': 3.0}]},
+            ],
+            'parsedNumHeaders': 0,
+        },
+    }
+
+    compact_rows = [
+        ('BR', 1.0),
+        (u'a "quoted" ]} value', 2.0),
+        (None, 3.0),
+    ]
+
+    def test_decode_payload(self):
+        for leading in ["", ")]}'\n"]:
+            content = (leading + json.dumps(self.payload)).encode('utf-8')
+            with patch('gsheetsdb.payload.orjson', None):
+                with patch('gsheetsdb.payload.ujson', None):
+                    self.assertEqual(decode_payload(content), self.payload)
+
+            result = decode_payload(content, compact=True)
+            self.assertEqual(
+                result['table']['cols'], self.payload['table']['cols'])
+            self.assertEqual(result['table']['rows'], self.compact_rows)
+            self.assertEqual(result['table']['parsedNumHeaders'], 0)
+
+    def test_decode_payload_backends(self):
+        content = (")]}'\n" + json.dumps(self.payload)).encode('utf-8')
+        for name in ['orjson', 'ujson']:
+            try:
+                backend = __import__(name)
+            except ImportError:
+                continue
+            with patch('gsheetsdb.payload.orjson', None):
+                with patch('gsheetsdb.payload.{0}'.format(name), backend):
+                    self.assertEqual(decode_payload(content), self.payload)
+
+    def test_decode_payload_invalid(self):
+        with self.assertRaises(ValueError):
+            decode_payload(b'{"status": "ok"} extra', compact=True)
+        with self.assertRaises(ValueError):
+            decode_payload(b'<html></html>', compact=True)
+
+    def test_decode_stream_compact(self):
+        text = json.dumps(self.payload)
+        result = decode_stream(split(text, 7), compact=True)
+        self.assertEqual(list(result['table']['rows']), self.compact_rows)
+
+    def test_close_json(self):
+        self.assertEqual(close_json('{"table": {"cols": [1, 2'), ']}}')
+        self.assertEqual(close_json('{"a": "[{", "b": ['), ']}')
+        self.assertEqual(close_json('{"a": "\\"[", "b": {}, "c": ['), ']}')
+        self.assertEqual(close_json(''), '')
+
+    def test_decode_stream(self):
+        text = ")]}'\n" + json.dumps(self.payload)
+        for size in [1, 7, 64, len(text)]:
+            result = decode_stream(split(text, size))
+            self.assertIsInstance(result['table']['rows'], types.GeneratorType)
+            self.assertEqual(result['status'], 'ok')
+            self.assertEqual(
+                result['table']['cols'], self.payload['table']['cols'])
+            self.assertEqual(
+                list(result['table']['rows']), self.payload['table']['rows'])
+
+    def test_decode_stream_is_lazy(self):
+        text = json.dumps(self.payload)
+        consumed = []
+
+        def chunks():
+            for chunk in split(text, 10):
+                consumed.append(chunk)
+                yield chunk
+
+        result = decode_stream(chunks())
+        self.assertLess(len(''.join(consumed)), len(text))
+        next(result['table']['rows'])
+        self.assertLess(len(''.join(consumed)), len(text))
+
+    def test_decode_stream_empty_rows(self):
+        payload = {'status': 'ok', 'table': {'cols': [], 'rows': []}}
+        result = decode_stream(split(json.dumps(payload), 3))
+        self.assertEqual(list(result['table']['rows']), [])
+
+    def test_decode_stream_error(self):
+        payload = {
+            'status': 'error',
+            'errors': [{'reason': 'invalid_query', 'message': 'INVALID'}],
+        }
+        result = decode_stream(split(")]}'\n" + json.dumps(payload), 5))
+        self.assertEqual(result, payload)
+
+    def test_decode_stream_truncated(self):
+        text = json.dumps(self.payload)
+        result = decode_stream([text[:text.index('"v": 2.0')]])
+        rows = result['table']['rows']
+        self.assertEqual(next(rows), self.payload['table']['rows'][0])
+        with self.assertRaises(ValueError):
+            next(rows)
+
+    def test_iter_lines(self):
+        chunks = ['a,b\r', '\n"c\nd",e\n', 'f,', 'g']
+        self.assertEqual(
+            ''.join(iter_lines(chunks)), 'a,b\r\n"c\nd",e\nf,g')
+        self.assertEqual(list(iter_lines(['a\nb\n'])), ['a\n', 'b\n'])
+        self.assertEqual(list(iter_lines([])), [])
+
+    def test_decode_csv(self):
+        cols = [
+            {'id': 'A', 'label': 'country', 'type': 'string'},
+            {'id': 'B', 'label': 'cnt', 'type': 'number'},
+            {'id': 'C', 'label': 'active', 'type': 'boolean'},
+        ]
+        text = (
+            '"country","cnt","active"\n'
+            '"BR","1.0","TRUE"\n'
+            '"a, ""quoted""\nvalue","2","FALSE"\n'
+            '"","",""\n'
+        )
+        result = decode_csv(split(text, 5), cols)
+        self.assertEqual(result['status'], 'ok')
+        self.assertEqual(result['table']['cols'], cols)
+        self.assertIsInstance(result['table']['rows'], types.GeneratorType)
+        self.assertEqual(list(result['table']['rows']), [
+            ('BR', 1.0, True),
+            ('a, "quoted"\nvalue', 2.0, False),
+            (None, None, None),
+        ])
+
+    def test_decode_csv_unexpected_columns(self):
+        cols = [{'id': 'A', 'label': 'country', 'type': 'string'}]
+        with self.assertRaises(ValueError):
+            decode_csv(['"country","cnt"\n"BR","1"\n'], cols)
+        with self.assertRaises(ValueError):
+            decode_csv([], cols)
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import requests_mock
+
+from .context import (
+    column_map_cache,
+    connect,
+    get_pushdown_query,
+    ParsedQuery,
+    remote_failures,
+)
+from .fake_gviz import FakeGvizServer
+
+
+cols = [
+    {'id': 'A', 'label': 'country', 'type': 'string'},
+    {'id': 'B', 'label': 'cnt', 'type': 'number'},
+    {'id': 'C', 'label': 'dt', 'type': 'date'},
+    {'id': 'D', 'label': '', 'type': 'boolean'},
+]
+
+
+class PushdownTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        column_map_cache.clear()
+        remote_failures.clear()
+
+    def get_pushdown_query(self, query, formatted_values=False):
+        query = ParsedQuery(query.format(url='"http://a"'))
+        return get_pushdown_query(query, cols, formatted_values)[0]
+
+    def test_projection(self):
+        queries = [
+            (
+                'SELECT country FROM {url}',
+                'SELECT A OPTIONS no_format',
+            ),
+            (
+                'SELECT Country, SUM(cnt) AS total FROM {url} '
+                'GROUP BY 1 HAVING SUM(cnt) > 1',
+                'SELECT A, B OPTIONS no_format',
+            ),
+            (
+                'SELECT t.cnt FROM {url} AS t ORDER BY t.D',
+                'SELECT B, D OPTIONS no_format',
+            ),
+            (
+                'SELECT a.country FROM {url} AS a '
+                'JOIN {url} AS b ON a.country = b.dt',
+                'SELECT A, C OPTIONS no_format',
+            ),
+            # all columns are needed
+            ('SELECT * FROM {url} ORDER BY cnt', None),
+            ('SELECT DISTINCT t.* FROM {url} AS t', None),
+            ('SELECT COUNT(*) FROM {url} HAVING COUNT(*) > 1', None),
+            ('SELECT country, cnt, dt, D FROM {url} UNION SELECT 1', None),
+        ]
+        for query, expected in queries:
+            self.assertEqual(self.get_pushdown_query(query), expected)
+
+        self.assertEqual(
+            self.get_pushdown_query(
+                'SELECT DISTINCT country FROM {url}', formatted_values=True),
+            'SELECT A')
+
+    def test_filter(self):
+        queries = [
+            (
+                "SELECT DISTINCT country FROM {url} "
+                "WHERE cnt > 1 AND country = 'BR'",
+                "SELECT A, B WHERE B > 1 AND A = 'BR' OPTIONS no_format",
+            ),
+            (
+                "SELECT DISTINCT country FROM {url} "
+                "WHERE (1 <= cnt OR country IS NULL) AND dt IS NOT NULL",
+                "SELECT A, B, C WHERE (1 <= B OR A IS NULL) AND C IS NOT NULL "
+                "OPTIONS no_format",
+            ),
+            (
+                'SELECT x FROM (SELECT DISTINCT country AS x FROM {url} '
+                'WHERE cnt = 2) WHERE x > 1',
+                'SELECT A, B WHERE B = 2 OPTIONS no_format',
+            ),
+            # only the conditions that can run in the API are pushed
+            (
+                "SELECT DISTINCT country FROM {url} "
+                "WHERE cnt > 1 AND country LIKE 'B%' AND NOT cnt = 3",
+                'SELECT A, B WHERE B > 1 OPTIONS no_format',
+            ),
+            (
+                "SELECT DISTINCT country FROM {url} "
+                "WHERE cnt > 1 OR country LIKE 'B%'",
+                'SELECT A, B OPTIONS no_format',
+            ),
+            (
+                "SELECT DISTINCT country FROM {url} "
+                "WHERE cnt != 1 AND cnt > '1' AND country = 1 AND cnt = dt",
+                'SELECT A, B, C OPTIONS no_format',
+            ),
+            (
+                "SELECT DISTINCT country FROM {url} "
+                "WHERE dt > '2018-01-01' AND D = 1",
+                'SELECT A, C, D OPTIONS no_format',
+            ),
+            # the sheet is read twice
+            (
+                'SELECT * FROM {url} WHERE cnt > 1 '
+                'AND cnt > (SELECT AVG(cnt) FROM {url})',
+                None,
+            ),
+            (
+                'SELECT s.country, t.country FROM (SELECT country, cnt '
+                'FROM {url} WHERE cnt > 2) s JOIN {url} t ON s.cnt >= t.cnt',
+                'SELECT A, B OPTIONS no_format',
+            ),
+        ]
+        for query, expected in queries:
+            self.assertEqual(self.get_pushdown_query(query), expected)
+
+    def test_csv_cols(self):
+        query = ParsedQuery('SELECT DISTINCT country, cnt FROM "http://a"')
+        fetch_query, csv_cols = get_pushdown_query(query, cols)
+        self.assertEqual(csv_cols, cols[:2])
+
+        query = ParsedQuery('SELECT DISTINCT country, dt FROM "http://a"')
+        fetch_query, csv_cols = get_pushdown_query(query, cols)
+        self.assertIsNone(csv_cols)
+
+        fetch_query, csv_cols = get_pushdown_query(
+            ParsedQuery('SELECT DISTINCT country, cnt FROM "http://a"'),
+            cols,
+            formatted_values=True,
+        )
+        self.assertIsNone(csv_cols)
+
+    def test_execute(self):
+        sheet_cols = [
+            {'id': 'A', 'label': 'country', 'type': 'string'},
+            {'id': 'B', 'label': 'cnt', 'type': 'number'},
+            {'id': 'C', 'label': 'notes', 'type': 'string'},
+        ]
+        rows = [
+            {'c': [{'v': 'BR'}, {'v': 1.0}, {'v': 'x' * 100}]},
+            {'c': [{'v': 'IN'}, {'v': 2.0}, {'v': 'y' * 100}]},
+            {'c': [{'v': 'IN'}, {'v': 3.0}, None]},
+        ]
+        query = (
+            'SELECT DISTINCT country, cnt FROM "http://docs.google.com/" '
+            'WHERE cnt > 1 ORDER BY cnt'
+        )
+
+        with FakeGvizServer(sheet_cols, rows, run_queries=True) as server:
+            conn = connect()
+            server.mount(conn.session)
+            cursor = conn.execute(query)
+            self.assertEqual(cursor.engine, 'sqlite')
+            self.assertEqual(cursor.fetchall(), [('IN', 2.0), ('IN', 3.0)])
+
+            # the schema, and then only the data needed
+            self.assertEqual(
+                [(args['tq'], args.get('tqx')) for args in server.requests],
+                [
+                    ('SELECT * LIMIT 0', None),
+                    ('SELECT A, B WHERE B > 1 OPTIONS no_format', 'out:csv'),
+                ],
+            )
+
+    def test_execute_joined(self):
+        sheet_cols = [
+            {'id': 'A', 'label': 'country', 'type': 'string'},
+            {'id': 'B', 'label': 'cnt', 'type': 'number'},
+        ]
+        rows = [
+            {'c': [{'v': 'BR'}, {'v': 1.0}]},
+            {'c': [{'v': 'IN'}, {'v': 5.0}]},
+        ]
+        query = (
+            'SELECT s.c, t.country FROM (SELECT country, COALESCE(cnt, 0) '
+            'AS c FROM "http://docs.google.com/" WHERE cnt > 2) s '
+            'JOIN "http://docs.google.com/" t ON s.c >= t.cnt '
+            'ORDER BY t.country'
+        )
+
+        # the subquery filter is not pushed, since the JOIN reads the whole
+        # sheet
+        with FakeGvizServer(sheet_cols, rows, run_queries=True) as server:
+            conn = connect()
+            server.mount(conn.session)
+            cursor = conn.execute(query)
+            self.assertEqual(cursor.fetchall(), [(5.0, 'BR'), (5.0, 'IN')])
+            self.assertNotIn(
+                'WHERE', ' '.join(args['tq'] for args in server.requests))
+
+    @requests_mock.Mocker()
+    def test_execute_rejected(self, m):
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json={'table': {'cols': cols}},
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20A%2C%20B%20WHERE%20B%20%3E%201%20OPTIONS%20no_format',
+            status_code=400,
+            text='Invalid query',
+        )
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
+            json={
+                'status': 'ok',
+                'table': {
+                    'cols': cols,
+                    'rows': [
+                        {'c': [{'v': 'BR'}, {'v': 1.0}, None, None]},
+                        {'c': [{'v': 'IN'}, {'v': 2.0}, None, None]},
+                    ],
+                },
+            },
+        )
+
+        # the whole sheet is fetched if the API rejects the reduced query
+        cursor = connect().execute(
+            'SELECT DISTINCT country FROM "http://docs.google.com/" '
+            'WHERE cnt > 1')
+        self.assertEqual(cursor.fetchall(), [('IN',)])
+        self.assertEqual(m.call_count, 3)
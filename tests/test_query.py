@@ -1,30 +1,55 @@
 # -*- coding: utf-8 -*-
 
 try:
-    from unittest.mock import Mock
+    from unittest.mock import Mock, patch
 except ImportError:
-    from mock import Mock
+    from mock import Mock, patch
 
 from collections import namedtuple
+import shutil
+import tempfile
+import threading
 import unittest
 
+from moz_sql_parser import parse
+import requests
 import requests_mock
 from six import BytesIO
 from urllib3.response import HTTPResponse
 
+from .fake_gviz import FakeGvizServer
 from .context import (
+    column_map_cache,
+    Connection,
     exceptions,
     execute,
+    FULL_SHEET_QUERY,
+    get_cached_schema,
+    get_csv_cols,
     get_column_map,
     get_description_from_payload,
+    get_plan,
+    get_schema,
+    get_schema_key,
+    get_snapshot_key,
+    inflight_requests,
+    invalidate_schema,
     LEADING,
+    LRUCache,
     run_query,
+    SnapshotStore,
+    translation_cache,
     Type,
+    warm_snapshot,
 )
 
 
 class QueryTestSuite(unittest.TestCase):
 
+    def setUp(self):
+        column_map_cache.clear()
+        translation_cache.clear()
+
     @requests_mock.Mocker()
     def test_get_column_map(self, m):
         payload = {
@@ -48,6 +73,43 @@ class QueryTestSuite(unittest.TestCase):
         expected = {'country': 'A', 'cnt': 'B'}
         self.assertEqual(result, expected)
 
+    @requests_mock.Mocker()
+    def test_get_schema_cached(self, m):
+        payload = {
+            'table': {
+                'cols': [
+                    {'id': 'A', 'label': 'country', 'type': 'string'},
+                    {'id': 'B', 'label': 'cnt', 'type': 'number'},
+                ],
+            },
+        }
+        m.get('http://docs.google.com/&tq=SELECT%20%2A%20LIMIT%200',
+              json=payload)
+
+        url = 'http://docs.google.com/'
+        self.assertIsNone(get_cached_schema(url))
+        result = get_schema(url)
+        self.assertEqual(result, payload['table']['cols'])
+        self.assertEqual(get_schema(url), result)
+        self.assertEqual(get_cached_schema(url), result)
+        self.assertEqual(m.call_count, 1)
+
+        # different credentials have their own entries
+        credentials = Mock()
+        get_schema(url, credentials)
+        self.assertEqual(m.call_count, 2)
+
+        invalidate_schema(url, credentials)
+        self.assertIsNone(get_cached_schema(url, credentials))
+        self.assertIsNotNone(get_cached_schema(url))
+
+        invalidate_schema(url)
+        self.assertIsNone(get_cached_schema(url))
+
+        get_schema(url)
+        invalidate_schema()
+        self.assertIsNone(get_cached_schema(url))
+
     @requests_mock.Mocker()
     def test_run_query(self, m):
         m.get('http://docs.google.com/&tq=SELECT%20%2A', json='ok')
@@ -71,17 +133,432 @@ class QueryTestSuite(unittest.TestCase):
         self.assertEqual(result, expected)
 
     @requests_mock.Mocker()
-    def test_run_query_error(self, m):
+    def test_run_query_result_cache(self, m):
+        payload = {
+            'status': 'ok',
+            'table': {
+                'cols': [{'id': 'A', 'label': 'country', 'type': 'string'}],
+                'rows': [{'c': [{'v': 'BR'}]}],
+            },
+        }
+        m.get('http://docs.google.com/&tq=SELECT%20%2A', json=payload)
+
+        cache = LRUCache(max_size=1000)
+        baseurl = 'http://docs.google.com/'
+        query = 'SELECT *'
+        result = run_query(baseurl, query, result_cache=cache)
+        self.assertEqual(result, payload)
+        self.assertGreater(cache.size, 0)
+
+        # modifying the result doesn't affect the cache
+        result['table']['cols'][0]['label'] = 'changed'
+        result['table']['rows'][0]['c'] = []
+
+        result = run_query(baseurl, query, result_cache=cache)
+        self.assertEqual(result, payload)
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual(cache.hits, 1)
+
+        # different credentials have their own entries
+        run_query(baseurl, query, Mock(), result_cache=cache)
+        self.assertEqual(m.call_count, 2)
+
+    @requests_mock.Mocker()
+    def test_run_query_compact(self, m):
+        payload = {
+            'status': 'ok',
+            'table': {
+                'cols': [{'id': 'A', 'label': 'country', 'type': 'string'}],
+                'rows': [{'c': [{'v': 'BR', 'f': 'BR'}]}, {'c': [None]}],
+            },
+        }
+        m.get('http://docs.google.com/&tq=SELECT%20%2A', json=payload)
+
+        cache = LRUCache(max_size=1000)
+        baseurl = 'http://docs.google.com/'
+        query = 'SELECT *'
+        result = run_query(baseurl, query, result_cache=cache, compact=True)
+        self.assertEqual(result['table']['rows'], [('BR',), (None,)])
+        self.assertEqual(
+            result['table']['cols'], payload['table']['cols'])
+
+        # compact and full payloads are cached separately
+        result = run_query(baseurl, query, result_cache=cache)
+        self.assertEqual(result, payload)
+        result = run_query(baseurl, query, result_cache=cache, compact=True)
+        self.assertEqual(result['table']['rows'], [('BR',), (None,)])
+        self.assertEqual(m.call_count, 2)
+
+    @requests_mock.Mocker()
+    def test_run_query_result_cache_max_age(self, m):
+        m.get(
+            'http://docs.google.com/&tq=SELECT%20%2A',
+            json={'status': 'ok', 'table': {'cols': [], 'rows': []}},
+        )
+
+        cache = LRUCache(max_size=1000, ttl=3600)
+        baseurl = 'http://docs.google.com/'
+        query = 'SELECT *'
+        run_query(baseurl, query, result_cache=cache, max_age=0)
+        run_query(baseurl, query, result_cache=cache, max_age=0)
+        self.assertEqual(m.call_count, 2)
+
+    @requests_mock.Mocker()
+    def test_run_query_result_cache_error(self, m):
+        m.get(
+            'http://docs.google.com/&tq=SELECT%20%2A',
+            json={'status': 'error', 'errors': []},
+        )
+
+        cache = LRUCache(max_size=1000)
+        baseurl = 'http://docs.google.com/'
+        query = 'SELECT *'
+        run_query(baseurl, query, result_cache=cache)
+        self.assertEqual(len(cache), 0)
+
+    def test_run_query_result_cache_revalidation(self):
+        cols = [{'id': 'A', 'label': 'country', 'type': 'string'}]
+        rows = [{'c': [{'v': 'BR'}]}] * 1000
+        cache = LRUCache(max_size=10 ** 6, ttl=0)
+        query = 'SELECT *'
+
+        with FakeGvizServer(cols, rows) as server:
+            payload = run_query(server.url, query, result_cache=cache)
+            self.assertEqual(payload['sig'], server.sig)
+            self.assertEqual(len(payload['table']['rows']), 1000)
+            full_size = server.bytes_sent
+
+            # expired, but the data didn't change
+            payload = run_query(server.url, query, result_cache=cache)
+            self.assertEqual(len(payload['table']['rows']), 1000)
+            self.assertEqual(
+                server.requests[-1]['tqx'], 'sig:{0}'.format(server.sig))
+            self.assertLess(server.bytes_sent - full_size, 200)
+            self.assertEqual(cache.revalidations, 1)
+
+            # data changed, so the new payload is sent
+            server.set_table(cols, rows[:10])
+            payload = run_query(server.url, query, result_cache=cache)
+            self.assertEqual(len(payload['table']['rows']), 10)
+            self.assertEqual(payload['sig'], server.sig)
+            self.assertEqual(cache.revalidations, 1)
+            self.assertEqual(len(server.requests), 3)
+
+    def test_run_query_csv_revalidation(self):
+        cols = [{'id': 'A', 'label': 'country', 'type': 'string'}]
+        rows = [{'c': [{'v': 'BR'}]}] * 1000
+        cache = LRUCache(max_size=10 ** 6, ttl=0)
+        query = 'SELECT *'
+
+        with FakeGvizServer(cols, rows) as server:
+            payload = run_query(
+                server.url, query, result_cache=cache, compact=True,
+                cols=cols)
+            self.assertEqual(server.requests[-1]['tqx'], 'out:csv')
+            self.assertEqual(len(payload['table']['rows']), 1000)
+
+            # CSV has no signature, so the expired results are fetched as
+            # JSON, which has one
+            payload = run_query(
+                server.url, query, result_cache=cache, compact=True,
+                cols=cols)
+            self.assertNotIn('tqx', server.requests[-1])
+            self.assertEqual(payload['table']['rows'], [('BR',)] * 1000)
+            size = server.bytes_sent
+
+            # and revalidated from then on
+            payload = run_query(
+                server.url, query, result_cache=cache, compact=True,
+                cols=cols)
+            self.assertEqual(
+                server.requests[-1]['tqx'], 'sig:{0}'.format(server.sig))
+            self.assertEqual(payload['table']['rows'], [('BR',)] * 1000)
+            self.assertLess(server.bytes_sent - size, 200)
+            self.assertEqual(cache.revalidations, 1)
+
+    @requests_mock.Mocker()
+    def test_run_query_csv(self, m):
+        m.get(
+            'http://docs.google.com/&tq=SELECT%20%2A&tqx=out:csv',
+            text='"country","cnt"\n"BR","1"\n"IN",""\n',
+            headers={'Content-Type': 'text/csv; charset=utf-8'},
+        )
+
+        cols = [
+            {'id': 'A', 'label': 'country', 'type': 'string'},
+            {'id': 'B', 'label': 'cnt', 'type': 'number'},
+        ]
+        baseurl = 'http://docs.google.com/'
+        query = 'SELECT *'
+        result = run_query(baseurl, query, cols=cols)
+        self.assertEqual(result['table']['cols'], cols)
+        self.assertEqual(result['table']['rows'], [('BR', 1.0), ('IN', None)])
+
+        result = run_query(baseurl, query, stream=True, cols=cols)
+        self.assertEqual(
+            list(result['table']['rows']), [('BR', 1.0), ('IN', None)])
+
+    @requests_mock.Mocker()
+    def test_run_query_csv_error(self, m):
+        m.get(
+            'http://docs.google.com/&tq=SELECT%20%2A&tqx=out:csv',
+            json={'status': 'error', 'errors': []},
+        )
+
+        cols = [{'id': 'A', 'label': 'country', 'type': 'string'}]
+        baseurl = 'http://docs.google.com/'
+        query = 'SELECT *'
+        result = run_query(baseurl, query, cols=cols)
+        self.assertEqual(result, {'status': 'error', 'errors': []})
+
+    @requests_mock.Mocker()
+    def test_run_query_csv_stale_columns(self, m):
+        m.get(
+            'http://docs.google.com/&tq=SELECT%20%2A&tqx=out:csv',
+            text='"country","cnt"\n"BR","1"\n',
+            headers={'Content-Type': 'text/csv'},
+        )
+
+        cols = [{'id': 'A', 'label': 'country', 'type': 'string'}]
+        baseurl = 'http://docs.google.com/'
+        column_map_cache.set(get_schema_key(baseurl), cols)
+        with self.assertRaises(exceptions.ProgrammingError):
+            run_query(baseurl, 'SELECT *', cols=cols)
+        self.assertIsNone(get_cached_schema(baseurl))
+
+    def test_get_csv_cols(self):
+        baseurl = 'http://docs.google.com/'
+        cols = [
+            {'id': 'A', 'label': 'country', 'type': 'string'},
+            {'id': 'B', 'label': 'cnt', 'type': 'number'},
+        ]
+        self.assertIsNone(get_csv_cols(baseurl, FULL_SHEET_QUERY))
+
+        column_map_cache.set(get_schema_key(baseurl), cols)
+        self.assertEqual(get_csv_cols(baseurl, FULL_SHEET_QUERY), cols)
+        self.assertIsNone(get_csv_cols(baseurl, 'SELECT A'))
+
+        cols.append({'id': 'C', 'label': 'dt', 'type': 'datetime'})
+        column_map_cache.set(get_schema_key(baseurl), cols)
+        self.assertIsNone(get_csv_cols(baseurl, FULL_SHEET_QUERY))
+
+    def test_execute_csv(self):
+        cols = [
+            {'id': 'A', 'label': 'country', 'type': 'string'},
+            {'id': 'B', 'label': 'cnt', 'type': 'number'},
+        ]
+        rows = [{'c': [{'v': 'BR'}, {'v': 1.0}]}, {'c': [{'v': 'IN'}, None]}]
+        session = requests.Session()
+
+        with FakeGvizServer(cols, rows) as server:
+            server.mount(session)
+            query = 'SELECT * FROM "http://docs.google.com/"'
+
+            # the schema is fetched when planning the query
+            result, description = execute(query, session=session)
+            self.assertEqual(result, [('BR', 1.0), ('IN', None)])
+            self.assertEqual(server.requests[0]['tq'], 'SELECT * LIMIT 0')
+            self.assertEqual(server.requests[1]['tqx'], 'out:csv')
+
+            # only whole sheets are read as CSV
+            execute('SELECT country FROM "http://docs.google.com/"',
+                    session=session)
+            self.assertNotIn('tqx', server.requests[-1])
+
+            # the SQLite fallback reads the whole sheet
+            conn = Connection()
+            server.mount(conn.session)
+            result = conn.execute(
+                'SELECT DISTINCT country, cnt FROM "http://docs.google.com/"'
+            ).fetchall()
+            self.assertEqual(result, [('BR', 1.0), ('IN', None)])
+            self.assertEqual(server.requests[-1]['tqx'], 'out:csv')
+
+    def test_execute_snapshots(self):
+        cols = [
+            {'id': 'A', 'label': 'country', 'type': 'string'},
+            {'id': 'B', 'label': 'cnt', 'type': 'number'},
+        ]
+        rows = [{'c': [{'v': 'BR'}, {'v': 1.0}]}, {'c': [{'v': 'IN'}, None]}]
+        session = requests.Session()
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        snapshots = SnapshotStore(path)
+
+        with FakeGvizServer(cols, rows) as server:
+            server.mount(session)
+            query = 'SELECT * FROM "http://docs.google.com/"'
+            result, _ = execute(query, session=session, snapshots=snapshots)
+            self.assertEqual(result, [('BR', 1.0), ('IN', None)])
+            self.assertEqual(len(server.requests), 2)
+            self.assertEqual(snapshots.writes, 1)
+
+            # after a restart the sheet and its columns are read from disk
+            column_map_cache.clear()
+            translation_cache.clear()
+            snapshots = SnapshotStore(path)
+            result, _ = execute(query, session=session, snapshots=snapshots)
+            self.assertEqual(result, [('BR', 1.0), ('IN', None)])
+            self.assertEqual(len(server.requests), 2)
+            self.assertEqual(snapshots.hits, 1)
+
+            # other queries still go to the API
+            execute(
+                'SELECT country FROM "http://docs.google.com/"',
+                session=session,
+                snapshots=snapshots,
+            )
+            self.assertEqual(len(server.requests), 3)
+            self.assertEqual(snapshots.writes, 0)
+
+            # warming always fetches the sheet, even with a fresh snapshot,
+            # and then revalidates the snapshot with its signature
+            url = 'http://docs.google.com/#gid=1'
+            for count in (5, 6, 7):
+                rows = warm_snapshot(snapshots, url, 1, session=session)
+                self.assertEqual(rows, 2)
+                self.assertEqual(len(server.requests), count)
+            self.assertEqual(
+                server.requests[-1]['tqx'], 'sig:{0}'.format(server.sig))
+            self.assertEqual(snapshots.writes, 2)
+            self.assertEqual(snapshots.revalidations, 1)
+
+    def test_execute_snapshots_revalidation(self):
+        cols = [
+            {'id': 'A', 'label': 'country', 'type': 'string'},
+            {'id': 'B', 'label': 'cnt', 'type': 'number'},
+        ]
+        rows = [{'c': [{'v': 'BR'}, {'v': 1.0}]}, {'c': [{'v': 'IN'}, None]}]
+        session = requests.Session()
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        snapshots = SnapshotStore(path, ttl=0)
+        query = 'SELECT * FROM "http://docs.google.com/"'
+
+        with FakeGvizServer(cols, rows) as server:
+            server.mount(session)
+            execute(query, session=session, snapshots=snapshots)
+            self.assertEqual(server.requests[-1]['tqx'], 'out:csv')
+
+            # the CSV snapshot has no signature, so the sheet is fetched
+            # again as JSON
+            result, _ = execute(query, session=session, snapshots=snapshots)
+            self.assertEqual(result, [('BR', 1.0), ('IN', None)])
+            self.assertNotIn('tqx', server.requests[-1])
+            self.assertEqual(snapshots.writes, 2)
+
+            # and then revalidated, keeping the snapshot
+            result, _ = execute(query, session=session, snapshots=snapshots)
+            self.assertEqual(result, [('BR', 1.0), ('IN', None)])
+            self.assertEqual(
+                server.requests[-1]['tqx'], 'sig:{0}'.format(server.sig))
+            self.assertEqual(snapshots.writes, 2)
+            self.assertEqual(snapshots.revalidations, 1)
+
+            # until the sheet changes
+            server.set_table(cols, rows[:1])
+            result, _ = execute(query, session=session, snapshots=snapshots)
+            self.assertEqual(result, [('BR', 1.0)])
+            self.assertEqual(snapshots.writes, 3)
+            self.assertEqual(snapshots.revalidations, 1)
+
+    def test_get_snapshot_key(self):
+        baseurl = 'http://docs.google.com/gviz/tq?gid=0'
+        self.assertEqual(
+            get_snapshot_key(baseurl, FULL_SHEET_QUERY),
+            (baseurl, FULL_SHEET_QUERY, None))
+        self.assertIsNone(get_snapshot_key(baseurl, 'SELECT A'))
+
+        # only service accounts are identified the same way in every process
+        credentials = Mock(service_account_email='user@example.com')
+        credentials._subject = None
+        self.assertEqual(
+            get_snapshot_key(baseurl, 'SELECT *', credentials),
+            (baseurl, 'SELECT *', ('user@example.com', None)))
+        self.assertIsNone(
+            get_snapshot_key(baseurl, 'SELECT *', Mock(spec=[])))
+
+        with self.assertRaises(exceptions.InterfaceError):
+            warm_snapshot(None, baseurl, credentials=Mock(spec=[]))
+
+    def test_run_query_coalesced(self):
+        cols = [{'id': 'A', 'label': 'country', 'type': 'string'}]
+        rows = [{'c': [{'v': 'BR'}]}, {'c': [{'v': 'IN'}]}]
+        results = [None] * 5
+
+        def run(i):
+            results[i] = run_query(server.url, 'SELECT *')
+
+        coalesced = inflight_requests.coalesced
+        with FakeGvizServer(cols, rows, latency=0.5) as server:
+            threads = [
+                threading.Thread(target=run, args=(i,)) for i in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(len(server.requests), 1)
+            self.assertEqual(inflight_requests.coalesced - coalesced, 4)
+
+            # every caller gets its own copy
+            self.assertEqual(len(set(id(result) for result in results)), 5)
+            self.assertTrue(all(result == results[0] for result in results))
+            results[0]['table']['cols'][0]['label'] = 'changed'
+            self.assertEqual(
+                results[1]['table']['cols'][0]['label'], 'country')
+
+            # schema probes are coalesced too
+            threads = [
+                threading.Thread(target=get_schema, args=(server.url,))
+                for i in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(server.requests), 2)
+
+    @patch('gsheetsdb.scheduler.time.sleep')
+    @requests_mock.Mocker()
+    def test_run_query_error(self, sleep, m):
         m.get(
             'http://docs.google.com/&tq=SELECT%20%2A',
             text='Error',
             status_code=500,
         )
 
+        # server errors are retried
         baseurl = 'http://docs.google.com/'
         query = 'SELECT *'
+        with self.assertRaises(exceptions.OperationalError):
+            run_query(baseurl, query)
+        self.assertEqual(m.call_count, 4)
+        self.assertEqual(sleep.call_count, 3)
+
+        # other errors are not
+        m.get(
+            'http://docs.google.com/&tq=SELECT%20%2A',
+            text='Error',
+            status_code=400,
+        )
         with self.assertRaises(exceptions.ProgrammingError):
             run_query(baseurl, query)
+        self.assertEqual(m.call_count, 5)
+
+    @patch('gsheetsdb.scheduler.time.sleep')
+    @requests_mock.Mocker()
+    def test_run_query_throttled(self, sleep, m):
+        m.get('http://docs.google.com/&tq=SELECT%20%2A', [
+            {'status_code': 429, 'headers': {'Retry-After': '2'}},
+            {'json': {'status': 'ok', 'table': {'cols': [], 'rows': []}}},
+        ])
+
+        baseurl = 'http://docs.google.com/'
+        query = 'SELECT *'
+        result = run_query(baseurl, query)
+        self.assertEqual(result['status'], 'ok')
+        sleep.assert_called_once_with(2.0)
 
     @requests_mock.Mocker()
     def test_run_query_leading(self, m):
@@ -192,7 +669,8 @@ class QueryTestSuite(unittest.TestCase):
             },
         }
         m.get(
-            'http://docs.google.com/gviz/tq?headers=1&gid=0&tq=SELECT%20%2A',
+            'http://docs.google.com/gviz/tq?headers=1&gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
             json=query_payload,
         )
 
@@ -249,7 +727,7 @@ class QueryTestSuite(unittest.TestCase):
         }
         m.get(
             'http://docs.google.com/gviz/tq?headers=1&gid=0&'
-            'tq=SELECT%20COUNT(B)%2C%20COUNT(A)',
+            'tq=SELECT%20COUNT(B)%2C%20COUNT(A)%20OPTIONS%20no_format',
             json=query_payload,
         )
 
@@ -301,7 +779,8 @@ class QueryTestSuite(unittest.TestCase):
             },
         }
         m.get(
-            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A',
+            'http://docs.google.com/gviz/tq?gid=0&'
+            'tq=SELECT%20%2A%20OPTIONS%20no_format',
             json=query_payload,
         )
 
@@ -351,7 +830,7 @@ class QueryTestSuite(unittest.TestCase):
         }
         m.get(
             'http://docs.google.com/gviz/tq?headers=1&gid=0&'
-            'tq=SELECT%20COUNT(B)%2C%20COUNT(A)',
+            'tq=SELECT%20COUNT(B)%2C%20COUNT(A)%20OPTIONS%20no_format',
             json=query_payload,
         )
 
@@ -359,3 +838,111 @@ class QueryTestSuite(unittest.TestCase):
         headers = 1
         with self.assertRaises(exceptions.ProgrammingError):
             execute(query, headers)
+
+    @requests_mock.Mocker()
+    def test_execute_no_column_invalidates_schema(self, m):
+        header_payload = {
+            'table': {
+                'cols': [
+                    {'id': 'A', 'label': 'country', 'type': 'string'},
+                    {'id': 'B', 'label': 'cnt', 'type': 'number'},
+                ],
+            },
+        }
+        m.get(
+            'http://docs.google.com/gviz/tq?headers=1&gid=0&'
+            'tq=SELECT%20%2A%20LIMIT%200',
+            json=header_payload,
+        )
+        query_payload = {
+            'status': 'error',
+            'errors': [{'detailed_message': 'Invalid query: NO_COLUMN: B'}],
+        }
+        m.get(
+            'http://docs.google.com/gviz/tq?headers=1&gid=0&'
+            'tq=SELECT%20B%20OPTIONS%20no_format',
+            json=query_payload,
+        )
+
+        baseurl = 'http://docs.google.com/gviz/tq?headers=1&gid=0'
+        query = 'SELECT cnt FROM "http://docs.google.com/"'
+        with self.assertRaises(exceptions.ProgrammingError):
+            execute(query, 1)
+        self.assertIsNone(get_cached_schema(baseurl))
+
+    @requests_mock.Mocker()
+    def test_get_plan_cached(self, m):
+        header_payload = {
+            'table': {
+                'cols': [
+                    {'id': 'A', 'label': 'country', 'type': 'string'},
+                    {'id': 'B', 'label': 'cnt', 'type': 'number'},
+                ],
+            },
+        }
+        m.get(
+            'http://docs.google.com/gviz/tq?headers=1&gid=0&'
+            'tq=SELECT%20%2A%20LIMIT%200',
+            json=header_payload,
+        )
+
+        query = 'SELECT COUNT(*) AS total FROM "http://docs.google.com/"'
+        with patch('gsheetsdb.parsing.parse_sql', wraps=parse) as parse_sql:
+            plan = get_plan(query, 1)
+            self.assertIs(get_plan(query + ' ', 1), plan)
+        self.assertEqual(parse_sql.call_count, 1)
+        self.assertEqual(translation_cache.hits, 1)
+        self.assertEqual(translation_cache.misses, 1)
+
+        self.assertEqual(
+            plan.baseurl, 'http://docs.google.com/gviz/tq?headers=1&gid=0')
+        self.assertEqual(
+            plan.translated_query,
+            'SELECT COUNT(B), COUNT(A) OPTIONS no_format',
+        )
+        self.assertEqual(plan.original_aliases, ('total',))
+        self.assertEqual(
+            plan.processed_aliases,
+            ('__CountStar__cnt', '__CountStar__country'),
+        )
+        self.assertEqual(len(plan.processors), 1)
+
+        # a different number of headers is a different query
+        m.get(
+            'http://docs.google.com/gviz/tq?headers=2&gid=0&'
+            'tq=SELECT%20%2A%20LIMIT%200',
+            json=header_payload,
+        )
+        self.assertIsNot(get_plan(query, 2), plan)
+
+        # and so is asking for formatted values
+        other = get_plan(query, 1, formatted_values=True)
+        self.assertEqual(other.translated_query, 'SELECT COUNT(B), COUNT(A)')
+
+    @requests_mock.Mocker()
+    def test_get_plan_schema_changed(self, m):
+        header_payload = {
+            'table': {
+                'cols': [
+                    {'id': 'A', 'label': 'country', 'type': 'string'},
+                    {'id': 'B', 'label': 'cnt', 'type': 'number'},
+                ],
+            },
+        }
+        m.get(
+            'http://docs.google.com/gviz/tq?gid=0&tq=SELECT%20%2A%20LIMIT%200',
+            json=header_payload,
+        )
+
+        query = 'SELECT cnt FROM "http://docs.google.com/"'
+        plan = get_plan(query)
+        self.assertEqual(plan.translated_query, 'SELECT B OPTIONS no_format')
+
+        # columns were moved around in the sheet
+        header_payload['table']['cols'].reverse()
+        header_payload['table']['cols'][0]['id'] = 'A'
+        header_payload['table']['cols'][1]['id'] = 'B'
+        column_map_cache.clear()
+
+        plan = get_plan(query)
+        self.assertEqual(plan.translated_query, 'SELECT A OPTIONS no_format')
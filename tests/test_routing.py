@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import unittest
+
+from moz_sql_parser import parse
+
+from .context import (
+    choose_engine,
+    find_unsupported,
+    get_shape,
+    GVIZ,
+    ParsedQuery,
+    record_failure,
+    remote_failures,
+    route_cache,
+    SQLITE,
+)
+
+
+class RoutingTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        remote_failures.clear()
+        route_cache.clear()
+
+    def test_find_unsupported(self):
+        queries = [
+            ('SELECT * FROM "a"', None),
+            ('SELECT country, SUM(cnt) FROM "a" GROUP BY country', None),
+            ('SELECT COUNT(*) FROM "a"', None),
+            ('SELECT DATETRUNC("year", dt) FROM "a"', None),
+            ('SELECT YEAR(dt) FROM "a" WHERE cnt > 1 ORDER BY 1', None),
+            ('SELECT country FROM "a" WHERE country LIKE \'B%\'', None),
+            ('SELECT 1', 'a query without FROM'),
+            ('SELECT * FROM "a" JOIN "b" ON a.x = b.x', 'JOIN'),
+            ('SELECT * FROM (SELECT * FROM "a")', 'subquery'),
+            (
+                'SELECT * FROM "a" WHERE cnt > (SELECT AVG(cnt) FROM "a")',
+                'subquery',
+            ),
+            (
+                'SELECT country, SUM(cnt) FROM "a" GROUP BY country '
+                'HAVING SUM(cnt) > 1',
+                'HAVING',
+            ),
+            ('SELECT DISTINCT country FROM "a"', 'DISTINCT'),
+            ('SELECT COUNT(DISTINCT country) FROM "a"', 'DISTINCT'),
+            (
+                'SELECT CASE WHEN cnt > 1 THEN 1 ELSE 0 END FROM "a"',
+                'CASE',
+            ),
+            ('SELECT * FROM "a" WHERE cnt IN (1, 2)', 'IN'),
+            ('SELECT * FROM "a" UNION SELECT * FROM "b"', 'UNION'),
+            ('SELECT LENGTH(country) FROM "a"', 'LENGTH'),
+            ('SELECT * FROM "a" WHERE LENGTH(country) > 1', 'LENGTH'),
+        ]
+        for sql, expected in queries:
+            self.assertEqual(find_unsupported(parse(sql)), expected, sql)
+
+    def test_get_shape(self):
+        self.assertEqual(
+            get_shape(parse('SELECT * FROM "a" WHERE x > 1 LIMIT 10')),
+            get_shape(parse('SELECT * FROM "a" WHERE x > 2 LIMIT 20')),
+        )
+        self.assertEqual(
+            get_shape(parse('SELECT * FROM "a" WHERE x = \'b\'')),
+            get_shape(parse('SELECT * FROM "a" WHERE x = \'c\'')),
+        )
+        self.assertNotEqual(
+            get_shape(parse('SELECT * FROM "a" WHERE x > 1')),
+            get_shape(parse('SELECT * FROM "a" WHERE y > 1')),
+        )
+
+    def test_choose_engine(self):
+        url = 'http://docs.google.com/'
+        self.assertEqual(
+            choose_engine('SELECT * FROM "{0}"'.format(url)), (GVIZ, None))
+        self.assertEqual(
+            choose_engine('SELECT DISTINCT x FROM "{0}"'.format(url)),
+            (SQLITE, 'DISTINCT is not supported by the API'))
+        self.assertEqual(
+            choose_engine('SELECTX * FROM "{0}"'.format(url)),
+            (SQLITE, 'query could not be parsed'))
+
+    def test_record_failure(self):
+        url = 'http://docs.google.com/'
+        sql = 'SELECT * FROM "{0}" WHERE x > {1}'
+        record_failure(ParsedQuery(sql.format(url, 1)))
+        self.assertEqual(
+            choose_engine(sql.format(url, 2)),
+            (SQLITE, 'a similar query failed recently in the API'))
+
+        # failures are per sheet and per headers
+        self.assertEqual(
+            choose_engine(sql.format(url + '#gid=1', 2)), (GVIZ, None))
+        self.assertEqual(
+            choose_engine(sql.format(url, 2), headers=1), (GVIZ, None))
+
+        # unparsable queries are not recorded
+        record_failure('SELECTX')
+        self.assertEqual(len(remote_failures), 1)
+
+    def test_routes_cached(self):
+        url = 'http://docs.google.com/'
+        sql = 'SELECT * FROM "{0}" WHERE x > 1'.format(url)
+        with patch('gsheetsdb.parsing.parse_sql', wraps=parse) as parse_sql:
+            for _ in range(3):
+                self.assertEqual(choose_engine(sql), (GVIZ, None))
+            record_failure(sql)
+            self.assertEqual(
+                choose_engine(sql),
+                (SQLITE, 'a similar query failed recently in the API'))
+            self.assertEqual(
+                choose_engine('SELECTX'),
+                (SQLITE, 'query could not be parsed'))
+            choose_engine('SELECTX')
+        self.assertEqual(parse_sql.call_count, 2)
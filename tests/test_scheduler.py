@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
+import threading
+import time
+import unittest
+
+from .context import (
+    BACKGROUND,
+    exceptions,
+    INTERACTIVE,
+    RequestScheduler,
+    TokenBucket,
+)
+
+
+def make_response(status_code, headers=None):
+    return Mock(status_code=status_code, headers=headers or {}, text='')
+
+
+class SchedulerTestSuite(unittest.TestCase):
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=50, burst=2)
+        start = time.time()
+        waits = [bucket.acquire() for _ in range(4)]
+        elapsed = time.time() - start
+
+        # the burst is free, the rest waits for new tokens
+        self.assertLess(max(waits[:2]), 0.01)
+        self.assertGreater(elapsed, 0.03)
+
+    def test_token_bucket_priority(self):
+        bucket = TokenBucket(rate=10, burst=1)
+        bucket.acquire()
+        order = []
+
+        def acquire(priority):
+            bucket.acquire(priority)
+            order.append(priority)
+
+        threads = []
+        for priority in (BACKGROUND, INTERACTIVE):
+            thread = threading.Thread(target=acquire, args=(priority,))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.02)
+        for thread in threads:
+            thread.join()
+
+        # the interactive request arrived later, but went first
+        self.assertEqual(order, [INTERACTIVE, BACKGROUND])
+
+    def test_token_bucket_poll(self):
+        bucket = TokenBucket(rate=50, burst=1)
+        first = bucket.enqueue()
+        second = bucket.enqueue()
+
+        # only the first ticket in the queue can take a token
+        self.assertAlmostEqual(bucket.poll(second), 0.02)
+        self.assertIsNone(bucket.poll(first))
+        self.assertGreater(bucket.poll(second), 0)
+
+        # cancelled tickets leave the queue
+        bucket.cancel(second)
+        bucket.cancel(second)
+        self.assertLess(bucket.acquire(), 0.05)
+
+    def test_rate_limit(self):
+        scheduler = RequestScheduler(rate=50, burst=1)
+        send = Mock(return_value=make_response(200))
+        for _ in range(3):
+            scheduler.request('user', send)
+        scheduler.request('other', send, BACKGROUND)
+
+        self.assertEqual(scheduler.requests, 4)
+        stats = scheduler.queue_stats[INTERACTIVE]
+        self.assertEqual(stats.count, 3)
+        self.assertGreater(stats.total, 0.02)
+        self.assertGreater(stats.max, 0.01)
+        self.assertAlmostEqual(stats.mean, stats.total / 3)
+
+        # each identity has its own bucket
+        self.assertLess(scheduler.queue_stats[BACKGROUND].max, 0.01)
+
+    def test_no_rate_limit(self):
+        scheduler = RequestScheduler()
+        self.assertIsNone(scheduler.get_bucket('user'))
+
+        scheduler.configure(rate=5)
+        self.assertEqual(scheduler.get_bucket('user').burst, 5)
+
+    @patch('gsheetsdb.scheduler.time.sleep')
+    def test_retry(self, sleep):
+        scheduler = RequestScheduler(backoff=1, max_backoff=3)
+        responses = [
+            make_response(429),
+            make_response(503),
+            make_response(500, {'Retry-After': '10'}),
+            make_response(200),
+        ]
+        send = Mock(side_effect=responses)
+        self.assertIs(scheduler.request('user', send), responses[-1])
+
+        # exponential backoff with jitter, capped by `max_backoff`
+        delays = [call[0][0] for call in sleep.call_args_list]
+        self.assertLessEqual(delays[0], 1)
+        self.assertLessEqual(delays[1], 2)
+        self.assertEqual(delays[2], 3)
+        for response in responses[:3]:
+            response.close.assert_called_once_with()
+
+        self.assertEqual(scheduler.requests, 4)
+        self.assertEqual(scheduler.retries, 3)
+        self.assertEqual(scheduler.throttled, 1)
+        self.assertEqual(scheduler.failures, 0)
+
+    @patch('gsheetsdb.scheduler.time.sleep')
+    def test_retry_failure(self, sleep):
+        scheduler = RequestScheduler(max_retries=2)
+        send = Mock(return_value=make_response(429))
+        with self.assertRaises(exceptions.OperationalError):
+            scheduler.request('user', send)
+
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual(scheduler.throttled, 3)
+        self.assertEqual(scheduler.failures, 1)
+
+        # other errors are returned
+        send = Mock(return_value=make_response(404))
+        self.assertEqual(scheduler.request('user', send).status_code, 404)
+        self.assertEqual(send.call_count, 1)
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .context import SnapshotStore
+
+cols = [
+    {'id': 'A', 'label': 'name', 'type': 'string'},
+    {'id': 'B', 'label': 'value', 'type': 'number'},
+    {'id': 'C', 'label': 'flag', 'type': 'boolean'},
+    {'id': 'D', 'label': 'day', 'type': 'date'},
+]
+rows = [
+    ('a', 1.0, True, 'Date(2018,0,1)'),
+    ('b', 2, False, None),
+    (None, None, None, None),
+]
+payload = {
+    'status': 'ok',
+    'sig': '123',
+    'table': {'cols': cols, 'rows': rows},
+}
+KEY = ['http://docs.google.com/gviz/tq?gid=0', 'SELECT *', None]
+
+
+class SnapshotStoreTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_get_set(self):
+        snapshots = SnapshotStore(self.path)
+        self.assertIsNone(snapshots.get(KEY))
+        self.assertIsNone(snapshots.get_cols(KEY))
+
+        snapshots.set(KEY, payload)
+        self.assertEqual(snapshots.get(KEY), payload)
+        self.assertEqual(snapshots.get_cols(KEY), cols)
+        self.assertEqual(snapshots.hits, 1)
+        self.assertEqual(snapshots.misses, 1)
+        self.assertEqual(snapshots.writes, 1)
+
+        # other processes see the same snapshots
+        self.assertEqual(SnapshotStore(self.path).get(KEY), payload)
+
+        # no temporary files are left behind
+        self.assertEqual(
+            [name.endswith('.sqlite') for name in os.listdir(self.path)],
+            [True])
+
+    def test_timeofday(self):
+        snapshots = SnapshotStore(self.path)
+        timeofday = {
+            'status': 'ok',
+            'table': {
+                'cols': [{'id': 'A', 'label': 'at', 'type': 'timeofday'}],
+                'rows': [([12, 30, 0, 0],), (None,)],
+            },
+        }
+        snapshots.set(KEY, timeofday)
+        self.assertEqual(snapshots.get(KEY), timeofday)
+
+    def test_replace(self):
+        snapshots = SnapshotStore(self.path)
+        snapshots.set(KEY, payload)
+        snapshots.set(KEY, {
+            'status': 'ok',
+            'table': {'cols': cols[:1], 'rows': [('c',)]},
+        })
+        self.assertEqual(
+            snapshots.get(KEY)['table'], {'cols': cols[:1], 'rows': [('c',)]})
+
+    @patch('gsheetsdb.snapshot.time.time')
+    def test_ttl(self, time):
+        time.return_value = 0
+        snapshots = SnapshotStore(self.path, ttl=60)
+        other = KEY[:2] + [['account', None]]
+        snapshots.set(KEY, payload)
+        snapshots.set(other, payload, ttl=10)
+
+        time.return_value = 30
+        self.assertIsNotNone(snapshots.get(KEY))
+        self.assertIsNone(snapshots.get(other))
+
+        time.return_value = 61
+        self.assertIsNone(snapshots.get(KEY))
+        self.assertIsNotNone(SnapshotStore(self.path).get(KEY))
+
+        self.assertEqual(snapshots.purge(expired_only=True), 2)
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_purge(self):
+        snapshots = SnapshotStore(self.path)
+        snapshots.set(KEY, payload)
+        self.assertEqual(snapshots.purge(expired_only=True), 0)
+        self.assertEqual(snapshots.purge(), 1)
+        self.assertIsNone(snapshots.get(KEY))
+
+    @unittest.skipIf(fcntl is None, 'sheets are locked only with fcntl')
+    def test_purge_leftovers(self):
+        snapshots = SnapshotStore(self.path)
+        with snapshots.lock(KEY):
+            snapshots.set(KEY, payload)
+
+        other = KEY[:2] + ['user@example.com']
+        orphan = os.path.join(self.path, 'orphan.tmp')
+        recent = os.path.join(self.path, 'recent.tmp')
+        for filename in (orphan, recent):
+            open(filename, 'w').close()
+        os.utime(orphan, (0, 0))
+
+        # locks held by other writers are kept
+        with snapshots.lock(other):
+            self.assertEqual(snapshots.purge(), 1)
+        self.assertEqual(
+            sorted(os.listdir(self.path)),
+            [os.path.basename(snapshots.get_filename(other)) + '.lock',
+             'recent.tmp'],
+        )
+
+        self.assertEqual(snapshots.purge(), 0)
+        self.assertEqual(os.listdir(self.path), ['recent.tmp'])
+
+    def test_revalidation(self):
+        snapshots = SnapshotStore(self.path, ttl=60)
+        self.assertIsNone(snapshots.get_stale(KEY))
+        snapshots.set(KEY, payload)
+
+        with patch('gsheetsdb.snapshot.time.time', return_value=1e10):
+            self.assertIsNone(snapshots.get(KEY))
+            self.assertEqual(snapshots.get_stale(KEY).value, payload)
+
+            snapshots.refresh(KEY)
+            self.assertEqual(snapshots.get(KEY), payload)
+            self.assertEqual(snapshots.revalidations, 1)
+
+    def test_invalid_snapshot(self):
+        snapshots = SnapshotStore(self.path)
+        with open(snapshots.get_filename(KEY), 'w') as f:
+            f.write('not a database')
+        self.assertIsNone(snapshots.get(KEY))
+        self.assertEqual(snapshots.purge(expired_only=True), 1)
+
+    def test_lock(self):
+        snapshots = SnapshotStore(self.path)
+        events = []
+
+        def fetch():
+            with snapshots.lock(KEY):
+                events.append('locked')
+                if snapshots.get(KEY) is None:
+                    snapshots.set(KEY, payload)
+                    events.append('fetched')
+
+        # the lock is held on a separate file, for each opener
+        with snapshots.lock(KEY):
+            thread = threading.Thread(target=fetch)
+            thread.start()
+            thread.join(0.1)
+            self.assertEqual(events, [])
+            snapshots.set(KEY, payload)
+        thread.join()
+        self.assertEqual(events, ['locked'])
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+import sqlite3
+import unittest
+
+from .context import ParsedQuery, SQLiteMirror
+
+
+def make_payload(n, label='name'):
+    return {
+        'status': 'ok',
+        'table': {
+            'cols': [
+                {'id': 'A', 'label': label, 'type': 'string'},
+                {'id': 'B', 'label': 'value', 'type': 'number'},
+            ],
+            'rows': [
+                {'c': [{'v': 'row {0}'.format(i)}, {'v': float(i)}]}
+                for i in range(n)
+            ],
+        },
+    }
+
+
+def load(mirror, query, table, payload, ttl=None, identity=None):
+    return mirror.execute_payloads(
+        query, {table: 'source'}, {table: payload}, {table: ttl}, identity)
+
+
+class SQLiteMirrorTestSuite(unittest.TestCase):
+
+    def test_execute(self):
+        mirror = SQLiteMirror()
+        query = ParsedQuery('SELECT SUM(value) FROM "a"')
+        self.assertIsNone(mirror.execute(query, {'a': 'source'}))
+        self.assertEqual(mirror.misses, 1)
+
+        results, description = load(mirror, query, 'a', make_payload(10))
+        self.assertEqual(results, [(45.0,)])
+        self.assertEqual(description[0][0], 'SUM(value)')
+        self.assertIn('a', mirror)
+
+        query = ParsedQuery('SELECT COUNT(*) FROM "a" WHERE value > 4')
+        results, _ = mirror.execute(query, {'a': 'source'})
+        self.assertEqual(results, [(5,)])
+        self.assertEqual(mirror.hits, 1)
+        self.assertEqual(mirror.loads, 1)
+        self.assertEqual(mirror.queries, 2)
+        self.assertGreater(mirror.load_time, 0)
+        self.assertGreater(mirror.query_time, 0)
+
+        # tables loaded from another source are reloaded
+        self.assertIsNone(mirror.execute(query, {'a': 'other'}))
+
+        mirror.close()
+        self.assertEqual(len(mirror), 0)
+
+    def test_tables(self):
+        mirror = SQLiteMirror(ttl=60)
+        query = ParsedQuery(
+            'SELECT COUNT(*) FROM "a" JOIN "b" ON a.name = b.name')
+        sources = {'a': 'source', 'b': 'source'}
+        load(mirror, ParsedQuery('SELECT * FROM "a"'), 'a', make_payload(10))
+
+        # every table used by the query is checked
+        self.assertEqual(mirror.missing(sources), ['b'])
+        self.assertIsNone(mirror.execute(query, sources))
+        self.assertIsNone(
+            mirror.execute_payloads(query, sources, {'a': make_payload(10)}))
+        results, _ = mirror.execute_payloads(
+            query, sources, {'b': make_payload(5)})
+        self.assertEqual(results, [(5,)])
+        self.assertEqual(mirror.missing(sources), [])
+        self.assertEqual(
+            mirror.missing({'a': 'source', 'b': 'other'}), ['b'])
+
+    def test_identities(self):
+        mirror = SQLiteMirror()
+        query = ParsedQuery('SELECT COUNT(*) FROM "a"')
+        load(mirror, query, 'a', make_payload(10), identity='alice')
+
+        # tables loaded with other credentials are never used
+        self.assertEqual(mirror.missing({'a': 'source'}, 'bob'), ['a'])
+        self.assertIsNone(mirror.execute(query, {'a': 'source'}, 'bob'))
+        load(mirror, query, 'a', make_payload(5), identity='bob')
+        results, _ = mirror.execute(query, {'a': 'source'}, 'alice')
+        self.assertEqual(results, [(10,)])
+        results, _ = mirror.execute(query, {'a': 'source'}, 'bob')
+        self.assertEqual(results, [(5,)])
+        self.assertEqual(len(mirror), 2)
+
+        mirror.invalidate('a')
+        self.assertEqual(len(mirror), 0)
+        self.assertIsNone(mirror.execute(query, {'a': 'source'}, 'alice'))
+
+    def test_reload(self):
+        mirror = SQLiteMirror()
+        query = ParsedQuery('SELECT COUNT(*) FROM "a"')
+        load(mirror, query, 'a', make_payload(1000))
+        size = mirror.size
+
+        results, description = load(
+            mirror,
+            ParsedQuery('SELECT * FROM "a"'),
+            'a',
+            make_payload(2, 'other'),
+        )
+        self.assertEqual(len(results), 2)
+        self.assertEqual(description[0][0], 'other')
+        self.assertLess(mirror.size, size)
+
+    @patch('gsheetsdb.sqlite.time.time')
+    def test_ttl(self, time):
+        time.return_value = 0
+        mirror = SQLiteMirror(ttl=60)
+        a = ParsedQuery('SELECT COUNT(*) FROM "a"')
+        b = ParsedQuery('SELECT COUNT(*) FROM "b"')
+        load(mirror, a, 'a', make_payload(10))
+        load(mirror, b, 'b', make_payload(10), ttl=1)
+
+        time.return_value = 30
+        self.assertIsNotNone(mirror.execute(a, {'a': 'source'}))
+        self.assertIsNone(mirror.execute(b, {'b': 'source'}))
+
+        time.return_value = 61
+        self.assertIsNone(mirror.execute(a, {'a': 'source'}))
+
+    def test_max_size(self):
+        mirror = SQLiteMirror()
+        query = ParsedQuery('SELECT COUNT(*) FROM "a"')
+        load(mirror, query, 'a', make_payload(1000))
+        size = mirror.size
+        self.assertGreater(size, 0)
+
+        # tables are evicted in LRU order
+        mirror = SQLiteMirror(max_size=int(size * 2.5))
+        for table in ('a', 'b'):
+            query = ParsedQuery('SELECT COUNT(*) FROM "{0}"'.format(table))
+            load(mirror, query, table, make_payload(1000))
+        mirror.execute(ParsedQuery('SELECT * FROM "a"'), {'a': 'source'})
+        results, _ = load(
+            mirror,
+            ParsedQuery('SELECT COUNT(*) FROM "c"'),
+            'c',
+            make_payload(1000),
+        )
+        self.assertEqual(results, [(1000,)])
+        self.assertIn('a', mirror)
+        self.assertNotIn('b', mirror)
+        self.assertIn('c', mirror)
+        self.assertEqual(mirror.evictions, 1)
+        self.assertLessEqual(mirror.size, mirror.max_size)
+
+        # a table bigger than the budget is used once
+        mirror = SQLiteMirror(max_size=size // 2)
+        results, _ = load(
+            mirror,
+            ParsedQuery('SELECT COUNT(*) FROM "a"'),
+            'a',
+            make_payload(1000),
+        )
+        self.assertEqual(results, [(1000,)])
+        self.assertEqual(len(mirror), 0)
+
+    def test_read_only(self):
+        mirror = SQLiteMirror()
+        query = ParsedQuery('SELECT COUNT(*) FROM "a"')
+        load(mirror, query, 'a', make_payload(10))
+
+        with self.assertRaises(sqlite3.OperationalError):
+            mirror.execute(ParsedQuery('DELETE FROM "a"'), {'a': 'source'})
+        results, _ = mirror.execute(query, {'a': 'source'})
+        self.assertEqual(results, [(10,)])
+
+    def test_invalidate(self):
+        mirror = SQLiteMirror()
+        mirror.invalidate()
+        query = ParsedQuery('SELECT COUNT(*) FROM "a"')
+        load(mirror, query, 'a', make_payload(10))
+        load(mirror, query, 'b', make_payload(10))
+
+        mirror.invalidate('a')
+        self.assertNotIn('a', mirror)
+        self.assertIn('b', mirror)
+        mirror.invalidate()
+        self.assertEqual(len(mirror), 0)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from .context import call, exceptions, run_steps
+
+
+def steps():
+    total = yield call('add', 1, 2)
+    totals = yield [call('add', total, 1), call('add', total, b=2)]
+    try:
+        yield call('fail', 'error')
+    except exceptions.ProgrammingError as e:
+        return totals, str(e)
+
+
+def add(a, b):
+    return a + b
+
+
+def fail(message):
+    raise exceptions.ProgrammingError(message)
+
+
+class StepsTestSuite(unittest.TestCase):
+
+    def test_run(self):
+        result = run_steps(steps(), {'add': add, 'fail': fail})
+        self.assertEqual(result, ([4, 5], 'error'))
+
+    def test_run_error(self):
+        def fail(message):
+            raise exceptions.NotSupportedError(message)
+
+        with self.assertRaises(exceptions.NotSupportedError):
+            run_steps(steps(), {'add': add, 'fail': fail})
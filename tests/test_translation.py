@@ -167,6 +167,13 @@ class TranslationTestSuite(unittest.TestCase):
         result = translate(parse(sql), {'country': 'A', 'cnt': 'B'})
         self.assertEqual(result, expected)
 
+    def test_no_format(self):
+        sql = 'SELECT country FROM "http://docs.google.com" LIMIT 10'
+        expected = 'SELECT A LIMIT 10 OPTIONS no_format'
+        result = translate(
+            parse(sql), {'country': 'A'}, formatted_values=False)
+        self.assertEqual(result, expected)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+import unittest
+
+from google.auth.transport.requests import AuthorizedSession
+from requests import Session
+
+from .context import get_session
+
+
+class TransportTestSuite(unittest.TestCase):
+
+    def test_get_session(self):
+        session = get_session()
+        self.assertIsInstance(session, Session)
+        self.assertNotIsInstance(session, AuthorizedSession)
+
+        adapter = session.get_adapter('https://docs.google.com/')
+        self.assertIs(adapter, session.get_adapter('http://docs.google.com/'))
+        self.assertEqual(adapter._pool_connections, 4)
+        self.assertEqual(adapter._pool_maxsize, 10)
+        self.assertFalse(adapter._pool_block)
+
+    def test_get_session_pool_size(self):
+        session = get_session(
+            pool_connections=1, pool_maxsize=20, pool_block=True)
+        adapter = session.get_adapter('https://docs.google.com/')
+        self.assertEqual(adapter._pool_connections, 1)
+        self.assertEqual(adapter._pool_maxsize, 20)
+        self.assertTrue(adapter._pool_block)
+
+    def test_get_session_with_credentials(self):
+        credentials = Mock()
+        session = get_session(credentials)
+        self.assertIsInstance(session, AuthorizedSession)
+        self.assertIs(session.credentials, credentials)
@@ -2,7 +2,14 @@
 
 import unittest
 
-from .context import extract_url, get_url
+from .context import (
+    exceptions,
+    extract_url,
+    extract_urls,
+    get_max_age,
+    get_url,
+    normalize_url,
+)
 
 
 class UrlTestSuite(unittest.TestCase):
@@ -13,6 +20,36 @@ class UrlTestSuite(unittest.TestCase):
         expected = 'http://docs.google.com'
         self.assertEqual(result, expected)
 
+    def test_extract_url_tables(self):
+        queries = [
+            'SELECT * FROM "http://docs.google.com" AS t',
+            'SELECT x FROM (SELECT x FROM "http://docs.google.com") AS t',
+            (
+                'SELECT a.x FROM "http://docs.google.com" AS a '
+                'JOIN "http://docs.google.com" AS b ON a.x = b.y'
+            ),
+            (
+                'SELECT x FROM "http://docs.google.com" '
+                'UNION SELECT y FROM "http://docs.google.com"'
+            ),
+        ]
+        for query in queries:
+            self.assertEqual(extract_url(query), 'http://docs.google.com')
+
+    def test_extract_urls(self):
+        query = (
+            'SELECT a.x FROM "http://docs.google.com/a" AS a '
+            'JOIN "http://docs.google.com/b" AS b ON a.x = b.y '
+            'WHERE a.x IN (SELECT x FROM "http://docs.google.com/a")'
+        )
+        self.assertEqual(
+            extract_urls(query),
+            ['http://docs.google.com/a', 'http://docs.google.com/b'])
+        self.assertEqual(
+            extract_urls('SELECTX * FROM "http://docs.google.com"'),
+            ['http://docs.google.com'])
+        self.assertEqual(extract_urls('SELECT 1'), [])
+
     def test_get_url(self):
         url = 'http://docs.google.com'
         result = get_url(url, headers=1, gid=10, sheet=None)
@@ -53,3 +90,29 @@ class UrlTestSuite(unittest.TestCase):
         result = extract_url(query)
         expected = 'http://docs.google.com'
         self.assertEqual(result, expected)
+
+    def test_get_max_age(self):
+        url = 'http://docs.google.com/edit?max_age=300&headers=1#gid=0'
+        self.assertEqual(get_max_age(url), 300)
+        self.assertIsNone(get_max_age('http://docs.google.com/edit#gid=0'))
+
+        # not passed to the API
+        self.assertEqual(
+            get_url(url), 'http://docs.google.com/gviz/tq?headers=1&gid=0')
+
+    def test_get_max_age_invalid(self):
+        for value in ('soon', '-1', 'nan'):
+            url = 'http://docs.google.com/edit?max_age={0}#gid=0'.format(
+                value)
+            with self.assertRaises(exceptions.ProgrammingError):
+                get_max_age(url)
+
+    def test_normalize_url(self):
+        url = 'HTTP://Docs.Google.com/gviz/tq?gid=0&headers=1#fragment'
+        result = normalize_url(url)
+        expected = 'http://docs.google.com/gviz/tq?gid=0&headers=1'
+        self.assertEqual(result, expected)
+        self.assertEqual(
+            normalize_url('http://docs.google.com/gviz/tq?headers=1&gid=0'),
+            expected,
+        )